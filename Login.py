@@ -1,27 +1,15 @@
 import streamlit as st
 from streamlit_supabase_auth import login_form, logout_button
-from supabase import create_client, Client
+from supabase import Client
 import os
-import requests
+from backend_clients import get_supabase_client, get_http_session
+from user_profile import get_user_profile_via_edge_function, remember_profile
 
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
-SUPABASE_EDGE_FUNCTION_GET_PROFILE_URL = os.environ.get("SUPABASE_EDGE_FUNCTION_GET_PROFILE_URL")
 SUPABASE_EDGE_FUNCTION_CREATE_PROFILE_URL = os.environ.get("SUPABASE_EDGE_FUNCTION_CREATE_PROFILE_URL")
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-# ✅ Helper to make a client WITH user JWT
-def get_user_supabase_client(access_token: str) -> Client:
-    return create_client(
-        SUPABASE_URL,
-        SUPABASE_KEY,
-        options={
-            "headers": {
-                "Authorization": f"Bearer {access_token}"
-            }
-        }
-    )
+supabase: Client = get_supabase_client()
 
 # ✅ NEW: Call Edge Function to create profile if missing
 def create_profile_if_missing(user_id: str, access_token: str):
@@ -30,7 +18,7 @@ def create_profile_if_missing(user_id: str, access_token: str):
         "Authorization": f"Bearer {access_token}"
         }
     try:
-        response = requests.post(
+        response = get_http_session().post(
             SUPABASE_EDGE_FUNCTION_CREATE_PROFILE_URL,
             headers=headers,
             json={"user_id": user_id}
@@ -43,21 +31,6 @@ def create_profile_if_missing(user_id: str, access_token: str):
         st.error(f"Error calling create-profile-if-missing Edge Function: {e}")
         return False
 
-# ✅ Fetch the profile via Edge Function (uses JWT, respects RLS)
-def get_user_profile_via_edge_function(access_token: str):
-    headers = {
-        "Authorization": f"Bearer {access_token}"
-    }
-    try:
-        response = requests.get(SUPABASE_EDGE_FUNCTION_GET_PROFILE_URL, headers=headers)
-        if response.status_code != 200:
-            st.error(f"Failed to fetch profile: {response.status_code} — {response.text}")
-            return None
-        return response.json()
-    except Exception as e:
-        st.error(f"Error calling get-profile Edge Function: {e}")
-        return None
-
 def run_login_page():
     st.title("Welcome — Please Log In or Sign Up")
 
@@ -100,6 +73,8 @@ def run_login_page():
             st.error("Could not load your profile. Please contact support.")
             st.stop()
 
+        # ✅ Seed the session's profile cache so the app doesn't fetch it again right away
+        remember_profile(user_id, profile)
         st.session_state['user'] = user
         st.session_state['access_token'] = access_token
         st.session_state['is_authenticated'] = True
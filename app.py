@@ -1,723 +1,312 @@
-
-import re
-import unicodedata
+import time
 import streamlit as st
-import pdfplumber
-from pylatex import Document, NoEscape
-from pylatex.package import Package
-from pylatex.utils import escape_latex
-from openai import OpenAI
-import json
-import plotly.express as px
-import pandas as pd
-from supabase import create_client, Client
 import stripe
 from menu import menu_with_redirect
-import tempfile
+from jobs import submit_job, get_job, retry_job, ensure_workers, claim_charge, release_charge
+from pipeline import STUDY_JOB_KIND, run_study_job, build_trend_figures
+from user_profile import get_profile, update_cached_profile
+from backend_clients import get_supabase_client, get_http_session
 import os
-import requests
 from streamlit_supabase_auth import login_form
 
 # ─── Supabase & Stripe Initialization ──────────────────────────────
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-SUPABASE_EDGE_FUNCTION_GET_PROFILE_URL = os.environ.get("SUPABASE_EDGE_FUNCTION_GET_PROFILE_URL")
+supabase = get_supabase_client()
 SUPABASE_EDGE_FUNCTION_SET_CUSTOMER_STRIPE_ID_URL = os.environ.get("SUPABASE_EDGE_FUNCTION_SET_CUSTOMER_STRIPE_ID_URL")
 SUPABASE_EDGE_FUNCTION_CREDIT_DEDUCTION_URL = os.environ.get("SUPABASE_EDGE_FUNCTION_CREDIT_DEDUCTION_URL")
 
 stripe.api_key = os.environ.get("STRIPE_SECRET_KEY")
 
-# ─── OpenAI Setup ──────────────────────────────────────────────
-
-client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-OPENAI_MODEL = "gpt-4.1-mini"
-
-def call_openai_system_user(system: str, user: str, max_tokens: int = 512, temp: float = 0.0) -> str:
-    resp = client.chat.completions.create(
-        model=OPENAI_MODEL,
-        messages=[
-            {"role": "system", "content": system},
-            {"role": "user", "content": user},
-        ],
-        max_tokens=max_tokens,
-        temperature=temp,
-    )
-    return resp.choices[0].message.content.strip()
-
-# ─── PDF Extraction ────────────────────────────────────────────
-
-def clean_text(text: str) -> str:
-    text = unicodedata.normalize("NFC", text)
-    text = "".join(ch for ch in text if unicodedata.category(ch)[0] != "C")
-    return re.sub(r"\s+", " ", text).strip()
-
-def extract_sections_from_pdf(file) -> list[tuple[str, str]]:
-    sections = []
-    excluded = {"contents", "reading list", "readinglist"}
-
-    with pdfplumber.open(file) as pdf:
-        cur_title, cur_body = None, []
-        for page in pdf.pages:
-            txt = page.extract_text() or ""
-            lines = txt.splitlines()
-
-            words = page.extract_words(extra_attrs=("size", "fontname", "top", "x0"))
-            groups = {}
-            for w in words:
-                groups.setdefault(round(w["top"], 1), []).append(w)
-            headings = sorted(
-                (y, clean_text(" ".join(w["text"] for w in grp)))
-                for y, grp in groups.items()
-                if (sum(float(w["size"]) for w in grp)/len(grp) >= 13 or any("Bold" in w["fontname"] for w in grp))
-            )
-
-            hi = 0
-            for i, line in enumerate(lines):
-                ln = clean_text(line)
-                if not ln:
-                    continue
-                if hi < len(headings) and abs(headings[hi][0] - i*12) < 12:
-                    if cur_title and cur_title.lower().replace(" ","") not in excluded:
-                        sections.append((cur_title, clean_text(" ".join(cur_body))))
-                    cur_title, cur_body = headings[hi][1], []
-                    hi += 1
-                else:
-                    cur_body.append(ln)
-
-        if cur_title and cur_title.lower().replace(" ","") not in excluded:
-            sections.append((cur_title, clean_text(" ".join(cur_body))))
-
-    if not sections:
-        # fallback: split by big line breaks
-        with pdfplumber.open(file) as pdf:
-            full = ""
-            for p in pdf.pages:
-                full += (p.extract_text() or "") + "\n"
-        paragraphs = re.split(r"\n{2,}", full)
-        sections = [(f"Part {i+1}", clean_text(p)) for i, p in enumerate(paragraphs) if p.strip()]
-
-    return sections
-
-
-# ─── Multi Past Papers Raw Text Intake ──────────────────────────────
-
-def extract_raw_text_from_pdfs_simple(paper_files) -> list[dict]:
-    """
-    Takes a list of uploaded past paper PDFs.
-    Returns a list of dicts:
-    [
-        {"filename": ..., "raw_text": ...},
-        ...
-    ]
-    """
-    results = []
-    for file in paper_files:
-        raw_text = ""
-        with pdfplumber.open(file) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text() or ""
-                raw_text += "\n" + page_text
-        results.append({
-            "filename": file.name,
-            "raw_text": clean_text(raw_text),
-        })
-    return results
-
-# ─── Chunking & Summarization ─────────────────────────────────
-
-def chunk_text(text: str, max_tokens: int = 2000, overlap: int = 200) -> list[str]:
-    words = text.split()
-    chunks = []
-    for i in range(0, len(words), max_tokens - overlap):
-        chunks.append(" ".join(words[i:i+max_tokens]))
-        if i + max_tokens >= len(words):
-            break
-    return chunks
-
-SYSTEM_PROMPT = """
-You are an expert university-level tutor.
-Your job is to transform each section of raw lecture notes into clear, concise, exam-focused study notes.
-Strictly use only the material provided — do not invent.
-Ignore any sections titled 'Reading List', 'Bibliography' or 'References' - do not summarise these, skip them entirely.
-
-Each output section must contain:
-1. An Overview paragraph (max 5 sentences).
-2. 5–10 Key Concepts as a bullet list.
-3. Step-by-Step Derivations (if any).
-4. Important Equations list — each must have a short descriptive label.
-5. Quick Tips: practical points for students.
-
-Formatting:
-- Use standard LaTeX sectioning commands: \\section, \\subsection.
-- Use only ASCII text outside math.
-- Do not use any custom macros.
-- Use only amsmath/amsfonts.
-- All math must be correctly wrapped: inline $...$ or \\(...\\), block \\begin{equation*}...\\end{equation*} or \\begin{align}...\\end{align}.
-- The output must compile directly in XeLaTeX.
-- Do not output HTML or Markdown.
-"""
-
-def summarize_section(title: str, body: str) -> str:
-    chunks = chunk_text(body, max_tokens=4000, overlap=200)
-    summary_parts = []
-    for chunk in chunks:
-        user_prompt = f"Section Title: {title}\n\n{chunk}"
-        out = call_openai_system_user(SYSTEM_PROMPT, user_prompt, max_tokens=4000)
-        summary_parts.append(out)
-    final = "\n\n".join(summary_parts)
-    return final
-
-# ─── Past Paper Analysis ───────────────────────────────────────
-
-PAST_PAPER_PROMPT = """
-You are a meticulous academic examiner and curriculum analyst.
-
-Your task:
-Given the full raw text of a university-level past exam paper, extract and compile all useful meta information and question-level breakdowns.
-
-**Your output must be a valid, compact JSON with the following structure:**
-
-{
-  "meta": {
-    "institution": "string, if found",
-    "faculty_or_school": "string, if found",
-    "course_code": "string, if found",
-    "subject": "string, if found",
-    "year": "string, if found",
-    "term": "string, if found",
-    "duration": "string, if found",
-    "total_marks": "string, if found",
-    "instructions_summary": "short summary of any instructions",
-    "notes": "any other meta information found"
-  },
-  "structure": {
-    "sections": [
-      {
-        "section_title": "string",
-        "instructions": "string, if any",
-        "questions": [
-          {
-            "question_number": "1",
-            "question_text": "full text of question",
-            "topic_or_area": "your best guess",
-            "question_type": "essay, short answer, calculation, derivation, proof, MCQ, etc.",
-            "marks": "string, if specified"
-          }
-        ]
-      }
-    ]
-  }
-}
-
-**Guidelines:**
-- Be precise. Do not hallucinate details. Only extract what is clearly present.
-- For instructions, interpret any details about how many questions must be answered.
-- If there are no explicit sections, use a single default section called "Main Paper".
-- Always wrap your output in valid JSON, no Markdown.
-- Use sensible defaults: if a field is missing, output `null` or an empty string.
-
-Input starts below:
-"""
-
-
-PAST_PAPER_TRENDS_SUPERPROMPT = """
-You are an expert exam strategist and curriculum analyst.
-
-Your task:
-Given multiple JSON blocks, each containing the full structured breakdown of a past exam paper,
-do a deep analysis to extract patterns, trends, and practical study advice.
-
-**Your output must be a single valid JSON with this structure:**
-
-{
-  "overall_trends": {
-    "common_topics": ["topic1", "topic2", "..."],
-    "common_question_types": ["essay", "calculation", "proof", "..."],
-    "recurring_sections_or_parts": ["Section A compulsory", "Short Questions Part B", "..."],
-    "typical_instructions": ["Answer any 3 of 5 questions", "..."],
-    "average_questions_per_paper": int,
-    "average_marks_per_question": "estimate if possible"
-  },
-  "topic_frequencies": [
-    {"topic": "Topic Name", "frequency": int}
-  ],
-  "frequencies_by_year": [
-    {
-      "year": "2022",
-      "topics": [
-        {"topic": "Topic Name", "frequency": int}
-      ],
-      "question_types": [
-        {"type": "calculation", "frequency": int}
-      ]
-    },
-    {
-      "year": "2023",
-      "topics": [...],
-      "question_types": [...]
-    }
-  ],
-  "useful_tips": [
-    "Practical tip 1",
-    "Practical tip 2",
-    "Practical tip 3"
-  ],
-  "possible_exam_strategy": [
-    "How to approach time management",
-    "How to choose questions",
-    "Any other useful advice"
-  ]
-}
-
-**Guidelines:**
-- Group trends by year using the `meta.year` field in each input JSON.
-- If any paper has a missing year, note it in the results under `"year": "unknown"`.
-- Identify overlapping topics — group by synonyms if needed.
-- Spot repeated question styles or formats.
-- Note any repeated phrases in instructions.
-- Give practical, concise tips for how a student should prepare.
-- Wrap your output in valid JSON only. No Markdown.
-- If something is unclear, make a reasonable estimate and say so.
-
-Input JSONS below:
-"""
-
-# ─── PDF Creation ─────────────────────────────────────────────
-
-def create_pdf_with_pylatex(latex_body: str, subject_title: str = "") -> str:
-    doc = Document("study_materials", documentclass="article")
-    doc.packages.append(Package('amsmath'))
-    doc.packages.append(Package('amsfonts'))
-    doc.packages.append(Package('graphicx'))
-    if subject_title.strip():
-        doc.preamble.append(NoEscape(f"\\title{{{subject_title.strip()}}}"))
-
-    doc.append(NoEscape("\\maketitle"))
-    doc.append(NoEscape(latex_body.strip()))
-    
-    tex_path = "study_material.tex"
-    with open(tex_path, 'w', encoding='utf-8') as f:
-        f.write(doc.dumps())
-        
-    #st.text_area("Generated .tex source", open(tex_path).read(), height=400)
-
-    filename = "study_materials"
-    doc.generate_pdf(filename, clean_tex=False)
-    return filename + ".pdf"
-
-# ─── Streamlit App ────────────────────────────────────────────
+# ─── Background Jobs ──────────────────────────────────────────
 
+# Seconds between page refreshes while a job is running
+JOB_POLL_SECONDS = 2
 
-# ─── Authentication & Profile Fetch ──────────────────────────────
+# ─── Rendering ────────────────────────────────────────────────
 
-if "access_token" not in st.session_state:
-    session = login_form(
-        url = SUPABASE_URL,
-        apiKey = SUPABASE_KEY,
-        providers = ["google"]
-        )
-    if session:
-        st.session_state["user"] = session["user"]
-        st.session_state["access_token"] = session["access_token"]
-    else:
-        st.stop()
-
-menu_with_redirect()
-
-# 1) Extract user info from session_state
-user = st.session_state["user"]
-user_id = user["id"]
-user_email = user["email"]
-access_token = st.session_state["access_token"]
-
-st.title("Sprag - Study Assistant")
-
-# 2) Fetch the profile via Edge Function (uses JWT, respects RLS)
-def get_user_profile_via_edge_function(access_token: str):
+def deduct_credits_via_edge_function(access_token: str, cost: float):
     headers = {
-        "Authorization": f"Bearer {access_token}"
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/json"
     }
+    body = {"cost": cost}
+
     try:
-        response = requests.get(SUPABASE_EDGE_FUNCTION_GET_PROFILE_URL, headers=headers)
+        response = get_http_session().post(
+            SUPABASE_EDGE_FUNCTION_CREDIT_DEDUCTION_URL,
+            headers=headers,
+            json=body
+        )
         if response.status_code != 200:
-            st.error(f"Failed to fetch profile: {response.status_code} — {response.text}")
+            st.error(f"Error deducting credits: {response.status_code} — {response.text}")
             return None
         return response.json()
     except Exception as e:
-        st.error(f"Error calling get-profile Edge Function: {e}")
+        st.error(f"Error calling deduct-credits Edge Function: {e}")
         return None
 
-profile = get_user_profile_via_edge_function(access_token)
-if not profile:
-    st.error("⚠️ Could not load your profile; please contact support.")
-    st.stop()
+def render_trends(trends: dict):
+    st.header("📊 Past Paper Trends Visualized")
+    figures = build_trend_figures(trends)
 
-credits = profile["credits"]
+    st.plotly_chart(figures["topics"])
+    st.plotly_chart(figures["qtypes"])
 
-# 4) If they have no Stripe customer ID yet, create one and store it
-if not profile.get("stripe_customer_id"):
-    # 1) Create the Stripe Customer
-    cust = stripe.Customer.create(email=user_email)
-    stripe_customer_id = cust["id"]
+    if figures["yearly_topics"] is not None:
+        st.subheader("📈 Yearly Topic Frequencies")
+        st.plotly_chart(figures["yearly_topics"])
+    else:
+        st.write("No yearly topic frequency data available.")
 
-    # 2) Call your Edge Function to store it (JWT + user_id + new ID)
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "user_id": user_id,
-        "stripe_customer_id": stripe_customer_id
-    }
+    if figures["yearly_qtypes"] is not None:
+        st.subheader("📊 Yearly Question Type Frequencies")
+        st.plotly_chart(figures["yearly_qtypes"])
+    else:
+        st.write("No yearly question type frequency data available.")
+
+    # Typical Instructions
+    st.subheader("Typical Instructions")
+    for instr in trends["overall_trends"]["typical_instructions"]:
+        st.write(f"- {instr}")
+
+    # Key stats
+    st.subheader("Key Stats")
+    st.write(f"**Average questions per paper:** {trends['overall_trends']['average_questions_per_paper']}")
+    st.write(f"**Average marks per question:** {trends['overall_trends']['average_marks_per_question']}")
+
+    # Useful Tips
+    st.subheader("✅ Useful Revision Tips")
+    for tip in trends["useful_tips"]:
+        st.write(f"• {tip}")
+
+    # Exam Strategy
+    st.subheader("📝 Suggested Exam Strategy")
+    for strat in trends["possible_exam_strategy"]:
+        st.write(f"• {strat}")
+
+def render_partial_results(partial: dict):
+    sections = partial.get("sections", [])
+    if sections:
+        st.info(f"Found {len(sections)} sections.")
+        for title, text in sections:
+            if text:
+                with st.expander(title, expanded=True):
+                    st.code(text, language="latex")
+    for paper in partial.get("papers", []):
+        with st.expander(f"Analyzed paper: {paper['filename']}"):
+            st.json(paper["analysis"], expanded=False)
 
-    response = requests.post(
-        SUPABASE_EDGE_FUNCTION_SET_CUSTOMER_STRIPE_ID_URL,
-        headers=headers,
-        json=payload
-    )
 
-    if response.status_code != 200:
-        st.error(f"Failed to set Stripe customer ID: {response.status_code} — {response.text}")
-        st.stop()
+# ─── Streamlit App ────────────────────────────────────────────
+#
+# Everything with side effects runs in main(). Streamlit executes this script
+# as __main__; a multiprocessing child (e.g. a PDF extraction worker) imports
+# it as __mp_main__ and must not start job workers or touch the session.
 
-    # 3) Update local copy too, so you can keep using `profile`
-    profile["stripe_customer_id"] = stripe_customer_id
+def main():
+    ensure_workers({STUDY_JOB_KIND: run_study_job})
 
+    # ─── Authentication & Profile Fetch ──────────────────────────────
+
+    if "access_token" not in st.session_state:
+        session = login_form(
+            url = SUPABASE_URL,
+            apiKey = SUPABASE_KEY,
+            providers = ["google"]
+            )
+        if session:
+            st.session_state["user"] = session["user"]
+            st.session_state["access_token"] = session["access_token"]
+        else:
+            st.stop()
 
-# Actual App Logic
-subject = st.text_input("Subject (e.g., Atomic Physics)")
-lec_file = st.file_uploader("Lecture Notes PDF (typed only) (MAX 20MB)", type=["pdf"])
-paper_file = st.file_uploader("Past Paper PDFs (MAX 20MB)", type=["pdf"], accept_multiple_files=True)
+    menu_with_redirect()
 
-max_file_size_mb = 20
+    # 1) Extract user info from session_state
+    user = st.session_state["user"]
+    user_id = user["id"]
+    user_email = user["email"]
+    access_token = st.session_state["access_token"]
 
-if lec_file is not None:
-    lec_file.seek(0, 2)
-    size_mb = lec_file.tell() / (1024 * 1024)
-    lec_file.seek(0)
-    if size_mb > max_file_size_mb:
-        st.error(f"Lecture Notes PDF is too large ({size_mb:.2f} MB). Max size allowed: {max_file_size_mb} MB ")
+    st.title("Sprag - Study Assistant")
+
+    # 2) Fetch the profile via Edge Function (cached, see user_profile)
+    profile = get_profile(access_token, user_id)
+    if not profile:
+        st.error("⚠️ Could not load your profile; please contact support.")
         st.stop()
-        
-if paper_file:
-    for f in paper_file:
-        f.seek(0, 2)
-        size_mb = f.tell() / (1024 * 1024)
-        f.seek(0)
-        if size_mb > max_file_size_mb:
-            st.error(f"Past Paper '{f.name}' is too large ({size_mb:.2f} MB). Max  size allowed: {max_file_size_mb} MB ")
+
+    credits = profile["credits"]
+
+    # 4) If they have no Stripe customer ID yet, create one and store it
+    if not profile.get("stripe_customer_id"):
+        # 1) Create the Stripe Customer
+        cust = stripe.Customer.create(email=user_email)
+        stripe_customer_id = cust["id"]
+
+        # 2) Call your Edge Function to store it (JWT + user_id + new ID)
+        headers = {
+            "Authorization": f"Bearer {access_token}",
+            "Content-Type": "application/json"
+        }
+        payload = {
+            "user_id": user_id,
+            "stripe_customer_id": stripe_customer_id
+        }
+
+        response = get_http_session().post(
+            SUPABASE_EDGE_FUNCTION_SET_CUSTOMER_STRIPE_ID_URL,
+            headers=headers,
+            json=payload
+        )
+
+        if response.status_code != 200:
+            st.error(f"Failed to set Stripe customer ID: {response.status_code} — {response.text}")
             st.stop()
 
-      
-st.write("### What do you want to generate?")
+        # 3) Update the cached copy too, so you can keep using `profile`
+        update_cached_profile(user_id, stripe_customer_id=stripe_customer_id)
 
-run_summarization = st.checkbox("📚 Lecture Notes Summary", value=bool(lec_file))
-run_pastpaper = st.checkbox("📄 Past Paper Analysis", value=bool(paper_file))
 
-if st.button("Run Selected Tasks"):
-    # 1) Compute cost
-    cost = 0.5 * int(run_summarization) + 0.5 * int(run_pastpaper)
-    if cost == 0:
-        st.error("Please select at least one task.")
-        st.stop()
-    if credits < cost:
-        st.error(f"Not enough credits ({credits} left; need {cost}).")
-        st.stop()
+    # Actual App Logic
+    subject = st.text_input("Subject (e.g., Atomic Physics)")
+    lec_file = st.file_uploader("Lecture Notes PDF (typed only) (MAX 20MB)", type=["pdf"])
+    paper_file = st.file_uploader("Past Paper PDFs (MAX 20MB)", type=["pdf"], accept_multiple_files=True)
 
-    if not any([run_summarization, run_pastpaper]):
-        st.error("Please select at least one task to run.")
-        st.stop()
+    max_file_size_mb = 20
 
-    # Validate required files
-    if run_summarization and not lec_file:
-        st.error("Lecture notes PDF is required for summarization.")
-        st.stop()
-    if run_pastpaper and not paper_file:
-        st.error("Past paper PDF is required for analysis.")
-        st.stop()
+    if lec_file is not None:
+        lec_file.seek(0, 2)
+        size_mb = lec_file.tell() / (1024 * 1024)
+        lec_file.seek(0)
+        if size_mb > max_file_size_mb:
+            st.error(f"Lecture Notes PDF is too large ({size_mb:.2f} MB). Max size allowed: {max_file_size_mb} MB ")
+            st.stop()
 
-    st.info(f"Running selected tasks. Usage: {cost} credits")
-
-    summarized = []
-    sections = []
-
-    if run_summarization:
-        with st.spinner("Extracting and summarizing lecture notes…"):
-            sections = extract_sections_from_pdf(lec_file)
-            st.info(f"Found {len(sections)} sections.")
-            prog = st.progress(0)
-            for i, (t, b) in enumerate(sections, 1):
-                summarized.append((t, summarize_section(t, b)))
-                prog.progress(i / len(sections))
-
-    pastpaper_jsons = []
-    pastpaper_trends = ""
-
-    if run_pastpaper:
-        with st.spinner("Extracting and analyzing past papers…"):
-            raw_texts = extract_raw_text_from_pdfs_simple(paper_file)
-
-            for i, paper in enumerate(raw_texts, 1):
-                st.info(f"Analyzing paper: {paper['filename']}")
-                single_paper_json = call_openai_system_user(
-                    "You are a meticulous academic examiner.",
-                    PAST_PAPER_PROMPT + "\n\n" + paper["raw_text"],
-                    max_tokens=4000
-                )
-                pastpaper_jsons.append(single_paper_json)
-
-            # Combine all paper JSONs for trend analysis
-            combined_jsons = "\n\n".join(pastpaper_jsons)
-
-            pastpaper_trends = call_openai_system_user(
-                "You are an expert exam strategist.",
-                PAST_PAPER_TRENDS_SUPERPROMPT + "\n\n" + combined_jsons,
-                max_tokens=4000
-            )
+    if paper_file:
+        for f in paper_file:
+            f.seek(0, 2)
+            size_mb = f.tell() / (1024 * 1024)
+            f.seek(0)
+            if size_mb > max_file_size_mb:
+                st.error(f"Past Paper '{f.name}' is too large ({size_mb:.2f} MB). Max  size allowed: {max_file_size_mb} MB ")
+                st.stop()
 
-            # Debug: show raw JSON if you want
-            #st.json({"Past Paper Trends": pastpaper_trends})
 
-            # ✅ NEW: Display nicely
+    st.write("### What do you want to generate?")
 
-            # Extract the inner JSON string and parse it
-            trends = json.loads(pastpaper_trends)
+    run_summarization = st.checkbox("📚 Lecture Notes Summary", value=bool(lec_file))
+    run_pastpaper = st.checkbox("📄 Past Paper Analysis", value=bool(paper_file))
 
-            # ---------- Display -------------
-            st.header("📊 Past Paper Trends Visualized")
+    # Reattach to this user's job; the query param survives browser refreshes
+    job_id = st.session_state.get("job_id") or st.query_params.get("job")
+    job = get_job(job_id) if job_id else None
+    if job and job["user_id"] != user_id:
+        job = None
+    job_active = bool(job) and job["status"] in ("queued", "running")
 
-            # Topics Bar Chart
-            topic_freqs = trends["topic_frequencies"]
-            topics = [item["topic"] for item in topic_freqs]
-            freqs = [item["frequency"] for item in topic_freqs]
+    if st.button("Run Selected Tasks", disabled=job_active):
+        # 1) Compute cost
+        cost = 0.5 * int(run_summarization) + 0.5 * int(run_pastpaper)
+        if cost == 0:
+            st.error("Please select at least one task.")
+            st.stop()
+        if credits < cost:
+            st.error(f"Not enough credits ({credits} left; need {cost}).")
+            st.stop()
 
-            fig_topics = px.bar(
-                x=topics, y=freqs,
-                labels={'x': 'Topic', 'y': 'Frequency'},
-                title="Frequency of Topics",
-                color_discrete_sequence=px.colors.qualitative.Plotly
-            )
-            st.plotly_chart(fig_topics)
-
-            # Question Types Pie
-            qtypes = trends["overall_trends"]["common_question_types"]
-            qtype_freqs = [1] * len(qtypes)  # dummy counts, adjust if you have real ones
-            fig_qtypes = px.pie(
-                names=qtypes,
-                values=qtype_freqs,
-                title="Common Question Types",
-                color_discrete_sequence=px.colors.qualitative.Plotly
-            )
-            st.plotly_chart(fig_qtypes)
-            
-            # Prepare and visualize yearly topic frequencies
-            yearly_topics = []
-            for year_entry in trends.get("frequencies_by_year", []):
-                year = year_entry.get("year", "")
-                for topic_info in year_entry.get("topics", []):
-                    yearly_topics.append({
-                        "Year": year,
-                        "Topic": topic_info.get("topic", ""),
-                        "Frequency": topic_info.get("frequency", 0)
-                    })
-
-            df_yearly_topics = pd.DataFrame(yearly_topics)
-
-            if not df_yearly_topics.empty:
-                st.subheader("📈 Yearly Topic Frequencies")
-                fig_yearly_topics = px.bar(
-                    df_yearly_topics,
-                    x="Year",
-                    y="Frequency",
-                    color="Topic",
-                    barmode="group",
-                    title="Frequency of Topics by Year",
-                    labels={"Frequency": "Frequency", "Year": "Year", "Topic": "Topic"},
-                    width = 900,
-                    height = 500,
-                    color_discrete_sequence=px.colors.qualitative.Plotly
-                )
-                
-                fig_yearly_topics.update_layout(
-                    legend=dict(
-                        y = -0.2,
-                        yanchor = "top",
-                        x = 0.5,
-                        xanchor = "center" 
-                    )
-                )
-
-                st.plotly_chart(fig_yearly_topics)
-            else:
-                st.write("No yearly topic frequency data available.")
-
-            # Prepare and visualize yearly question type frequencies
-            yearly_qtypes = []
-            for year_entry in trends.get("frequencies_by_year", []):
-                year = year_entry.get("year", "")
-                for qtype_info in year_entry.get("question_types", []):
-                    yearly_qtypes.append({
-                        "Year": year,
-                        "Question Type": qtype_info.get("type", ""),
-                        "Frequency": qtype_info.get("frequency", 0)
-                    })
-
-            df_yearly_qtypes = pd.DataFrame(yearly_qtypes)
-
-            if not df_yearly_qtypes.empty:
-                st.subheader("📊 Yearly Question Type Frequencies")
-                fig_yearly_qtypes = px.bar(
-                    df_yearly_qtypes,
-                    x="Year",
-                    y="Frequency",
-                    color="Question Type",
-                    barmode="group",
-                    title="Frequency of Question Types by Year",
-                    labels={"Frequency": "Frequency", "Year": "Year", "Question Type": "Question Type"},
-                    width = 900,
-                    height = 500,
-                    color_discrete_sequence=px.colors.qualitative.Plotly
-                )
-                st.plotly_chart(fig_yearly_qtypes)
+        if not any([run_summarization, run_pastpaper]):
+            st.error("Please select at least one task to run.")
+            st.stop()
+
+        # Validate required files
+        if run_summarization and not lec_file:
+            st.error("Lecture notes PDF is required for summarization.")
+            st.stop()
+        if run_pastpaper and not paper_file:
+            st.error("Past paper PDF is required for analysis.")
+            st.stop()
+
+        # Uploads are saved with the job, so the worker does not depend on this session
+        files = {}
+        params = {
+            "subject": subject,
+            "cost": cost,
+            "run_summarization": run_summarization,
+            "run_pastpaper": run_pastpaper,
+            "lecture": None,
+            "papers": [],
+        }
+        if run_summarization:
+            params["lecture"] = "lecture.pdf"
+            files["lecture.pdf"] = lec_file.getvalue()
+        if run_pastpaper:
+            for i, f in enumerate(paper_file):
+                params["papers"].append([f.name, f"paper_{i}.pdf"])
+                files[f"paper_{i}.pdf"] = f.getvalue()
+
+        job_id = submit_job(STUDY_JOB_KIND, user_id, params, files)
+        st.session_state["job_id"] = job_id
+        st.query_params["job"] = job_id
+        job = get_job(job_id)
+        job_active = True
+
+    if job:
+        cost = job["params"]["cost"]
+        if job["status"] in ("queued", "running"):
+            st.info(f"Running selected tasks. Usage: {cost} credits")
+            st.caption(f"Job {job['id']} — you can refresh or leave this page and come back.")
+            st.write(f"**{job['stage'] or 'Waiting for a worker'}…**")
+            st.progress(min(max(job["progress"], 0.0), 1.0))
+            render_partial_results(job["partial"])
+
+        elif job["status"] == "failed":
+            st.error(f"❌ {job['error']}")
+            if st.button("Retry failed step"):
+                retry_job(job["id"])
+                st.rerun()
+
+        else:
+            result = job["result"]
+            if result["trends"]:
+                render_trends(result["trends"])
+
+            # ─── THEN RENDER OUTPUT ────────────────────────────────
+            # Read once per session; the job directory is deleted after JOB_RETENTION_SECONDS
+            pdf_key = f"pdf_bytes:{job['id']}"
+            if pdf_key not in st.session_state and result["pdf_path"] and os.path.exists(result["pdf_path"]):
+                with open(result["pdf_path"], "rb") as f:
+                    st.session_state[pdf_key] = f.read()
+            pdf_bytes = st.session_state.get(pdf_key)
+            if pdf_bytes:
+                st.success("✅ Your study materials are ready!")
+                if result.get("pdf_compile_seconds") is not None:
+                    st.caption(f"PDF compiled in {result['pdf_compile_seconds']:.1f}s")
+                st.download_button("Download PDF", pdf_bytes, file_name="study_materials.pdf", mime="application/pdf")
+
+                # ─── NOW DEDUCT CREDITS ─────────────────────────────
+                if claim_charge(job["id"]):
+                    deduct_result = deduct_credits_via_edge_function(access_token, cost)
+                    if deduct_result is None:
+                        release_charge(job["id"])
+                        st.stop()
+                    new_credits = deduct_result["credits"]
+                    update_cached_profile(user_id, credits=new_credits)
+                    st.sidebar.metric("Remaining Credits", new_credits)
+
+            elif result["pdf_path"]:
+                st.warning("⚠️ This PDF has expired; please run the tasks again.")
             else:
-                st.write("No yearly question type frequency data available.")
-
-            
-            saved_figures = []
-            
-            tmp_dir = tempfile.mkdtemp(dir="/tmp")
-            
-            fig_topics_path = os.path.join(tmp_dir, "fig_topics.pdf")
-            fig_topics.write_image(fig_topics_path)
-            saved_figures.append(fig_topics_path)
-
-            fig_qtypes_path = os.path.join(tmp_dir, "fig_qtypes.pdf")            
-            fig_qtypes.write_image(fig_qtypes_path)
-            saved_figures.append(fig_qtypes_path)
-
-            fig_yearly_topics_path = os.path.join(tmp_dir, "df_yearly_topics.pdf")            
-            fig_yearly_topics.write_image(fig_yearly_topics_path)
-            saved_figures.append(fig_yearly_topics_path)
-
-            fig_yearly_qtypes_path = os.path.join(tmp_dir, "df_yearly_qtypes.pdf")
-            fig_yearly_qtypes.write_image(fig_yearly_qtypes_path)
-            saved_figures.append(fig_yearly_qtypes_path)
-
-
-            # Typical Instructions
-            st.subheader("Typical Instructions")
-            for instr in trends["overall_trends"]["typical_instructions"]:
-                st.write(f"- {instr}")
-
-            # Key stats
-            st.subheader("Key Stats")
-            st.write(f"**Average questions per paper:** {trends['overall_trends']['average_questions_per_paper']}")
-            st.write(f"**Average marks per question:** {trends['overall_trends']['average_marks_per_question']}")
-
-            # Useful Tips
-            st.subheader("✅ Useful Revision Tips")
-            for tip in trends["useful_tips"]:
-                st.write(f"• {tip}")
-
-            # Exam Strategy
-            st.subheader("📝 Suggested Exam Strategy")
-            for strat in trends["possible_exam_strategy"]:
-                st.write(f"• {strat}")
-
-
-    # Combine output
-    latex_body = ""
-
-    if summarized:
-        latex_body += "\n\n".join(content for _, content in summarized)
-
-    if pastpaper_trends:
-        latex_body += r"""\newpage
-    \begin{center}
-    \Huge \textbf{Past Paper Trends and Analysis}
-    \end{center}   
-        """
-        #Key Stats
-        latex_body += r"\section*{Key Stats}" + "\n"
-        latex_body += r"\begin{itemize}" + "\n"
-        latex_body += f"\\item  Average questions per paper: {trends['overall_trends']['average_questions_per_paper']}" + "\n"
-        latex_body += f"\\item  Average marks per question: {trends['overall_trends']['average_marks_per_question']}" + "\n"
-        latex_body += r"\end{itemize}" + "\n\n"
-        
-        #Instructions
-        latex_body += r"\section*{Typical Instructions}" + "\n"
-        latex_body += r"\begin{itemize}" + "\n"
-        for instr in trends["overall_trends"]["typical_instructions"]:
-            safe_instr = escape_latex(instr)
-            latex_body += f"\\item {safe_instr}" + "\n"
-        latex_body += r"\end{itemize}" + "\n\n"
-        
-        #Tips
-        latex_body += r"\section*{Useful Tips}" + "\n"
-        latex_body += r"\begin{itemize}" + "\n"
-        for tip in trends["useful_tips"]:
-            safe_tip = escape_latex(tip)
-            latex_body += f"\\item {safe_tip}" + "\n"
-        latex_body += r"\end{itemize}" + "\n\n"
-        
-        #Exam Strategy
-        latex_body += r"\section*{Suggested Exam Strategy}" + "\n"
-        latex_body += r"\begin{itemize}" + "\n"
-        for strat in trends["possible_exam_strategy"]:
-            safe_strat = escape_latex(strat)
-            latex_body += f"\\item {safe_strat}" + "\n"
-        latex_body += r"\end{itemize}" + "\n\n"
-        
-        #Images
-        for fig in saved_figures:
-            safe_fig = escape_latex(fig)
-            latex_body += r"""\begin{center}
-        \includegraphics[width=1.2\textwidth]{%s}
-        \end{center}
-            """ % safe_fig
-            
-    # ─── THEN RENDER OUTPUT ────────────────────────────────
-    if latex_body:
-        with st.spinner("Rendering PDF…"):
-            try:
-                pdf_fn = create_pdf_with_pylatex(latex_body, subject)
-            except Exception as e:
-                st.error(f"❌ PDF generation failed: {e}")
-                st.stop()
+                st.warning("⚠️ No output generated — please check your selections.")
 
-        st.success("✅ Your study materials are ready!")
-        with open(pdf_fn, "rb") as f:
-            st.download_button("Download PDF", f, file_name=pdf_fn)
-
-        # ─── NOW DEDUCT CREDITS ─────────────────────────────
-        def deduct_credits_via_edge_function(access_token: str, cost: float):
-            headers = {
-                "Authorization": f"Bearer {access_token}",
-                "Content-Type": "application/json"
-            }
-            body = {"cost": cost}
-
-            try:
-                response = requests.post(
-                    SUPABASE_EDGE_FUNCTION_CREDIT_DEDUCTION_URL,
-                    headers=headers,
-                    json=body
-                )
-                if response.status_code != 200:
-                    st.error(f"Error deducting credits: {response.status_code} — {response.text}")
-                    st.stop()
-                return response.json()
-            except Exception as e:
-                st.error(f"Error calling deduct-credits Edge Function: {e}")
-                st.stop()
+    st.markdown("---")
+    st.info("Disclaimer: This tool provides AI-generated study support. Always cross check with your materials and syllabus.")
 
-        deduct_result = deduct_credits_via_edge_function(access_token, cost)
-        new_credits = deduct_result["credits"]
-        st.sidebar.metric("Remaining Credits", new_credits)
+    if job_active:
+        time.sleep(JOB_POLL_SECONDS)
+        st.rerun()
 
-    else:
-        st.warning("⚠️ No output generated — please check your selections.")
 
-st.markdown("---")
-st.info("Disclaimer: This tool provides AI-generated study support. Always cross check with your materials and syllabus.")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import os
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from supabase import create_client, Client
+from supabase.lib.client_options import ClientOptions
+from singletons import process_singleton
+
+# ─── Backend Connections ──────────────────────────────────────
+#
+# One place for the connections the app makes to Supabase and its Edge
+# Functions. HTTP calls go through a process-wide requests.Session, so
+# keep-alive connections are reused across reruns, sessions and threads
+# instead of paying a TCP+TLS handshake per call, and every call has a
+# timeout. The Supabase client is built once and shared.
+
+SUPABASE_URL = os.environ.get("SUPABASE_URL")
+SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
+
+HTTP_CONNECT_TIMEOUT_SECONDS = float(os.environ.get("HTTP_CONNECT_TIMEOUT_SECONDS", "5"))
+HTTP_READ_TIMEOUT_SECONDS = float(os.environ.get("HTTP_READ_TIMEOUT_SECONDS", "30"))
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "32"))
+# Connection failures are retried; nothing has reached the server, so this is safe for POSTs too
+HTTP_CONNECT_RETRIES = 2
+
+
+class TimeoutSession(requests.Session):
+    """A Session whose requests default to the configured timeouts."""
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", (HTTP_CONNECT_TIMEOUT_SECONDS, HTTP_READ_TIMEOUT_SECONDS))
+        return super().request(method, url, **kwargs)
+
+
+@process_singleton
+def get_http_session() -> requests.Session:
+    """Pooled session for Edge Function and other HTTP calls."""
+    session = TimeoutSession()
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_POOL_SIZE,
+        pool_maxsize=HTTP_POOL_SIZE,
+        max_retries=Retry(total=HTTP_CONNECT_RETRIES, connect=HTTP_CONNECT_RETRIES, read=0, status=0, backoff_factor=0.2),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def client_options() -> ClientOptions:
+    # Server-side clients never sign in themselves, so no session or refresh timer
+    return ClientOptions(
+        auto_refresh_token=False,
+        persist_session=False,
+        postgrest_client_timeout=HTTP_READ_TIMEOUT_SECONDS,
+        storage_client_timeout=HTTP_READ_TIMEOUT_SECONDS,
+    )
+
+
+@process_singleton
+def get_supabase_client() -> Client:
+    """Client with the project key."""
+    return create_client(SUPABASE_URL, SUPABASE_KEY, options=client_options())
+
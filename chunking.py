@@ -0,0 +1,176 @@
+import os
+import re
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:  # fall back to a character-based estimate
+    tiktoken = None
+
+# ─── Token-Aware Chunking ──────────────────────────────────────
+#
+# Chunks are packed to a budget measured in the model's own tokens, breaking at
+# line or sentence boundaries and only inside a sentence that is over budget on
+# its own. Display math ($$...$$, \[...\], equation-like environments) is kept
+# whole, and a chunk that has reached CHUNK_MIN_FILL of its budget ends at the
+# last paragraph or display-math boundary rather than mid-paragraph. Without
+# tiktoken installed, token counts are estimated at ~4 chars each.
+
+# Input tokens per summarization request, per model
+CHUNK_TOKEN_BUDGETS = {
+    "gpt-4.1-mini": 6000,
+}
+DEFAULT_CHUNK_TOKEN_BUDGET = int(os.environ.get("CHUNK_TOKEN_BUDGET", "4000"))
+CHUNK_TOKEN_OVERLAP = int(os.environ.get("CHUNK_TOKEN_OVERLAP", "200"))
+# A chunk is cut back to its last block boundary only if that keeps this much of the budget
+CHUNK_MIN_FILL = 0.5
+
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+DISPLAY_MATH = re.compile(
+    r"\$\$.*?\$\$|\\\[.*?\\\]"
+    r"|\\begin\{(equation|align|gather|multline|eqnarray|displaymath)(\*?)\}.*?\\end\{\1\2\}",
+    re.DOTALL,
+)
+LINE_BREAK = re.compile(r"\s*\n\s*")
+SENTENCE_BREAK = re.compile(r"(?<=[.!?:;])\s+(?=[A-Z0-9\\$(\[])")
+
+
+def chunk_token_budget(model: str) -> int:
+    return CHUNK_TOKEN_BUDGETS.get(model, DEFAULT_CHUNK_TOKEN_BUDGET)
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        # encodings are downloaded on first use; estimate when that is not possible
+        return None
+
+
+def count_tokens(text: str, model: str) -> int:
+    enc = get_encoding(model)
+    if enc is None:
+        return (len(text) + 3) // 4
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def split_blocks(text: str) -> list[str]:
+    """Paragraphs, with each display math span as a block of its own."""
+    blocks, pos = [], 0
+    for m in DISPLAY_MATH.finditer(text):
+        blocks.extend(PARAGRAPH_BREAK.split(text[pos:m.start()]))
+        blocks.append(m.group())
+        pos = m.end()
+    blocks.extend(PARAGRAPH_BREAK.split(text[pos:]))
+    return [b.strip() for b in blocks if b.strip()]
+
+
+def split_units(text: str) -> list[tuple[str, bool]]:
+    """(unit, ends a block) for lines, then sentences, of each block; display math is one unit."""
+    units = []
+    for block in split_blocks(text):
+        if DISPLAY_MATH.fullmatch(block):
+            parts = [block]
+        else:
+            parts = [u for line in LINE_BREAK.split(block) for u in SENTENCE_BREAK.split(line.strip()) if u.strip()]
+        units.extend((u, i == len(parts) - 1) for i, u in enumerate(parts))
+    return units
+
+
+def split_oversized(unit: str, budget: int, model: str) -> list[str]:
+    """
+    Word-level split for a single unit that is larger than the budget on its own.
+    Words are counted one at a time, so a piece's count is a close running estimate.
+    """
+    pieces, cur, cur_tokens = [], [], 0
+    for word in unit.split():
+        n = count_tokens(" " + word, model)
+        if cur and cur_tokens + n > budget:
+            pieces.append(" ".join(cur))
+            cur, cur_tokens = [], 0
+        cur.append(word)
+        cur_tokens += n
+    if cur:
+        pieces.append(" ".join(cur))
+    return pieces
+
+
+def join_units(units: list[tuple[str, int, bool]]) -> str:
+    return "".join(u + ("\n\n" if block_end else " ") for u, _, block_end in units).strip()
+
+
+def break_point(cur: list[tuple[str, int, bool]], budget: int) -> int:
+    """How many units of a full chunk to emit: up to its last block boundary, if that is full enough."""
+    total = sum(n for _, n, _ in cur)
+    for k in range(len(cur), 0, -1):
+        if total < CHUNK_MIN_FILL * budget:
+            break
+        if cur[k - 1][2]:
+            return k
+        total -= cur[k - 1][1]
+    return len(cur)
+
+
+def chunk_text(text: str, model: str, max_tokens: int = None, overlap: int = CHUNK_TOKEN_OVERLAP) -> list[str]:
+    """
+    Packs text into chunks of at most `max_tokens` model tokens (default: the
+    model's budget), repeating up to `overlap` tokens of trailing units at the
+    start of the next chunk.
+    """
+    budget = max_tokens or chunk_token_budget(model)
+    units = []  # (text, tokens, ends a block)
+    for unit, block_end in split_units(text):
+        n = count_tokens(unit, model)
+        if n > budget:
+            # only here is a paragraph or display math split mid-way
+            pieces = split_oversized(unit, budget, model)
+            units.extend((p, count_tokens(p, model), block_end and i == len(pieces) - 1) for i, p in enumerate(pieces))
+        else:
+            units.append((unit, n, block_end))
+
+    chunks, cur, cur_tokens = [], [], 0
+    for unit in units:
+        n = unit[1]
+        while cur and cur_tokens + n > budget:
+            k = break_point(cur, budget)
+            chunks.append(join_units(cur[:k]))
+            rest = cur[k:]
+            rest_tokens = sum(pn for _, pn, _ in rest)
+            # carry trailing units forward as overlap, without overrunning the budget
+            carried, carried_tokens = [], 0
+            for prev in reversed(cur[:k]):
+                if carried_tokens + prev[1] > min(overlap, budget - rest_tokens - n):
+                    break
+                carried.insert(0, prev)
+                carried_tokens += prev[1]
+            cur, cur_tokens = carried + rest, carried_tokens + rest_tokens
+        cur.append(unit)
+        cur_tokens += n
+    if cur:
+        chunks.append(join_units(cur))
+    return chunks
+
+
+def pack_sections(sections: list[tuple[str, str]], model: str, max_tokens: int = None) -> list[list[int]]:
+    """
+    Groups adjacent sections whose combined size fits one request.
+    Returns lists of section indices in order; a section over budget is alone in its group.
+    """
+    budget = max_tokens or chunk_token_budget(model)
+    groups, cur, cur_tokens = [], [], 0
+    for i, (title, body) in enumerate(sections):
+        n = count_tokens(f"{title}\n\n{body}", model)
+        if cur and cur_tokens + n > budget:
+            groups.append(cur)
+            cur, cur_tokens = [], 0
+        cur.append(i)
+        cur_tokens += n
+    if cur:
+        groups.append(cur)
+    return groups
@@ -0,0 +1,55 @@
+import os
+import time
+
+# ─── Disk Cache Eviction ───────────────────────────────────────
+#
+# File caches (rendered figures, parsed PDFs, topic indexes) are
+# bounded the same way as the LLM cache: entries unused for longer than a max
+# age are dropped, then the least recently used ones until the directory is
+# under its byte budget. Files sharing a name up to the first "." (an index's
+# .npy and .json) form one entry. A hit touches the entry, so its mtime is its
+# last use.
+
+# Entries used this recently are never evicted; a running job may still need them
+IN_USE_SECONDS = 3600
+
+
+def touch(path: str):
+    """Marks a cached file as just used; a file evicted meanwhile is ignored."""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def prune_cache_dir(directory: str, max_bytes: int, max_age_seconds: float, now: float = None):
+    now = time.time() if now is None else now
+    entries = {}  # name stem -> [last used, size, paths]
+    try:
+        files = list(os.scandir(directory))
+    except OSError:
+        return
+    for f in files:
+        try:
+            if not f.is_file():
+                continue
+            st = f.stat()
+        except OSError:
+            continue
+        entry = entries.setdefault(f.name.split(".")[0], [0.0, 0, []])
+        entry[0] = max(entry[0], st.st_mtime)
+        entry[1] += st.st_size
+        entry[2].append(f.path)
+
+    total = sum(size for _, size, _ in entries.values())
+    for last_used, size, paths in sorted(entries.values()):
+        if now - last_used < IN_USE_SECONDS:
+            break
+        if total <= max_bytes and now - last_used <= max_age_seconds:
+            break
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        total -= size
@@ -0,0 +1,189 @@
+import hashlib
+import math
+import os
+import shutil
+import threading
+import plotly.io as pio
+from pylatex.utils import escape_latex
+from disk_cache import prune_cache_dir, touch
+
+try:
+    import kaleido
+except ImportError:  # plotly reports the missing renderer when an image is written
+    kaleido = None
+
+# ─── Figure Export ─────────────────────────────────────────────
+#
+# Figures are cached on disk by a hash of their full spec, so a chart that was
+# already rendered (same trends, or a retried job) is just copied. Misses are
+# rendered in one batch through a Kaleido server that stays up for the life of
+# the process, with one browser tab per figure. With FIGURE_EXPORT_FORMAT=pgf,
+# charts are written as pgfplots/TikZ code instead and no image is rendered.
+# The cache is bounded by FIGURE_CACHE_MAX_BYTES and FIGURE_CACHE_MAX_AGE_SECONDS.
+
+FIGURE_EXPORT_FORMAT = os.environ.get("FIGURE_EXPORT_FORMAT", "pdf")
+FIGURE_CACHE_DIR = os.environ.get("FIGURE_CACHE_DIR", os.path.join(".cache", "figures"))
+FIGURE_CACHE_MAX_BYTES = int(os.environ.get("FIGURE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+FIGURE_CACHE_MAX_AGE_SECONDS = int(os.environ.get("FIGURE_CACHE_MAX_AGE_SECONDS", str(30 * 24 * 3600)))
+# Browser tabs the warm renderer keeps open, i.e. figures rendered at once
+FIGURE_RENDER_TABS = int(os.environ.get("FIGURE_RENDER_TABS", "4"))
+
+_renderer_started = False
+_renderer_lock = threading.Lock()
+_render_lock = threading.Lock()
+
+
+def figure_cache_key(fig, fmt: str) -> str:
+    return hashlib.sha256(f"{fmt}\n{fig.to_json()}".encode("utf-8")).hexdigest()
+
+
+def ensure_renderer() -> bool:
+    """Starts the shared Kaleido server once per process; False if this Kaleido has none."""
+    global _renderer_started
+    with _renderer_lock:
+        if not _renderer_started:
+            if kaleido is None or not hasattr(kaleido, "start_sync_server"):
+                return False
+            kaleido.start_sync_server(n=FIGURE_RENDER_TABS, silence_warnings=True)
+            _renderer_started = True
+        return True
+
+
+def render_images(figs: list, paths: list[str], fmt: str):
+    ensure_renderer()
+    # One batch at a time on the shared renderer; within a batch figures render in parallel tabs
+    with _render_lock:
+        if hasattr(pio, "write_images"):
+            pio.write_images(figs, paths, format=fmt)
+        else:
+            for fig, path in zip(figs, paths):
+                fig.write_image(path, format=fmt)
+
+
+def export_figures(figures: dict, fmt: str = FIGURE_EXPORT_FORMAT) -> list[str]:
+    """
+    Writes each figure in {output path: plotly figure} as `fmt` ("pdf", "png",
+    "svg" or "pgf"), reusing cached renders. Returns the paths, in order.
+    """
+    os.makedirs(FIGURE_CACHE_DIR, exist_ok=True)
+    misses = []
+    for path, fig in figures.items():
+        cached = os.path.join(FIGURE_CACHE_DIR, f"{figure_cache_key(fig, fmt)}.{fmt}")
+        if os.path.exists(cached):
+            touch(cached)
+        else:
+            misses.append((fig, cached))
+
+    if misses:
+        tmp_paths = [f"{cached}.{os.getpid()}.{threading.get_ident()}.tmp" for _, cached in misses]
+        if fmt == "pgf":
+            for (fig, _), tmp in zip(misses, tmp_paths):
+                with open(tmp, "w", encoding="utf-8") as f:
+                    f.write(figure_to_pgf(fig))
+        else:
+            render_images([fig for fig, _ in misses], tmp_paths, fmt)
+        for (_, cached), tmp in zip(misses, tmp_paths):
+            os.replace(tmp, cached)
+        prune_cache_dir(FIGURE_CACHE_DIR, FIGURE_CACHE_MAX_BYTES, FIGURE_CACHE_MAX_AGE_SECONDS)
+
+    for path, fig in figures.items():
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        shutil.copyfile(os.path.join(FIGURE_CACHE_DIR, f"{figure_cache_key(fig, fmt)}.{fmt}"), path)
+    return list(figures)
+
+
+# ─── Native LaTeX Charts ───────────────────────────────────────
+
+def pgf_color(color: str) -> str:
+    """Plotly "#rrggbb" to an xcolor spec usable inline, e.g. {rgb,255:red,99;green,110;blue,250}."""
+    color = (color or "#636efa").lstrip("#")
+    r, g, b = (int(color[i:i + 2], 16) for i in (0, 2, 4))
+    return f"{{rgb,255:red,{r};green,{g};blue,{b}}}"
+
+
+def trace_color(trace, i: int, colorway: list[str]) -> str:
+    color = getattr(trace.marker, "color", None)
+    if isinstance(color, str) and color.startswith("#"):
+        return color
+    return colorway[i % len(colorway)]
+
+
+def figure_colorway(fig) -> list[str]:
+    colorway = fig.layout.piecolorway or fig.layout.colorway or fig.layout.template.layout.colorway
+    return list(colorway) if colorway else ["#636efa"]
+
+
+def bar_figure_to_pgf(fig) -> str:
+    """Grouped bar chart as a pgfplots axis; categories are placed by index so any label is safe."""
+    categories = []
+    for trace in fig.data:
+        for x in trace.x:
+            if str(x) not in categories:
+                categories.append(str(x))
+    colorway = figure_colorway(fig)
+    title = fig.layout.title.text or ""
+    xlabel = fig.layout.xaxis.title.text or ""
+    ylabel = fig.layout.yaxis.title.text or ""
+    grouped = len(fig.data) > 1
+
+    lines = [
+        r"\begin{tikzpicture}",
+        r"\begin{axis}[",
+        r"  ybar, width=\textwidth, height=0.5\textwidth, ymin=0,",
+        f"  bar width={max(2, 12 // max(1, len(fig.data)))}pt,",
+        f"  title={{{escape_latex(title)}}}, xlabel={{{escape_latex(xlabel)}}}, ylabel={{{escape_latex(ylabel)}}},",
+        f"  xtick={{0,...,{max(0, len(categories) - 1)}}},",
+        "  xticklabels={" + ",".join(f"{{{escape_latex(c)}}}" for c in categories) + "},",
+        r"  x tick label style={rotate=45, anchor=east, font=\footnotesize},",
+    ]
+    if grouped:
+        lines.append(r"  legend style={at={(0.5,-0.35)}, anchor=north, legend columns=2, font=\footnotesize},")
+    lines.append("]")
+    for i, trace in enumerate(fig.data):
+        coords = " ".join(f"({categories.index(str(x))},{y})" for x, y in zip(trace.x, trace.y))
+        lines.append(f"\\addplot[fill={pgf_color(trace_color(trace, i, colorway))}, draw=none] coordinates {{{coords}}};")
+        if grouped:
+            lines.append(f"\\addlegendentry{{{escape_latex(str(trace.name or ''))}}}")
+    lines += [r"\end{axis}", r"\end{tikzpicture}"]
+    return "\n".join(lines) + "\n"
+
+
+def pie_figure_to_pgf(fig) -> str:
+    """Pie chart drawn with plain TikZ arcs; pgfplots has no pie type."""
+    trace = fig.data[0]
+    values = [float(v) for v in trace.values]
+    total = sum(values) or 1.0
+    colorway = figure_colorway(fig)
+    title = fig.layout.title.text or ""
+
+    lines = [r"\begin{tikzpicture}"]
+    if title:
+        lines.append(f"\\node[font=\\bfseries] at (0,3) {{{escape_latex(title)}}};")
+    start = 90.0
+    for i, (label, value) in enumerate(zip(trace.labels, values)):
+        sweep = 360.0 * value / total
+        end = start - sweep
+        color = pgf_color(colorway[i % len(colorway)])
+        if sweep >= 360.0:
+            lines.append(f"\\fill[fill={color}] (0,0) circle (2.2);")
+        else:
+            lines.append(f"\\fill[fill={color}, draw=white] (0,0) -- ({start:.2f}:2.2) arc ({start:.2f}:{end:.2f}:2.2) -- cycle;")
+        mid = math.radians((start + end) / 2)
+        anchor = "west" if math.cos(mid) >= 0 else "east"
+        lines.append(
+            f"\\node[anchor={anchor}, font=\\footnotesize] at ({2.4 * math.cos(mid):.2f},{2.4 * math.sin(mid):.2f}) "
+            f"{{{escape_latex(str(label))} ({100 * value / total:.0f}\\%)}};"
+        )
+        start = end
+    lines.append(r"\end{tikzpicture}")
+    return "\n".join(lines) + "\n"
+
+
+def figure_to_pgf(fig) -> str:
+    """LaTeX source for the bar and pie charts this app draws; needs pgfplots in the preamble."""
+    kinds = {trace.type for trace in fig.data}
+    if kinds == {"pie"}:
+        return pie_figure_to_pgf(fig)
+    if kinds == {"bar"}:
+        return bar_figure_to_pgf(fig)
+    raise ValueError(f"No native LaTeX export for {', '.join(sorted(kinds))} charts")
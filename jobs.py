@@ -0,0 +1,358 @@
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+
+# ─── Background Job Queue ──────────────────────────────────────
+#
+# Long runs are submitted as jobs and executed in threads that live in the
+# Streamlit server process, outside any one script run, so reruns, refreshes
+# and dropped websockets do not cancel them. A dispatcher thread starts each
+# job in its own thread as soon as it is submitted, up to JOB_MAX_RUNNING at
+# once; jobs mostly wait on OpenAI, whose capacity llm_scheduler shares out,
+# and their CPU-bound stages (PDF extraction, LaTeX) have their own bounded
+# pools, so a queue in front of them only adds latency. Job state is persisted in SQLite;
+# a page reattaches by job ID and polls. A running job holds a lease that its
+# process renews every JOB_HEARTBEAT_SECONDS; a job whose lease ran out (its
+# process died) is claimed again, so several processes can share the database
+# without taking over each other's live jobs. Finished and
+# failed jobs are deleted, row and directory, JOB_RETENTION_SECONDS after they
+# last changed; a finished job's inputs and checkpoints go as soon as it is done.
+
+JOBS_DIR = os.environ.get("JOBS_DIR", os.path.join(".cache", "jobs"))
+JOBS_DB_PATH = os.environ.get("JOBS_DB_PATH", os.path.join(JOBS_DIR, "jobs.sqlite3"))
+JOB_MAX_RUNNING = int(os.environ.get("JOB_MAX_RUNNING", "64"))
+# Minimum seconds between persisted partial-result updates for one job
+JOB_PARTIAL_FLUSH_SECONDS = 1.0
+JOB_RETENTION_SECONDS = float(os.environ.get("JOB_RETENTION_SECONDS", str(24 * 3600)))
+JOB_CLEANUP_INTERVAL_SECONDS = 600
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", "60"))
+JOB_HEARTBEAT_SECONDS = JOB_LEASE_SECONDS / 4
+
+_lock = threading.Lock()
+_conn = None
+_wakeup = threading.Event()
+_workers = []
+_workers_lock = threading.Lock()
+_running = threading.BoundedSemaphore(max(1, JOB_MAX_RUNNING))
+_last_cleanup = 0.0
+# Identifies this process's leases
+WORKER_ID = uuid.uuid4().hex
+
+
+def get_connection() -> sqlite3.Connection:
+    global _conn
+    with _lock:
+        if _conn is None:
+            os.makedirs(JOBS_DIR, exist_ok=True)
+            _conn = sqlite3.connect(JOBS_DB_PATH, check_same_thread=False, isolation_level=None)
+            _conn.row_factory = sqlite3.Row
+            _conn.execute("PRAGMA journal_mode=WAL")
+            _conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    stage TEXT NOT NULL DEFAULT '',
+                    progress REAL NOT NULL DEFAULT 0,
+                    params TEXT NOT NULL,
+                    partial TEXT NOT NULL DEFAULT '{}',
+                    result TEXT,
+                    error TEXT,
+                    charged INTEGER NOT NULL DEFAULT 0,
+                    worker_id TEXT,
+                    lease_expires_at REAL NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            columns = {row["name"] for row in _conn.execute("PRAGMA table_info(jobs)")}
+            if "worker_id" not in columns:
+                # databases created before leases
+                _conn.execute("ALTER TABLE jobs ADD COLUMN worker_id TEXT")
+                _conn.execute("ALTER TABLE jobs ADD COLUMN lease_expires_at REAL NOT NULL DEFAULT 0")
+            _conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+            _conn.execute("CREATE INDEX IF NOT EXISTS jobs_user ON jobs (user_id, created_at)")
+        return _conn
+
+
+def execute(sql: str, args: tuple = ()) -> int:
+    conn = get_connection()
+    with _lock:
+        return conn.execute(sql, args).rowcount
+
+
+def fetch_one(sql: str, args: tuple = ()) -> sqlite3.Row | None:
+    conn = get_connection()
+    with _lock:
+        return conn.execute(sql, args).fetchone()
+
+
+def job_dir(job_id: str) -> str:
+    return os.path.join(JOBS_DIR, job_id)
+
+
+def submit_job(kind: str, user_id: str, params: dict, files: dict = None) -> str:
+    """
+    Queues a job and returns its ID.
+    `files` maps names to bytes; they are saved under the job's inputs/ directory
+    and their paths are passed to the handler as params["files"][name].
+    """
+    job_id = uuid.uuid4().hex
+    params = dict(params)
+    if files:
+        inputs_dir = os.path.join(job_dir(job_id), "inputs")
+        os.makedirs(inputs_dir, exist_ok=True)
+        params["files"] = {}
+        for name, data in files.items():
+            path = os.path.join(inputs_dir, name)
+            with open(path, "wb") as f:
+                f.write(data)
+            params["files"][name] = path
+    now = time.time()
+    execute(
+        "INSERT INTO jobs (id, kind, user_id, status, params, created_at, updated_at) VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+        (job_id, kind, user_id, json.dumps(params), now, now),
+    )
+    _wakeup.set()
+    return job_id
+
+
+def row_to_job(row) -> dict:
+    job = dict(row)
+    job["params"] = json.loads(job["params"])
+    job["partial"] = json.loads(job["partial"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    job["charged"] = bool(job["charged"])
+    return job
+
+
+def get_job(job_id: str) -> dict | None:
+    row = fetch_one("SELECT * FROM jobs WHERE id = ?", (job_id,))
+    return row_to_job(row) if row else None
+
+
+def retry_job(job_id: str) -> bool:
+    """Requeues a failed job; its stage checkpoints are kept, so only unfinished work re-runs."""
+    requeued = execute(
+        "UPDATE jobs SET status = 'queued', error = NULL, updated_at = ? WHERE id = ? AND status = 'failed'",
+        (time.time(), job_id),
+    ) == 1
+    if requeued:
+        _wakeup.set()
+    return requeued
+
+
+def claim_charge(job_id: str) -> bool:
+    """Atomically marks a finished job as billed; False if it already was."""
+    return execute("UPDATE jobs SET charged = 1 WHERE id = ? AND status = 'done' AND charged = 0", (job_id,)) == 1
+
+
+def release_charge(job_id: str):
+    execute("UPDATE jobs SET charged = 0 WHERE id = ?", (job_id,))
+
+
+class JobContext:
+    """Handed to job handlers to report stage, progress and partial results."""
+
+    def __init__(self, job: dict):
+        self.job_id = job["id"]
+        self.user_id = job["user_id"]
+        self.params = job["params"]
+        self.partial = job["partial"]
+        self.work_dir = job_dir(self.job_id)
+        self._last_flush = 0.0
+        os.makedirs(self.work_dir, exist_ok=True)
+
+    def set_stage(self, stage: str, progress: float = 0.0):
+        execute(
+            "UPDATE jobs SET stage = ?, progress = ?, updated_at = ? WHERE id = ?",
+            (stage, progress, time.time(), self.job_id),
+        )
+
+    def set_progress(self, progress: float):
+        execute(
+            "UPDATE jobs SET progress = ?, updated_at = ? WHERE id = ?",
+            (progress, time.time(), self.job_id),
+        )
+
+    def checkpoint_path(self, name: str) -> str:
+        return os.path.join(self.work_dir, "checkpoints", f"{name}.json")
+
+    def load_checkpoint(self, name: str, default=None):
+        try:
+            with open(self.checkpoint_path(name), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return default
+
+    def save_checkpoint(self, name: str, value):
+        path = self.checkpoint_path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+    def checkpointed(self, name: str, compute):
+        """Returns the stage output saved by an earlier attempt, or computes and saves it."""
+        value = self.load_checkpoint(name)
+        if value is None:
+            value = compute()
+            self.save_checkpoint(name, value)
+        return value
+
+    def publish(self, key: str, value, force: bool = False):
+        """Updates one partial-result field; persisted at most every JOB_PARTIAL_FLUSH_SECONDS."""
+        self.partial[key] = value
+        now = time.time()
+        if force or now - self._last_flush >= JOB_PARTIAL_FLUSH_SECONDS:
+            self._last_flush = now
+            execute(
+                "UPDATE jobs SET partial = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(self.partial), now, self.job_id),
+            )
+
+
+def claim_next_job() -> dict | None:
+    """Takes the oldest queued job, or a running one whose process stopped renewing its lease."""
+    conn = get_connection()
+    with _lock:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute(
+                """
+                SELECT * FROM jobs
+                WHERE status = 'queued' OR (status = 'running' AND lease_expires_at < ?)
+                ORDER BY created_at LIMIT 1
+                """,
+                (now,),
+            ).fetchone()
+            if row:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', worker_id = ?, lease_expires_at = ?, updated_at = ? WHERE id = ?",
+                    (WORKER_ID, now + JOB_LEASE_SECONDS, now, row["id"]),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    if not row:
+        return None
+    job = row_to_job(row)
+    job["status"] = "running"
+    return job
+
+
+def renew_leases():
+    """Extends the lease of every job this process is running."""
+    execute(
+        "UPDATE jobs SET lease_expires_at = ? WHERE status = 'running' AND worker_id = ?",
+        (time.time() + JOB_LEASE_SECONDS, WORKER_ID),
+    )
+
+
+def heartbeat_loop():
+    while True:
+        time.sleep(JOB_HEARTBEAT_SECONDS)
+        try:
+            renew_leases()
+        except Exception:
+            traceback.print_exc()
+
+
+def run_job(job: dict, handlers: dict):
+    ctx = JobContext(job)
+    try:
+        result = handlers[job["kind"]](ctx)
+        finished = execute(
+            "UPDATE jobs SET status = 'done', progress = 1, result = ?, updated_at = ? WHERE id = ? AND worker_id = ?",
+            (json.dumps(result), time.time(), job["id"], WORKER_ID),
+        ) == 1
+        # Only a failed job can be retried, so a finished one no longer needs these;
+        # a job whose lease was taken over is left to its new owner
+        for name in ("inputs", "checkpoints") if finished else ():
+            shutil.rmtree(os.path.join(ctx.work_dir, name), ignore_errors=True)
+    except Exception as e:
+        traceback.print_exc()
+        execute(
+            "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ? AND worker_id = ?",
+            (str(e), time.time(), job["id"], WORKER_ID),
+        )
+
+
+def cleanup_jobs(now: float = None) -> int:
+    """
+    Deletes finished and failed jobs older than JOB_RETENTION_SECONDS, and job
+    directories without a job row. Returns the number of jobs deleted.
+    """
+    now = now or time.time()
+    cutoff = now - JOB_RETENTION_SECONDS
+    conn = get_connection()
+    with _lock:
+        expired = [row["id"] for row in conn.execute(
+            "SELECT id FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?", (cutoff,)
+        ).fetchall()]
+    for job_id in expired:
+        # The row goes last, so a directory is never left without a row to find it by
+        shutil.rmtree(job_dir(job_id), ignore_errors=True)
+        execute("DELETE FROM jobs WHERE id = ? AND status IN ('done', 'failed')", (job_id,))
+    # Left behind by a crash between saving the uploads and inserting the row
+    for entry in os.scandir(JOBS_DIR):
+        if entry.is_dir() and entry.stat().st_mtime < cutoff and not fetch_one("SELECT 1 FROM jobs WHERE id = ?", (entry.name,)):
+            shutil.rmtree(entry.path, ignore_errors=True)
+    return len(expired)
+
+
+def maybe_cleanup_jobs():
+    """Runs cleanup_jobs at most every JOB_CLEANUP_INTERVAL_SECONDS per process."""
+    global _last_cleanup
+    with _workers_lock:
+        now = time.time()
+        if now - _last_cleanup < JOB_CLEANUP_INTERVAL_SECONDS:
+            return
+        _last_cleanup = now
+    try:
+        cleanup_jobs(now)
+    except Exception:
+        traceback.print_exc()
+
+
+def run_job_in_slot(job: dict, handlers: dict):
+    try:
+        run_job(job, handlers)
+    finally:
+        _running.release()
+
+
+def dispatch_loop(handlers: dict):
+    """Claims jobs as they arrive and starts each one in its own thread."""
+    while True:
+        maybe_cleanup_jobs()
+        # a job is only claimed once there is a slot to run it in
+        _running.acquire()
+        job = claim_next_job()
+        if job is None:
+            _running.release()
+            _wakeup.wait(timeout=1.0)
+            _wakeup.clear()
+            continue
+        threading.Thread(target=run_job_in_slot, args=(job, handlers), name=f"job-{job['id']}", daemon=True).start()
+
+
+def ensure_workers(handlers: dict):
+    """Starts the dispatcher and heartbeat threads once per process; safe to call on every rerun."""
+    with _workers_lock:
+        if _workers:
+            return
+        for target, args, name in ((heartbeat_loop, (), "job-heartbeat"), (dispatch_loop, (handlers,), "job-dispatcher")):
+            t = threading.Thread(target=target, args=args, name=name, daemon=True)
+            t.start()
+            _workers.append(t)
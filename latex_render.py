@@ -0,0 +1,159 @@
+import hashlib
+import os
+import subprocess
+import tempfile
+import threading
+import time
+
+# ─── LaTeX Rendering ───────────────────────────────────────────
+#
+# Compiles documents with pdflatex directly instead of pylatex's generate_pdf.
+# The preamble (everything before \begin{document}) is dumped once into a
+# precompiled format with mylatexformat, so later compiles skip loading the
+# class and packages. Formats are cached on disk by a hash of the preamble and
+# built at most once per process. Compiles run in a bounded pool so many jobs
+# finishing together queue up instead of oversubscribing the CPU, and a
+# document is only re-run when LaTeX asks for it.
+
+LATEX_COMPILER = os.environ.get("LATEX_COMPILER", "pdflatex")
+LATEX_FORMAT_DIR = os.environ.get("LATEX_FORMAT_DIR", os.path.join(".cache", "latex"))
+LATEX_MAX_CONCURRENT_COMPILES = int(os.environ.get("LATEX_MAX_CONCURRENT_COMPILES", str(max(1, (os.cpu_count() or 2) // 2))))
+LATEX_COMPILE_TIMEOUT_SECONDS = float(os.environ.get("LATEX_COMPILE_TIMEOUT_SECONDS", "120"))
+LATEX_MAX_PASSES = 3
+# Parent for per-render scratch directories (default: the system temp dir)
+LATEX_SCRATCH_DIR = os.environ.get("LATEX_SCRATCH_DIR") or None
+# Set to 0 to always compile from the plain format
+LATEX_PRECOMPILE_PREAMBLE = os.environ.get("LATEX_PRECOMPILE_PREAMBLE", "1") != "0"
+
+BEGIN_DOCUMENT = "\\begin{document}"
+
+_compile_slots = threading.BoundedSemaphore(max(1, LATEX_MAX_CONCURRENT_COMPILES))
+_formats = {}  # preamble hash -> format name, or None if it could not be built
+_formats_lock = threading.Lock()
+
+
+class LatexCompileError(RuntimeError):
+    pass
+
+
+def log_tail(log_path: str, lines: int = 20) -> str:
+    try:
+        with open(log_path, encoding="utf-8", errors="replace") as f:
+            return "".join(f.readlines()[-lines:])
+    except OSError:
+        return ""
+
+
+def run_latex(args: list[str], cwd: str, env: dict = None) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [LATEX_COMPILER, "-interaction=nonstopmode", "-halt-on-error", *args],
+        cwd=cwd,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        timeout=LATEX_COMPILE_TIMEOUT_SECONDS,
+    )
+
+
+def get_format(preamble: str) -> str | None:
+    """Name of a format with `preamble` preloaded, building it on first use; None if unavailable."""
+    key = hashlib.sha256(f"{LATEX_COMPILER}\n{preamble}".encode("utf-8")).hexdigest()[:16]
+    name = f"preamble-{key}"
+    with _formats_lock:
+        if key in _formats:
+            return _formats[key]
+        os.makedirs(LATEX_FORMAT_DIR, exist_ok=True)
+        if not os.path.exists(os.path.join(LATEX_FORMAT_DIR, name + ".fmt")):
+            with open(os.path.join(LATEX_FORMAT_DIR, name + ".tex"), "w", encoding="utf-8") as f:
+                f.write(preamble + BEGIN_DOCUMENT + "\n\\end{document}\n")
+            try:
+                run_latex(["-ini", f"-jobname={name}", f"&{LATEX_COMPILER}", "mylatexformat.ltx", name + ".tex"], LATEX_FORMAT_DIR)
+            except (OSError, subprocess.TimeoutExpired):
+                pass
+        _formats[key] = name if os.path.exists(os.path.join(LATEX_FORMAT_DIR, name + ".fmt")) else None
+        return _formats[key]
+
+
+def drop_format(name: str):
+    with _formats_lock:
+        for key in [k for k, v in _formats.items() if v == name]:
+            del _formats[key]
+        try:
+            os.remove(os.path.join(LATEX_FORMAT_DIR, name + ".fmt"))
+        except OSError:
+            pass
+
+
+def render_pdf(source: str, jobname: str, out_dir: str) -> dict:
+    """
+    Compiles LaTeX `source` to out_dir/jobname.pdf.
+    Returns {"pdf_path", "seconds", "queued_seconds", "passes", "precompiled"}.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    tex_path = os.path.join(out_dir, jobname + ".tex")
+    with open(tex_path, "w", encoding="utf-8") as f:
+        f.write(source)
+
+    queued_at = time.monotonic()
+    with _compile_slots:
+        started = time.monotonic()
+        fmt = None
+        if LATEX_PRECOMPILE_PREAMBLE and BEGIN_DOCUMENT in source:
+            fmt = get_format(source.split(BEGIN_DOCUMENT, 1)[0])
+        env = None
+        args = [jobname + ".tex"]
+        if fmt:
+            # The trailing separator keeps the default search path for the stock formats
+            env = dict(os.environ, TEXFORMATS=os.path.abspath(LATEX_FORMAT_DIR) + os.pathsep)
+            args = [f"-fmt={fmt}", *args]
+
+        log_path = os.path.join(out_dir, jobname + ".log")
+        if os.path.exists(log_path):
+            os.remove(log_path)
+        passes = 0
+        while True:
+            passes += 1
+            try:
+                proc = run_latex(args, out_dir, env)
+            except subprocess.TimeoutExpired:
+                raise LatexCompileError(f"LaTeX compile timed out after {LATEX_COMPILE_TIMEOUT_SECONDS:.0f}s")
+            except OSError as e:
+                raise LatexCompileError(f"Could not run {LATEX_COMPILER}: {e}") from e
+            if proc.returncode != 0 and fmt and f"{jobname}.tex" not in log_tail(log_path, 10**6):
+                # Failed before reading the document, e.g. a format left over from an
+                # older TeX install; rebuild it next time and compile this one plainly
+                drop_format(fmt)
+                fmt, env, args, passes = None, None, [jobname + ".tex"], 0
+                continue
+            if proc.returncode != 0:
+                raise LatexCompileError(f"{LATEX_COMPILER} exited with {proc.returncode}:\n{log_tail(log_path)}")
+            if passes >= LATEX_MAX_PASSES or "Rerun to get" not in log_tail(log_path, 200):
+                break
+
+    return {
+        "pdf_path": os.path.join(out_dir, jobname + ".pdf"),
+        "seconds": round(time.monotonic() - started, 3),
+        "queued_seconds": round(started - queued_at, 3),
+        "passes": passes,
+        "precompiled": bool(fmt),
+    }
+
+
+def render_pdf_bytes(source: str, jobname: str = "document") -> dict:
+    """
+    Compiles in a private scratch directory that is removed afterwards, so
+    concurrent renders never share files. Paths in `source` must be absolute.
+    Returns render_pdf's timings with "pdf_bytes" in place of "pdf_path".
+    """
+    if LATEX_SCRATCH_DIR:
+        os.makedirs(LATEX_SCRATCH_DIR, exist_ok=True)
+    with tempfile.TemporaryDirectory(prefix="latex-", dir=LATEX_SCRATCH_DIR) as scratch:
+        render = render_pdf(source, jobname, scratch)
+        try:
+            with open(render.pop("pdf_path"), "rb") as f:
+                render["pdf_bytes"] = f.read()
+        except FileNotFoundError:
+            # pdflatex succeeds without writing a PDF when nothing was typeset
+            raise LatexCompileError("No PDF was produced; the document has no pages")
+    return render
+
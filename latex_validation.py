@@ -0,0 +1,340 @@
+import re
+
+# ─── LaTeX Fragment Validation ─────────────────────────────────
+#
+# Model-written section bodies are checked in-process before anything is
+# compiled: balanced braces, matching \begin/\end pairs, known environments
+# and commands only (those of the article class, amsmath, amsfonts and the
+# packages pylatex always loads), each in the mode it works in, no preamble or
+# macro definitions, and closed math. sanitize_latex fixes
+# what can be fixed mechanically (Markdown leftovers, stray special characters,
+# common Unicode); validate_latex reports whatever is left.
+
+# Environments available with amsmath/amsfonts and the standard article class
+MATH_ENVIRONMENTS = {
+    "equation", "equation*", "align", "align*", "alignat", "alignat*", "gather", "gather*",
+    "multline", "multline*", "flalign", "flalign*", "eqnarray", "eqnarray*", "displaymath", "math",
+}
+INNER_MATH_ENVIRONMENTS = {
+    "split", "aligned", "alignedat", "gathered", "cases", "array", "subarray",
+    "matrix", "pmatrix", "bmatrix", "Bmatrix", "vmatrix", "Vmatrix", "smallmatrix",
+}
+TEXT_ENVIRONMENTS = {
+    "itemize", "enumerate", "description", "center", "flushleft", "flushright", "quote",
+    "quotation", "verse", "minipage", "tabular", "tabular*", "table", "verbatim", "subequations",
+}
+ALLOWED_ENVIRONMENTS = MATH_ENVIRONMENTS | INNER_MATH_ENVIRONMENTS | TEXT_ENVIRONMENTS
+ALIGNMENT_ENVIRONMENTS = {
+    "align", "align*", "alignat", "alignat*", "flalign", "flalign*", "eqnarray", "eqnarray*",
+    "split", "aligned", "alignedat", "cases", "array", "tabular", "tabular*",
+    "matrix", "pmatrix", "bmatrix", "Bmatrix", "vmatrix", "Vmatrix", "smallmatrix",
+}
+# Commands a section body must not contain: preamble, macro definitions, external files
+FORBIDDEN_COMMANDS = {
+    "documentclass", "usepackage", "newcommand", "renewcommand", "providecommand", "def",
+    "edef", "gdef", "let", "newenvironment", "renewenvironment", "DeclareMathOperator",
+    "input", "include", "includegraphics",
+}
+# Commands whose argument is a key, where "_" and "#" are literal
+KEY_ARGUMENT_COMMANDS = {"label", "ref", "eqref", "pageref", "cite"}
+# Commands whose braced argument is text, even inside math
+TEXT_ARGUMENT_COMMANDS = {
+    "text", "textrm", "textbf", "textit", "textsf", "texttt", "textup", "textsl", "textsc",
+    "textmd", "textnormal", "emph", "mbox", "intertext",
+}
+
+# Known commands, by the mode they work in; anything else fails the compile
+TEXT_COMMANDS = {
+    "part", "section", "subsection", "subsubsection", "paragraph", "subparagraph", "appendix",
+    "item", "footnote", "footnotemark", "footnotetext", "caption", "centering", "raggedright", "raggedleft",
+    "newline", "linebreak", "nolinebreak", "newpage", "clearpage", "pagebreak", "nopagebreak",
+    "noindent", "indent", "par", "smallskip", "medskip", "bigskip", "vspace", "hfill", "vfill",
+    "hline", "cline", "multicolumn", "tabularnewline", "parbox", "makebox", "fbox", "framebox", "raisebox", "rule",
+    "bfseries", "itshape", "ttfamily", "sffamily", "rmfamily", "scshape", "mdseries", "upshape", "slshape",
+    "normalfont", "em", "tiny", "scriptsize", "footnotesize", "small", "normalsize", "large", "Large",
+    "LARGE", "huge", "Huge", "underline", "today", "LaTeX", "TeX", "textbackslash", "textasciitilde",
+    "textasciicircum", "textbar", "textless", "textgreater", "textdegree", "textendash", "textemdash",
+    "textquoteleft", "textquoteright", "textquotedblleft", "textquotedblright", "textbullet",
+    "textperiodcentered", "texttimes", "textdiv", "textpm", "textcelsius", "textmu", "S", "P", "dag",
+    "ddag", "copyright", "pounds", "ss", "ae", "AE", "oe", "OE", "aa", "AA", "o", "O", "l", "L", "i", "j",
+    "verb",
+}
+MATH_COMMANDS = {
+    # Greek
+    "alpha", "beta", "gamma", "delta", "epsilon", "varepsilon", "zeta", "eta", "theta", "vartheta",
+    "iota", "kappa", "lambda", "mu", "nu", "xi", "pi", "varpi", "rho", "varrho", "sigma", "varsigma",
+    "tau", "upsilon", "phi", "varphi", "chi", "psi", "omega", "Gamma", "Delta", "Theta", "Lambda",
+    "Xi", "Pi", "Sigma", "Upsilon", "Phi", "Psi", "Omega", "varGamma", "varDelta", "varTheta",
+    "varLambda", "varXi", "varPi", "varSigma", "varUpsilon", "varPhi", "varPsi", "varOmega",
+    # operators and functions
+    "sum", "prod", "coprod", "int", "oint", "iint", "iiint", "idotsint", "bigcup", "bigcap", "bigoplus",
+    "bigotimes", "bigodot", "biguplus", "bigsqcup", "bigvee", "bigwedge", "lim", "limsup", "liminf",
+    "sup", "inf", "max", "min", "log", "lg", "ln", "exp", "sin", "cos", "tan", "sec", "csc", "cot",
+    "arcsin", "arccos", "arctan", "sinh", "cosh", "tanh", "coth", "det", "dim", "ker", "deg", "gcd",
+    "hom", "arg", "Pr", "mod", "bmod", "pmod", "pod", "operatorname", "limits", "nolimits",
+    "frac", "dfrac", "tfrac", "cfrac", "binom", "dbinom", "tbinom", "sqrt", "substack",
+    # relations, arrows and binary operators
+    "leq", "geq", "le", "ge", "neq", "ne", "approx", "sim", "simeq", "cong", "equiv", "propto", "ll",
+    "gg", "prec", "succ", "preceq", "succeq", "subset", "subseteq", "supset", "supseteq", "in", "notin",
+    "ni", "perp", "parallel", "mid", "nmid", "vdash", "dashv", "models", "asymp", "doteq", "bowtie",
+    "to", "gets", "rightarrow", "leftarrow", "Rightarrow", "Leftarrow", "leftrightarrow",
+    "Leftrightarrow", "longrightarrow", "Longrightarrow", "longleftarrow", "Longleftarrow",
+    "longleftrightarrow", "Longleftrightarrow", "iff", "implies", "impliedby", "mapsto", "longmapsto",
+    "uparrow", "downarrow", "updownarrow", "Uparrow", "Downarrow", "Updownarrow", "nearrow", "searrow",
+    "nwarrow", "swarrow", "hookrightarrow", "hookleftarrow", "rightharpoonup", "rightleftharpoons",
+    "xrightarrow", "xleftarrow", "pm", "mp", "times", "div", "cdot", "ast", "star", "circ", "bullet",
+    "oplus", "ominus", "otimes", "oslash", "odot", "cup", "cap", "sqcup", "sqcap", "uplus", "wedge",
+    "vee", "land", "lor", "lnot", "neg", "setminus", "wr", "diamond", "triangleleft", "triangleright",
+    # symbols
+    "infty", "partial", "nabla", "forall", "exists", "emptyset", "hbar", "ell", "wp", "Re", "Im",
+    "aleph", "prime", "angle", "triangle", "top", "bot", "flat", "natural", "sharp", "surd", "imath",
+    "jmath", "cdots", "vdots", "ddots", "dotsc", "dotsb", "dotsm", "dotsi", "dotso", "colon", "cdotp",
+    "ldotp", "backslash", "langle", "rangle", "lfloor", "rfloor", "lceil", "rceil", "lvert", "rvert",
+    "lVert", "rVert", "vert", "Vert",
+    # accents, fonts, sizes and layout
+    "hat", "widehat", "tilde", "widetilde", "bar", "overline", "vec", "dot", "ddot", "dddot", "breve",
+    "check", "acute", "grave", "mathring", "overrightarrow", "overleftarrow", "underbrace", "overbrace",
+    "overset", "underset", "stackrel", "mathrm", "mathbf", "mathit", "mathsf", "mathtt", "mathcal",
+    "mathbb", "mathfrak", "mathnormal", "boldsymbol", "pmb", "left", "right", "middle", "big", "Big",
+    "bigg", "Bigg", "bigl", "bigr", "Bigl", "Bigr", "biggl", "biggr", "Biggl", "Biggr", "displaystyle",
+    "textstyle", "scriptstyle", "scriptscriptstyle", "boxed", "tag", "notag", "nonumber", "allowbreak",
+}
+ANYWHERE_COMMANDS = (
+    {"begin", "end", "label", "ref", "eqref", "pageref", "cite", "ensuremath", "ldots", "dots",
+     "quad", "qquad", "enspace", "thinspace", "negthinspace", "hspace", "phantom", "hphantom",
+     "vphantom", "smash", "underline"}
+    | TEXT_ARGUMENT_COMMANDS
+)
+
+COMMAND_RE = re.compile(r"\\([A-Za-z]+\*?|.)", re.DOTALL)
+ENV_ARGUMENT_RE = re.compile(r"\s*\{([^{}]*)\}")
+KEY_ARGUMENT_RE = re.compile(r"\s*\{[^{}]*\}")
+
+CODE_FENCE_RE = re.compile(r"^\s*```[\w-]*\s*$", re.MULTILINE)
+# Spans whose content is typeset literally and must not be rewritten
+VERBATIM_RE = re.compile(r"\\begin\{verbatim\}.*?\\end\{verbatim\}|\\verb\*?([^A-Za-z*\s])[^\n]*?\1", re.DOTALL)
+PREAMBLE_LINE_RE = re.compile(r"^\s*\\(?:documentclass|usepackage|begin\{document\}|end\{document\}).*$", re.MULTILINE)
+MARKDOWN_HEADING_RE = re.compile(r"^(#{1,3})\s+(.+?)\s*#*\s*$", re.MULTILINE)
+MARKDOWN_BOLD_RE = re.compile(r"\*\*(?=\S)(.+?)(?<=\S)\*\*")
+MARKDOWN_HEADING_COMMANDS = {1: "section", 2: "subsection", 3: "subsubsection"}
+
+# \ensuremath works both in text and inside math
+UNICODE_REPLACEMENTS = {
+    "\u2013": "--", "\u2014": "---", "\u2018": "`", "\u2019": "'", "\u201c": "``", "\u201d": "''",
+    "\u2026": "\\ldots{}", "\u00a0": "~", "\u2212": "\\ensuremath{-}", "\u00d7": "\\ensuremath{\\times}",
+    "\u00b7": "\\ensuremath{\\cdot}", "\u2192": "\\ensuremath{\\rightarrow}", "\u2190": "\\ensuremath{\\leftarrow}",
+    "\u21d2": "\\ensuremath{\\Rightarrow}", "\u2264": "\\ensuremath{\\leq}", "\u2265": "\\ensuremath{\\geq}",
+    "\u2260": "\\ensuremath{\\neq}", "\u2248": "\\ensuremath{\\approx}", "\u00b1": "\\ensuremath{\\pm}",
+    "\u221e": "\\ensuremath{\\infty}", "\u00b0": "\\ensuremath{^\\circ}",
+}
+GREEK_LETTERS = {
+    "α": "alpha", "β": "beta", "γ": "gamma", "δ": "delta", "ε": "epsilon", "θ": "theta",
+    "λ": "lambda", "μ": "mu", "π": "pi", "ρ": "rho", "σ": "sigma", "τ": "tau", "φ": "phi",
+    "χ": "chi", "ψ": "psi", "ω": "omega", "Γ": "Gamma", "Δ": "Delta", "Θ": "Theta",
+    "Λ": "Lambda", "Π": "Pi", "Σ": "Sigma", "Φ": "Phi", "Ψ": "Psi", "Ω": "Omega",
+}
+ESCAPES = {"#": "\\#", "&": "\\&", "_": "\\_", "^": "\\^{}"}
+
+
+def scan_latex(text: str) -> tuple[list[str], list[int]]:
+    """
+    Walks a fragment once. Returns (problems, offsets of special characters
+    that are only wrong where they stand and can simply be escaped).
+    """
+    problems, escapes = [], []
+    envs = []  # open environments, innermost last
+    math = None  # what closes the open math mode: "$", "$$", "\\)", "\\]", "}" or an environment name
+    depth = 0
+    groups = []  # (brace depth, mode inside, mode after) for open \ensuremath{...} and \text{...} arguments
+    i, n = 0, len(text)
+    while i < n:
+        c = text[i]
+        if c == "%":
+            end = text.find("\n", i)
+            i = n if end < 0 else end
+            continue
+        if c == "\\":
+            m = COMMAND_RE.match(text, i)
+            if not m:
+                problems.append("trailing backslash")
+                break
+            name = m.group(1)
+            i = m.end()
+            base = name.rstrip("*")
+            if base.isalpha() and base not in ANYWHERE_COMMANDS and name not in FORBIDDEN_COMMANDS:
+                if base not in TEXT_COMMANDS and base not in MATH_COMMANDS:
+                    problems.append(f"unknown command \\{base}")
+                elif math and base not in MATH_COMMANDS:
+                    problems.append(f"\\{base} inside math")
+                elif not math and base not in TEXT_COMMANDS:
+                    problems.append(f"\\{base} outside math")
+            if name in ("verb", "verb*"):
+                if i >= n:
+                    problems.append("\\verb without a delimiter")
+                    break
+                end = text.find(text[i], i + 1)
+                newline = text.find("\n", i + 1)
+                if end < 0 or 0 <= newline < end:
+                    problems.append("unclosed \\verb")
+                    break
+                i = end + 1
+            elif name in FORBIDDEN_COMMANDS:
+                problems.append(f"\\{name} is not allowed in a section")
+            elif name == "ensuremath" and math is None and text.startswith("{", i):
+                # the braced argument is math, wherever the command appears
+                groups.append((depth, "}", math))
+                math = "}"
+            elif name in TEXT_ARGUMENT_COMMANDS and math and text.startswith("{", i):
+                # \text{...} inside math: "_" and "^" there are text again
+                groups.append((depth, None, math))
+                math = None
+            elif name in KEY_ARGUMENT_COMMANDS:
+                arg = KEY_ARGUMENT_RE.match(text, i)
+                if arg:
+                    i = arg.end()
+            elif name in ("begin", "end"):
+                arg = ENV_ARGUMENT_RE.match(text, i)
+                if not arg:
+                    problems.append(f"\\{name} without an environment name")
+                    continue
+                env = arg.group(1).strip()
+                i = arg.end()
+                if name == "begin":
+                    if env == "document":
+                        problems.append("\\begin{document} is not allowed in a section")
+                        continue
+                    if env not in ALLOWED_ENVIRONMENTS:
+                        problems.append(f"unknown environment {env}")
+                    if env in MATH_ENVIRONMENTS:
+                        if math:
+                            problems.append(f"{env} opened inside math")
+                        else:
+                            math = env
+                    envs.append(env)
+                    if env == "verbatim":
+                        end = text.find("\\end{verbatim}", i)
+                        if end < 0:
+                            problems.append("unclosed verbatim")
+                            break
+                        i = end
+                else:
+                    if env == "document":
+                        problems.append("\\end{document} is not allowed in a section")
+                    elif not envs:
+                        problems.append(f"\\end{{{env}}} without \\begin{{{env}}}")
+                    elif envs[-1] != env:
+                        problems.append(f"\\end{{{env}}} closes \\begin{{{envs[-1]}}}")
+                        if env in envs:
+                            del envs[envs.index(env):]
+                    else:
+                        envs.pop()
+                    if math == env:
+                        math = None
+            elif name in ("(", "["):
+                if math:
+                    problems.append(f"\\{name} opened inside math")
+                else:
+                    math = "\\)" if name == "(" else "\\]"
+            elif name in (")", "]"):
+                if math == "\\" + name:
+                    math = None
+                else:
+                    problems.append(f"unmatched \\{name}")
+            continue
+        if c == "$":
+            delim = "$$" if text.startswith("$$", i) else "$"
+            if math == delim:
+                math = None
+            elif math is None:
+                math = delim
+            else:
+                problems.append(f"{delim} inside other math")
+            i += len(delim)
+            continue
+        if c == "{":
+            depth += 1
+        elif c == "}":
+            depth -= 1
+            if depth < 0:
+                problems.append("unbalanced }")
+                depth = 0
+            if groups and depth == groups[-1][0]:
+                _, inside, after = groups.pop()
+                if math != inside:
+                    problems.append(f"math left open in a braced argument ({math})")
+                math = after
+        elif c == "#":
+            escapes.append(i)
+        elif c == "&" and not (envs and envs[-1] in ALIGNMENT_ENVIRONMENTS):
+            escapes.append(i)
+        elif c in "_^" and math is None:
+            escapes.append(i)
+        elif ord(c) > 255:
+            problems.append(f"unsupported character {c!r}")
+        i += 1
+
+    if depth > 0:
+        problems.append(f"{depth} unclosed {{")
+    for env in envs:
+        problems.append(f"unclosed environment {env}")
+    if math:
+        problems.append(f"unclosed math ({math})")
+    # one line per kind of problem is enough to act on
+    return list(dict.fromkeys(problems)), escapes
+
+
+def outside_verbatim(text: str, fn) -> str:
+    """Applies `fn` to the text between verbatim spans only."""
+    out, pos = [], 0
+    for m in VERBATIM_RE.finditer(text):
+        out += [fn(text[pos:m.start()]), m.group()]
+        pos = m.end()
+    out.append(fn(text[pos:]))
+    return "".join(out)
+
+
+def rewrite_text(text: str) -> str:
+    text = CODE_FENCE_RE.sub("", text)
+    text = PREAMBLE_LINE_RE.sub("", text)
+    text = MARKDOWN_HEADING_RE.sub(
+        lambda m: f"\\{MARKDOWN_HEADING_COMMANDS[len(m.group(1))]}{{{m.group(2)}}}", text
+    )
+    text = MARKDOWN_BOLD_RE.sub(r"\\textbf{\1}", text)
+    for char, replacement in UNICODE_REPLACEMENTS.items():
+        text = text.replace(char, replacement)
+    for char, name in GREEK_LETTERS.items():
+        text = text.replace(char, f"\\ensuremath{{\\{name}}}")
+    return text
+
+
+def sanitize_latex(text: str) -> str:
+    """Mechanical repairs: Markdown leftovers, preamble lines, common Unicode, stray specials."""
+    text = outside_verbatim(text, rewrite_text)
+    _, escapes = scan_latex(text)
+    for i in reversed(escapes):
+        text = text[:i] + ESCAPES[text[i]] + text[i + 1:]
+    return text.strip()
+
+
+def validate_latex(text: str) -> list[str]:
+    """Problems that would stop the fragment from compiling; empty if it looks safe."""
+    problems, escapes = scan_latex(text)
+    if escapes:
+        problems.append("unescaped special characters (# & _ ^)")
+    prose = VERBATIM_RE.sub("", text)
+    if CODE_FENCE_RE.search(prose) or MARKDOWN_BOLD_RE.search(prose):
+        problems.append("Markdown formatting")
+    return problems
+
+
+def check_replacements() -> list[str]:
+    """Replacements that do not survive sanitize_latex unchanged or do not validate, in text or math."""
+    bad = []
+    replacements = {**UNICODE_REPLACEMENTS, **{c: f"\\ensuremath{{\\{n}}}" for c, n in GREEK_LETTERS.items()}}
+    for char, replacement in replacements.items():
+        for sample in (f"a {char} b", f"${char}$"):
+            out = sanitize_latex(sample)
+            if out != sample.replace(char, replacement) or validate_latex(out):
+                bad.append(f"{char!r} -> {out!r}")
+    return bad
+
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from singletons import process_singleton
+
+# ─── Persistent LLM Response Cache ─────────────────────────────
+#
+# Responses are keyed on a hash of everything that determines the completion
+# (model, prompts, max_tokens, temperature). Only deterministic calls
+# (temperature 0) are stored, so a hit is as good as a fresh request.
+
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", os.path.join(".cache", "llm_cache.sqlite3"))
+LLM_CACHE_MAX_BYTES = int(os.environ.get("LLM_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+LLM_CACHE_MAX_AGE_SECONDS = int(os.environ.get("LLM_CACHE_MAX_AGE_SECONDS", str(30 * 24 * 3600)))
+
+
+def make_cache_key(model: str, system: str, user: str, max_tokens: int, temp: float, response_format: str = "text") -> str:
+    fields = [model, system, user, max_tokens, temp]
+    # plain-text keys stay as they were, so existing entries remain valid
+    if response_format != "text":
+        fields.append(response_format)
+    payload = json.dumps(fields, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """SQLite-backed response store with size- and age-based eviction."""
+
+    def __init__(self, path: str = LLM_CACHE_PATH, max_bytes: int = LLM_CACHE_MAX_BYTES, max_age_seconds: int = LLM_CACHE_MAX_AGE_SECONDS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used_at)")
+        self._conn.commit()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.max_age_seconds:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_used_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, response: str):
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created_at, last_used_at) VALUES (?, ?, ?, ?, ?)",
+                (key, response, size, now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.max_age_seconds,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries until we are back under budget
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY last_used_at ASC"
+        ).fetchall():
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": total}
+
+
+@process_singleton
+def get_llm_cache() -> LLMResponseCache:
+    return LLMResponseCache()
@@ -0,0 +1,146 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from singletons import process_singleton
+
+# ─── LLM Request Scheduler ─────────────────────────────────────
+#
+# Every OpenAI call goes through one process-wide scheduler that keeps requests
+# and tokens per minute under budget, hands out capacity round-robin between
+# tenants (users) so one large run cannot starve everyone else, retries
+# transient failures with jittered exponential backoff, and enforces a deadline
+# per call. A rate-limit response pauses all callers, not just the one that hit it.
+
+OPENAI_RPM_LIMIT = int(os.environ.get("OPENAI_RPM_LIMIT", "500"))
+OPENAI_TPM_LIMIT = int(os.environ.get("OPENAI_TPM_LIMIT", "200000"))
+OPENAI_MAX_RETRIES = int(os.environ.get("OPENAI_MAX_RETRIES", "6"))
+# Timeout for a single HTTP attempt, and for a call including all its retries
+OPENAI_REQUEST_TIMEOUT_SECONDS = float(os.environ.get("OPENAI_REQUEST_TIMEOUT_SECONDS", "120"))
+OPENAI_CALL_DEADLINE_SECONDS = float(os.environ.get("OPENAI_CALL_DEADLINE_SECONDS", "600"))
+
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+WINDOW_SECONDS = 60.0
+
+current_tenant = ContextVar("llm_tenant", default="default")
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class RequestScheduler:
+    def __init__(self, rpm: int = OPENAI_RPM_LIMIT, tpm: int = OPENAI_TPM_LIMIT, max_retries: int = OPENAI_MAX_RETRIES,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_retries = max_retries
+        self.clock = clock
+        self.sleep = sleep
+        self._cond = threading.Condition()
+        self._window = deque()  # (granted at, tokens) over the last WINDOW_SECONDS
+        self._window_tokens = 0
+        self._waiting = {}  # tenant -> deque of tickets
+        self._turns = deque()  # tenants with waiters, in round-robin order
+        self._paused_until = 0.0
+
+    def _prune(self, now: float):
+        while self._window and now - self._window[0][0] >= WINDOW_SECONDS:
+            self._window_tokens -= self._window.popleft()[1]
+
+    def _wait_for_capacity(self, tokens: int, now: float) -> float:
+        """Seconds until a request of `tokens` fits in both budgets (0 if it fits now)."""
+        if now < self._paused_until:
+            return self._paused_until - now
+        waits = [0.0]
+        if len(self._window) >= self.rpm:
+            waits.append(self._window[len(self._window) - self.rpm][0] + WINDOW_SECONDS - now)
+        # a request larger than the whole budget is let through on an empty window
+        if self._window and self._window_tokens + tokens > self.tpm:
+            freed = self._window_tokens + tokens - self.tpm
+            for granted_at, n in self._window:
+                freed -= n
+                if freed <= 0:
+                    waits.append(granted_at + WINDOW_SECONDS - now)
+                    break
+        return max(waits)
+
+    def acquire(self, tokens: int, tenant: str, deadline: float):
+        ticket = object()
+        granted = False
+        with self._cond:
+            queue = self._waiting.setdefault(tenant, deque())
+            queue.append(ticket)
+            if tenant not in self._turns:
+                self._turns.append(tenant)
+            try:
+                while True:
+                    now = self.clock()
+                    self._prune(now)
+                    wait = 1.0
+                    if self._turns[0] == tenant and queue[0] is ticket:
+                        wait = self._wait_for_capacity(tokens, now)
+                        if wait <= 0:
+                            self._window.append((now, tokens))
+                            self._window_tokens += tokens
+                            granted = True
+                            return
+                    if now >= deadline:
+                        raise DeadlineExceeded("Timed out waiting for OpenAI rate-limit capacity")
+                    self._wait(min(wait, deadline - now))
+            finally:
+                queue.remove(ticket)
+                if not queue:
+                    self._turns.remove(tenant)
+                    del self._waiting[tenant]
+                elif granted:
+                    # this tenant's turn is over; rotate it to the back
+                    self._turns.remove(tenant)
+                    self._turns.append(tenant)
+                self._cond.notify_all()
+
+    def _wait(self, timeout: float):
+        """Waits, with the lock held, until another caller finishes or `timeout` passes."""
+        self._cond.wait(timeout)
+
+    def pause(self, seconds: float):
+        """Holds back every caller, e.g. after a rate-limit response."""
+        with self._cond:
+            self._paused_until = max(self._paused_until, self.clock() + seconds)
+
+    def call(self, fn, tokens: int, is_retryable, retry_after=None, is_rate_limit=None, deadline_seconds: float = OPENAI_CALL_DEADLINE_SECONDS):
+        """
+        Runs fn(timeout) once budget allows, retrying retryable errors with backoff.
+        `retry_after(error)` may return a server-suggested delay in seconds;
+        `is_rate_limit(error)` marks errors that should pause all callers.
+        """
+        deadline = self.clock() + deadline_seconds
+        tenant = current_tenant.get()
+        attempt = 0
+        while True:
+            self.acquire(tokens, tenant, deadline)
+            remaining = deadline - self.clock()
+            if remaining <= 0:
+                raise DeadlineExceeded("OpenAI call deadline exceeded")
+            try:
+                return fn(min(OPENAI_REQUEST_TIMEOUT_SECONDS, remaining))
+            except Exception as e:
+                attempt += 1
+                if not is_retryable(e) or attempt > self.max_retries:
+                    raise
+                backoff = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempt - 1))
+                delay = (retry_after(e) if retry_after else None) or random.uniform(backoff / 2, backoff)
+                if is_rate_limit and is_rate_limit(e):
+                    self.pause(delay)
+                if self.clock() + delay >= deadline:
+                    raise
+                self.sleep(delay)
+
+
+@process_singleton
+def get_scheduler() -> RequestScheduler:
+    """Shared by every session and background job, so the rate limits are global."""
+    return RequestScheduler()
@@ -5,15 +5,18 @@ from datetime import datetime
 from streamlit_shadcn_ui import metric_card
 from streamlit_lightweight_charts import renderLightweightCharts
 import streamlit_lightweight_charts.dataSamples as data
-from supabase import create_client, Client
+from supabase import Client
 import stripe
 import os
 from menu import menu_with_redirect
+from user_profile import get_profile
+from backend_clients import get_supabase_client
+from stripe_billing import get_subscription
 
 # Initialize Supabase client
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+supabase: Client = get_supabase_client()
 
 # Initialize Stripe
 stripe.api_key = os.environ.get("STRIPE_SECRET_KEY")
@@ -24,48 +27,18 @@ st.set_page_config(page_title="User Dashboard", layout="centered")
 PRICE_10_CREDITS = os.environ.get("stripe_price_id_10_credit_bundle_test")
 PRICE_5_CREDITS = os.environ.get("stripe_price_id_5_credit_bundle_test")
 
-def get_user_supabase_client(access_token: str) -> Client:
-    return create_client(
-        SUPABASE_URL,
-        SUPABASE_KEY,
-        options={
-            "headers": {
-                "Authorization": f"Bearer {access_token}"
-            }
-        }
-    )
-
-access_token = st.session_state["access_token"]
-
-def fetch_profile(user_id: str):
-    user_supabase = get_user_supabase_client(access_token)
-    response = user_supabase.table("profiles").select("*").eq("id", user_id).limit(1).execute()
-    if not response.data:
-        st.error("Error fetching profile data.")
-        return None
-    return response.data
-
 def fetch_stripe_subscription(stripe_customer_id: str):
+    # Cached and kept current by Stripe webhooks, see stripe_billing
     try:
-        subs = stripe.Subscription.list(customer=stripe_customer_id, status='active', limit=1)
-        if subs.data:
-            sub = subs.data[0]
-            price = sub['items']['data'][0]['price']
-            product = stripe.Product.retrieve(price['product'])
-            return {
-                'tier_name': product['name'],
-                'price': price['unit_amount'] / 100,
-                'currency': price['currency'].upper(),
-                'current_period_end': datetime.fromtimestamp(sub['current_period_end']),
-                'subscription_id': sub['id']
-            }
-        else:
-            return None
+        sub = get_subscription(stripe_customer_id)
     except Exception as e:
         st.error(f"Stripe API error: {e}")
         return None
+    if sub is None:
+        return None
+    return {**sub, 'current_period_end': datetime.fromtimestamp(sub['current_period_end'])}
 
-def create_checkout_session(price_id, customer_email):
+def create_checkout_session(price_id, customer_email, user_id):
     try:
         session = stripe.checkout.Session.create(
             payment_method_types=['card'],
@@ -75,6 +48,8 @@ def create_checkout_session(price_id, customer_email):
                 'quantity': 1,
             }],
             mode='payment',
+            # Lets the checkout.session.completed webhook refresh this user's cached profile
+            client_reference_id=user_id,
             success_url=os.environ.get("success_url"),
             cancel_url=os.environ.get("cancel_url"),
         )
@@ -92,7 +67,7 @@ def main():
     user_id = user["id"]
     user_email = user["email"]
 
-    profile = fetch_profile(user_id, access_token)
+    profile = get_profile(st.session_state["access_token"], user_id)
     if not profile:
         st.stop()
 
@@ -122,12 +97,12 @@ def main():
     col1, col2 = st.columns(2)
     with col1:
         if st.button("Buy 10 Credit Bundle ($9.99)"):
-            url = create_checkout_session(PRICE_10_CREDITS, user_email)
+            url = create_checkout_session(PRICE_10_CREDITS, user_email, user_id)
             if url:
                 st.markdown(f"[Click here to complete purchase]({url})")
     with col2:
         if st.button("Buy 5 Credit Bundle ($4.99)"):
-            url = create_checkout_session(PRICE_5_CREDITS, user_email)
+            url = create_checkout_session(PRICE_5_CREDITS, user_email, user_id)
             if url:
                 st.markdown(f"[Click here to complete purchase]({url})")
 
@@ -3,13 +3,19 @@ from menu import menu_with_redirect
 
 st.set_option("client.showSidebarNavigation", False)
 
-# Redirect to app.py if not logged in, otherwise show the navigation menu
-menu_with_redirect()
 
-# Verify the user's role
-if st.session_state.role not in ["admin", "super-admin"]:
-    st.warning("You do not have permission to view this page.")
-    st.stop()
+def main():
+    # Redirect to app.py if not logged in, otherwise show the navigation menu
+    menu_with_redirect()
 
-st.title("Admin Dashboard")
-st.markdown(f"You are currently logged with the role of {st.session_state.role}.")
\ No newline at end of file
+    # Verify the user's role
+    if st.session_state.role not in ["admin", "super-admin"]:
+        st.warning("You do not have permission to view this page.")
+        st.stop()
+
+    st.title("Admin Dashboard")
+    st.markdown(f"You are currently logged with the role of {st.session_state.role}.")
+
+
+if __name__ == "__main__":
+    main()
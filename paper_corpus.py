@@ -0,0 +1,89 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from singletons import process_singleton
+
+# ─── Past Paper Corpus ─────────────────────────────────────────
+#
+# Validated past paper analyses, one entry per paper per course, shared by
+# everyone on that course. Papers are identified by the hash of their PDF
+# bytes: a paper that is already in the corpus is not parsed or sent to the
+# model again. The course key is topic_index.course_for over the uploaded
+# papers' meta (course code, else subject), the same key that names the
+# course's topic index, and trends are computed over every paper filed under
+# it. Entries record the analysis version they were made with, so changing the
+# prompt or schema makes old entries miss instead of being reused.
+
+PAPER_CORPUS_PATH = os.environ.get("PAPER_CORPUS_PATH", os.path.join(".cache", "paper_corpus.sqlite3"))
+
+
+class PaperCorpus:
+    """SQLite store of paper analyses keyed on (course, paper hash, analysis version)."""
+
+    def __init__(self, path: str = PAPER_CORPUS_PATH):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS papers (
+                course TEXT NOT NULL,
+                paper_hash TEXT NOT NULL,
+                version TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                analysis TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (course, paper_hash, version)
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS papers_hash ON papers (paper_hash, version)")
+        self._conn.commit()
+
+    def find(self, paper_hash: str, version: str) -> dict | None:
+        """The stored analysis of a paper under any course; the course is not known before analysis."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT analysis FROM papers WHERE paper_hash = ? AND version = ? LIMIT 1", (paper_hash, version)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def add(self, course: str, paper_hash: str, version: str, filename: str, analysis: dict):
+        """Files a paper under `course`; a paper already there keeps its first entry."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO papers (course, paper_hash, version, filename, analysis, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (course, paper_hash, version, filename, json.dumps(analysis, ensure_ascii=False), time.time()),
+            )
+            self._conn.commit()
+
+    def course_analyses(self, course: str, version: str) -> list[dict]:
+        """Every analysis filed under `course`, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT analysis FROM papers WHERE course = ? AND version = ? ORDER BY created_at", (course, version)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def stats(self) -> dict:
+        with self._lock:
+            papers, courses = self._conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT course) FROM papers"
+            ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "papers": papers, "courses": courses}
+
+
+@process_singleton
+def get_paper_corpus() -> PaperCorpus:
+    return PaperCorpus()
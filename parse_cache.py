@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from disk_cache import prune_cache_dir, touch
+from singletons import process_singleton
+
+# ─── Parsed PDF Cache ──────────────────────────────────────────
+#
+# pdfplumber results keyed on the content hash of the uploaded bytes, so the
+# same handout is only parsed once per process no matter how many reruns or
+# sessions upload it. The in-memory tier is an LRU bounded by approximate
+# size; set PARSE_CACHE_DIR to also keep results on disk across restarts.
+# The disk tier is bounded by PARSE_CACHE_DISK_MAX_BYTES and PARSE_CACHE_MAX_AGE_SECONDS.
+
+PARSE_CACHE_MAX_BYTES = int(os.environ.get("PARSE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+PARSE_CACHE_DIR = os.environ.get("PARSE_CACHE_DIR", "")
+PARSE_CACHE_DISK_MAX_BYTES = int(os.environ.get("PARSE_CACHE_DISK_MAX_BYTES", str(1024 * 1024 * 1024)))
+PARSE_CACHE_MAX_AGE_SECONDS = int(os.environ.get("PARSE_CACHE_MAX_AGE_SECONDS", str(30 * 24 * 3600)))
+
+
+def file_sha256(file) -> str:
+    """Hashes an uploaded file's bytes without moving its read position."""
+    pos = file.tell()
+    file.seek(0)
+    digest = hashlib.sha256()
+    for block in iter(lambda: file.read(1024 * 1024), b""):
+        digest.update(block)
+    file.seek(pos)
+    return digest.hexdigest()
+
+
+class ParseCache:
+    """Size-bounded LRU of JSON-serializable parse results, with an optional disk tier."""
+
+    def __init__(self, max_bytes: int = PARSE_CACHE_MAX_BYTES, disk_dir: str = PARSE_CACHE_DIR):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key.replace(":", "_") + ".json")
+
+    def get(self, key: str):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+        if self.disk_dir and os.path.exists(self._disk_path(key)):
+            try:
+                with open(self._disk_path(key), encoding="utf-8") as f:
+                    encoded = f.read()
+                value = json.loads(encoded)
+            except (OSError, ValueError):
+                value = None
+            if value is not None:
+                touch(self._disk_path(key))
+                self._remember(key, value, len(encoded))
+                with self._lock:
+                    self.hits += 1
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value):
+        encoded = json.dumps(value, ensure_ascii=False)
+        self._remember(key, value, len(encoded))
+        if self.disk_dir:
+            tmp_path = self._disk_path(key) + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(encoded)
+            os.replace(tmp_path, self._disk_path(key))
+            prune_cache_dir(self.disk_dir, PARSE_CACHE_DISK_MAX_BYTES, PARSE_CACHE_MAX_AGE_SECONDS)
+
+    def _remember(self, key: str, value, size: int):
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, old_size) = self._entries.popitem(last=False)
+                self._size -= old_size
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries), "bytes": self._size}
+
+
+@process_singleton
+def get_parse_cache() -> ParseCache:
+    return ParseCache()
+
+
+def cached_parse(kind: str, file, parse):
+    """Returns parse(file), reusing an earlier result for the same bytes and `kind`."""
+    cache = get_parse_cache()
+    key = f"{kind}:{file_sha256(file)}"
+    value = cache.get(key)
+    if value is None:
+        file.seek(0)
+        value = parse(file)
+        cache.set(key, value)
+    return value
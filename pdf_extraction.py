@@ -0,0 +1,232 @@
+import io
+import multiprocessing
+import os
+import re
+import threading
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pdfplumber
+
+# ─── PDF Extraction ────────────────────────────────────────────
+#
+# Page-level layout work is CPU-bound pure Python, so large documents are split
+# into page ranges and extracted in a process pool. Each worker returns per-page
+# positioned lines; heading classification and the stitching into sections
+# always run in the parent over the merged pages, so serial and parallel output
+# are identical.
+
+# Number of extraction processes; 1 keeps everything in-process, 0 uses every core
+PDF_EXTRACTION_WORKERS = int(os.environ.get("PDF_EXTRACTION_WORKERS", "0"))
+# Documents shorter than this are not worth the process start-up and IPC cost:
+# each worker re-parses the whole PDF, and 50 pages on 4 workers ran slower
+# than serial extraction
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get("PDF_PARALLEL_MIN_PAGES", "150"))
+# "single_pass" builds lines from one extract_words() call per page;
+# "text_and_words" takes the line text from extract_text() and only the
+# positions and fonts from extract_words(), at the cost of a second pass
+PDF_LAYOUT_MODE = os.environ.get("PDF_LAYOUT_MODE", "single_pass")
+
+EXCLUDED_SECTION_TITLES = {"contents", "reading list", "readinglist"}
+
+# A line is a heading if its font is this much larger than the body text...
+HEADING_SIZE_RATIO = 1.15
+# ...or it is bold in a non-bold document and no longer than this
+HEADING_MAX_WORDS = 15
+# A gap above a line of more than this many font sizes starts a new paragraph
+PARAGRAPH_GAP_RATIO = 1.6
+
+BOLD_FONT = re.compile(r"bold|black|heavy|semibold", re.IGNORECASE)
+
+
+def clean_text(text: str) -> str:
+    text = unicodedata.normalize("NFC", text)
+    text = "".join(ch for ch in text if unicodedata.category(ch)[0] != "C")
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def words_to_lines(words, y_tolerance: float = 3) -> list[tuple[float, str, float, bool]]:
+    """
+    Groups positioned words into reading-order lines, like extract_text() does.
+    Returns [(top, text, average font size, all bold), ...] sorted by top.
+    """
+    lines, cur, cur_top = [], [], None
+    for w in sorted(words, key=lambda w: (w["top"], w["x0"])):
+        if cur and w["top"] - cur_top > y_tolerance:
+            lines.append(cur)
+            cur = []
+        if not cur:
+            cur_top = w["top"]
+        cur.append(w)
+    if cur:
+        lines.append(cur)
+
+    out = []
+    for line in lines:
+        line.sort(key=lambda w: w["x0"])
+        n_chars = sum(len(w["text"]) for w in line) or 1
+        size = sum(float(w["size"]) * len(w["text"]) for w in line) / n_chars
+        bold = all(BOLD_FONT.search(w["fontname"]) for w in line)
+        out.append((line[0]["top"], " ".join(w["text"] for w in line), size, bold))
+    return out
+
+
+def extract_page_layout(page) -> list[tuple[float, str, float, bool]]:
+    """Positioned lines for one page, from a single layout analysis."""
+    words = page.extract_words(extra_attrs=("size", "fontname"))
+    lines = words_to_lines(words)
+    if PDF_LAYOUT_MODE == "text_and_words":
+        texts = [t for t in (page.extract_text() or "").splitlines() if t.strip()]
+        # both group words by the same 3pt tolerance; keep our own lines if they disagree
+        if len(texts) == len(lines):
+            lines = [(top, text, size, bold) for (top, _, size, bold), text in zip(lines, texts)]
+    return lines
+
+
+def extract_page_range(pdf_bytes: bytes, start: int, stop: int) -> list[list[tuple[float, str, float, bool]]]:
+    """Worker entry point: layout for pages[start:stop] of the given PDF."""
+    with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+        return [extract_page_layout(page) for page in pdf.pages[start:stop]]
+
+
+class HeadingClassifier:
+    """Font-size/bold heading rules, calibrated once against a document's body text."""
+
+    def __init__(self, body_size: float, body_bold: bool):
+        self.body_size = body_size
+        self.body_bold = body_bold
+
+    @classmethod
+    def from_pages(cls, pages) -> "HeadingClassifier":
+        # Body text is whatever size (and weight) covers the most characters
+        sizes, bold_chars, total_chars = {}, 0, 0
+        for lines in pages:
+            for _, text, size, bold in lines:
+                sizes[round(size, 1)] = sizes.get(round(size, 1), 0) + len(text)
+                total_chars += len(text)
+                bold_chars += len(text) if bold else 0
+        body_size = max(sizes, key=sizes.get) if sizes else 0.0
+        return cls(body_size, bold_chars * 2 > total_chars)
+
+    def is_heading(self, text: str, size: float, bold: bool) -> bool:
+        n_words = len(text.split())
+        if n_words > HEADING_MAX_WORDS or not any(ch.isalpha() for ch in text):
+            return False
+        if self.body_size and size >= self.body_size * HEADING_SIZE_RATIO:
+            return True
+        return bold and not self.body_bold
+
+
+def join_paragraphs(paragraphs: list[list[str]]) -> str:
+    """Section body text: whitespace collapsed within paragraphs, which are separated by blank lines."""
+    return "\n\n".join(text for text in (clean_text(" ".join(p)) for p in paragraphs) if text)
+
+
+def stitch_sections(pages) -> list[tuple[str, str]]:
+    classifier = HeadingClassifier.from_pages(pages)
+    sections = []
+    cur_title, cur_body = None, []  # body: paragraphs of lines
+    for lines in pages:
+        prev_top = None
+        for top, text, size, bold in lines:
+            ln = clean_text(text)
+            if not ln:
+                continue
+            if classifier.is_heading(ln, size, bold):
+                if cur_title and not cur_body:
+                    # heading wrapped onto several lines
+                    cur_title = f"{cur_title} {ln}"
+                    continue
+                if cur_title and cur_title.lower().replace(" ","") not in EXCLUDED_SECTION_TITLES:
+                    sections.append((cur_title, join_paragraphs(cur_body)))
+                cur_title, cur_body = ln, []
+            elif not cur_body or (prev_top is not None and top - prev_top > PARAGRAPH_GAP_RATIO * size):
+                cur_body.append([ln])
+            else:
+                cur_body[-1].append(ln)
+            prev_top = top
+
+    if cur_title and cur_title.lower().replace(" ","") not in EXCLUDED_SECTION_TITLES:
+        sections.append((cur_title, join_paragraphs(cur_body)))
+    return sections
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def extraction_worker_count() -> int:
+    return PDF_EXTRACTION_WORKERS or os.cpu_count() or 1
+
+def pool_context():
+    # Never fork: the caller is a multi-threaded job worker, and a forked child
+    # can inherit locks held by other threads. forkserver children come from a
+    # single-threaded server, but like spawn they still import the main script
+    # as __mp_main__, so Streamlit scripts keep their side effects in main().
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context("forkserver")
+        ctx.set_forkserver_preload([__name__])
+        return ctx
+    return multiprocessing.get_context("spawn")
+
+def get_extraction_pool() -> ProcessPoolExecutor:
+    """Process pool shared by every session; started lazily on first large PDF."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=extraction_worker_count(), mp_context=pool_context())
+        return _pool
+
+def discard_extraction_pool(pool: ProcessPoolExecutor):
+    """Drops a broken pool so the next large PDF starts a fresh one."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def extract_pages(pdf_bytes: bytes) -> list[list[tuple[float, str, float, bool]]]:
+    """Per-page layout for the whole document, in page order."""
+    with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+        n_pages = len(pdf.pages)
+        workers = extraction_worker_count()
+        if workers <= 1 or n_pages < PDF_PARALLEL_MIN_PAGES:
+            return [extract_page_layout(page) for page in pdf.pages]
+
+    step = -(-n_pages // workers)
+    pool = get_extraction_pool()
+    try:
+        futures = [
+            pool.submit(extract_page_range, pdf_bytes, start, min(start + step, n_pages))
+            for start in range(0, n_pages, step)
+        ]
+        pages = []
+        for fut in futures:
+            pages.extend(fut.result())
+        return pages
+    except BrokenProcessPool:
+        # a worker died (OOM, segfault in a PDF library); this document runs serially
+        discard_extraction_pool(pool)
+        return extract_page_range(pdf_bytes, 0, n_pages)
+
+
+def parse_sections_from_pdf(file) -> list[tuple[str, str]]:
+    file.seek(0)
+    pdf_bytes = file.read()
+    pages = extract_pages(pdf_bytes)
+    sections = stitch_sections(pages)
+
+    if not sections:
+        # fallback: split by big line breaks, reusing the lines extracted above
+        full = "".join("".join(text + "\n" for _, text, _, _ in lines) for lines in pages)
+        paragraphs = re.split(r"\n{2,}", full)
+        sections = [(f"Part {i+1}", clean_text(p)) for i, p in enumerate(paragraphs) if p.strip()]
+
+    return sections
+
+
+def parse_raw_text_from_pdf(file) -> str:
+    with pdfplumber.open(file) as pdf:
+        raw_text = "".join("\n" + (page.extract_text() or "") for page in pdf.pages)
+    return clean_text(raw_text)
@@ -0,0 +1,921 @@
+import re
+import io
+import hashlib
+import os
+import json
+import queue
+import tempfile
+import contextvars
+import openai
+import plotly.express as px
+import pandas as pd
+from openai import OpenAI
+from pylatex import Document, NoEscape
+from pylatex.package import Package
+from pylatex.utils import escape_latex
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from llm_cache import get_llm_cache, make_cache_key
+from parse_cache import cached_parse, file_sha256
+from pdf_extraction import PDF_LAYOUT_MODE, parse_sections_from_pdf, parse_raw_text_from_pdf
+from chunking import chunk_text, count_tokens, pack_sections
+from llm_scheduler import get_scheduler, current_tenant
+from figure_export import FIGURE_EXPORT_FORMAT, export_figures
+from structured_output import PAPER_ANALYSIS_SCHEMA, ADVICE_SCHEMA, parse_structured
+from trend_aggregation import aggregate_trends, TOP_TOPICS
+from topic_index import get_topic_index, course_for, normalize_course
+from paper_corpus import get_paper_corpus
+from latex_validation import sanitize_latex, validate_latex
+from latex_render import render_pdf_bytes
+
+# Study-material pipeline: extraction, summarization, past paper analysis and
+# PDF rendering. Kept free of Streamlit calls so it can run in a background job.
+
+# ─── OpenAI Setup ──────────────────────────────────────────────
+
+# Retries are handled by the shared scheduler, not per client call
+client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"), max_retries=0)
+OPENAI_MODEL = "gpt-4.1-mini"
+# Upper bound on OpenAI requests in flight at once for a single run
+OPENAI_MAX_CONCURRENT_REQUESTS = int(os.environ.get("OPENAI_MAX_CONCURRENT_REQUESTS", "8"))
+# Sections at or below this many tokens are packed together into shared requests
+SMALL_SECTION_TOKENS = int(os.environ.get("SMALL_SECTION_TOKENS", "500"))
+PACK_MAX_SECTIONS = int(os.environ.get("PACK_MAX_SECTIONS", "8"))
+PACK_TOKEN_BUDGET = int(os.environ.get("PACK_TOKEN_BUDGET", "3000"))
+
+def is_retryable_openai_error(e: Exception) -> bool:
+    return isinstance(e, (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError))
+
+def openai_retry_after(e: Exception) -> float | None:
+    response = getattr(e, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+def create_chat_completion(system: str, user: str, max_tokens: int, temp: float, stream: bool = False, json_mode: bool = False):
+    """chat.completions.create through the shared rate-limit/retry scheduler."""
+    # Budget the prompt plus the most the completion can use
+    tokens = count_tokens(system, OPENAI_MODEL) + count_tokens(user, OPENAI_MODEL) + max_tokens
+    return get_scheduler().call(
+        lambda timeout: client.chat.completions.create(
+            model=OPENAI_MODEL,
+            messages=[
+                {"role": "system", "content": system},
+                {"role": "user", "content": user},
+            ],
+            max_tokens=max_tokens,
+            temperature=temp,
+            stream=stream,
+            response_format={"type": "json_object"} if json_mode else openai.NOT_GIVEN,
+            timeout=timeout,
+        ),
+        tokens,
+        is_retryable=is_retryable_openai_error,
+        retry_after=openai_retry_after,
+        is_rate_limit=lambda e: isinstance(e, openai.RateLimitError),
+    )
+
+def submit_with_context(pool: ThreadPoolExecutor, fn, *args):
+    # Carries the caller's context (e.g. the LLM scheduler tenant) into the worker thread
+    return pool.submit(contextvars.copy_context().run, fn, *args)
+
+class CompletionTruncated(RuntimeError):
+    """The completion stopped at max_tokens (finish_reason "length")."""
+
+def call_openai_system_user(system: str, user: str, max_tokens: int = 512, temp: float = 0.0, json_mode: bool = False, fail_on_truncation: bool = False) -> str:
+    # Only deterministic completions are safe to replay from the cache
+    cache = get_llm_cache() if temp == 0.0 else None
+    if cache:
+        key = make_cache_key(OPENAI_MODEL, system, user, max_tokens, temp, "json" if json_mode else "text")
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    resp = create_chat_completion(system, user, max_tokens, temp, json_mode=json_mode)
+    out = resp.choices[0].message.content.strip()
+    if fail_on_truncation and resp.choices[0].finish_reason == "length":
+        raise CompletionTruncated(f"Completion cut off at {max_tokens} tokens")
+    if cache:
+        cache.set(key, out)
+    return out
+
+def forget_openai_response(system: str, user: str, max_tokens: int = 512, temp: float = 0.0, json_mode: bool = False):
+    """Drops a cached completion, e.g. one that turned out to be unusable, so a retry asks again."""
+    get_llm_cache().delete(make_cache_key(OPENAI_MODEL, system, user, max_tokens, temp, "json" if json_mode else "text"))
+
+STRUCTURED_OUTPUT_ATTEMPTS = int(os.environ.get("STRUCTURED_OUTPUT_ATTEMPTS", "2"))
+
+JSON_REPAIR_PROMPT = """
+Your previous answer, below, does not match the required JSON structure:
+{problems}
+
+Return the complete corrected JSON only.
+"""
+
+def call_openai_structured(system: str, user: str, schema, max_tokens: int = 4000) -> dict:
+    """
+    JSON-mode completion parsed and conformed to `schema` (see structured_output).
+    An invalid answer is sent back once per extra attempt with its problems listed;
+    a repaired answer replaces the broken one in the cache. Raises ValueError if none is valid.
+    """
+    out = call_openai_system_user(system, user, max_tokens, json_mode=True)
+    value, problems = parse_structured(out, schema)
+    for _ in range(STRUCTURED_OUTPUT_ATTEMPTS - 1):
+        if not problems:
+            break
+        prompt = JSON_REPAIR_PROMPT.format(problems="\n".join(f"- {p}" for p in problems))
+        out = call_openai_system_user(system, f"{user}\n\n{prompt}\n{out}", max_tokens, json_mode=True)
+        value, problems = parse_structured(out, schema)
+        if not problems:
+            get_llm_cache().set(make_cache_key(OPENAI_MODEL, system, user, max_tokens, 0.0, "json"), out)
+    if problems:
+        # don't let a retry replay the same broken answer from the cache
+        forget_openai_response(system, user, max_tokens, json_mode=True)
+        raise ValueError(f"Model returned invalid JSON: {problems[0]}")
+    return value
+
+def stream_openai_system_user(system: str, user: str, max_tokens: int = 512, temp: float = 0.0, fail_on_truncation: bool = False):
+    """Same as call_openai_system_user, but yields the completion text as it arrives."""
+    cache = get_llm_cache() if temp == 0.0 else None
+    if cache:
+        key = make_cache_key(OPENAI_MODEL, system, user, max_tokens, temp)
+        cached = cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+
+    # Only opening the stream is retried; a failure mid-stream would duplicate output
+    stream = create_chat_completion(system, user, max_tokens, temp, stream=True)
+    parts = []
+    finish_reason = None
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        finish_reason = chunk.choices[0].finish_reason or finish_reason
+        if delta:
+            parts.append(delta)
+            yield delta
+    if fail_on_truncation and finish_reason == "length":
+        raise CompletionTruncated(f"Completion cut off at {max_tokens} tokens")
+    if cache:
+        cache.set(key, "".join(parts).strip())
+
+def call_openai_system_user_streaming(system: str, user: str, max_tokens: int = 512, temp: float = 0.0, on_delta=None, fail_on_truncation: bool = False) -> str:
+    """Streams the completion into `on_delta(text)` and returns the full text; plain call if no callback."""
+    if on_delta is None:
+        return call_openai_system_user(system, user, max_tokens=max_tokens, temp=temp, fail_on_truncation=fail_on_truncation)
+    parts = []
+    for delta in stream_openai_system_user(system, user, max_tokens=max_tokens, temp=temp, fail_on_truncation=fail_on_truncation):
+        parts.append(delta)
+        on_delta(delta)
+    return "".join(parts).strip()
+
+# ─── PDF Extraction ────────────────────────────────────────────
+
+def extract_sections_from_pdf(file) -> list[tuple[str, str]]:
+    sections = cached_parse(f"sections-v4-{PDF_LAYOUT_MODE}", file, parse_sections_from_pdf)
+    return [(title, body) for title, body in sections]
+
+
+# ─── Multi Past Papers Raw Text Intake ──────────────────────────────
+
+def extract_raw_text_from_pdfs_simple(paper_files) -> list[dict]:
+    """
+    Takes a list of uploaded past paper PDFs.
+    Returns a list of dicts:
+    [
+        {"filename": ..., "raw_text": ...},
+        ...
+    ]
+    """
+    return [extract_raw_text_from_pdf(file) for file in paper_files]
+
+def extract_raw_text_from_pdf(file) -> dict:
+    return {
+        "filename": file.name,
+        "raw_text": cached_parse("raw-text-v1", file, parse_raw_text_from_pdf),
+    }
+
+# ─── Chunking & Summarization ─────────────────────────────────
+
+SYSTEM_PROMPT = """
+You are an expert university-level tutor.
+Your job is to transform each section of raw lecture notes into clear, concise, exam-focused study notes.
+Strictly use only the material provided — do not invent.
+Ignore any sections titled 'Reading List', 'Bibliography' or 'References' - do not summarise these, skip them entirely.
+
+Each output section must contain:
+1. An Overview paragraph (max 5 sentences).
+2. 5–10 Key Concepts as a bullet list.
+3. Step-by-Step Derivations (if any).
+4. Important Equations list — each must have a short descriptive label.
+5. Quick Tips: practical points for students.
+
+Formatting:
+- Use standard LaTeX sectioning commands: \\section, \\subsection.
+- Use only ASCII text outside math.
+- Do not use any custom macros.
+- Use only amsmath/amsfonts.
+- All math must be correctly wrapped: inline $...$ or \\(...\\), block \\begin{equation*}...\\end{equation*} or \\begin{align}...\\end{align}.
+- The output must compile directly in XeLaTeX.
+- Do not output HTML or Markdown.
+"""
+
+def summarize_chunk(title: str, chunk: str, on_delta=None) -> str:
+    user_prompt = f"Section Title: {title}\n\n{chunk}"
+    return call_openai_system_user_streaming(SYSTEM_PROMPT, user_prompt, max_tokens=4000, on_delta=on_delta)
+
+def summarize_section(title: str, body: str) -> str:
+    chunks = chunk_text(body, OPENAI_MODEL)
+    summary_parts = []
+    for chunk in chunks:
+        summary_parts.append(summarize_chunk(title, chunk))
+    final = "\n\n".join(summary_parts)
+    return final
+
+PACKED_SECTIONS_PROMPT = """
+The input below contains {count} separate lecture sections, each introduced by a marker line
+of the form "% ===== SECTION n =====".
+Summarize each section separately, following all the rules above.
+Start each section's output with its marker line copied exactly, on a line of its own, in the same order.
+Do not merge sections and do not skip any marker.
+"""
+
+PACKED_MARKER = "% ===== SECTION {n} ====="
+PACKED_MARKER_RE = re.compile(r"^%+\s*=+\s*SECTION\s+(\d+)\s*=+\s*$", re.MULTILINE)
+
+def split_packed_summary(out: str, count: int) -> list[str] | None:
+    """Splits a packed response back per section; None unless every marker came back in order."""
+    marks = list(PACKED_MARKER_RE.finditer(out))
+    if [int(m.group(1)) for m in marks] != list(range(1, count + 1)):
+        return None
+    parts = [
+        out[m.end():(marks[i + 1].start() if i + 1 < len(marks) else len(out))].strip()
+        for i, m in enumerate(marks)
+    ]
+    return parts if all(parts) else None
+
+def split_partial_packed_summary(out: str) -> dict[int, str]:
+    """Best-effort split of a packed response that is still streaming: {section number: text so far}."""
+    marks = list(PACKED_MARKER_RE.finditer(out))
+    return {
+        int(m.group(1)): out[m.end():(marks[i + 1].start() if i + 1 < len(marks) else len(out))].strip()
+        for i, m in enumerate(marks)
+    }
+
+def summarize_packed_sections(group: list[tuple[str, str]], on_delta=None) -> list[str]:
+    """
+    Summarizes several short sections in one request. Falls back to one request
+    per section if the response was cut off at max_tokens or cannot be split.
+    """
+    blocks = [
+        f"{PACKED_MARKER.format(n=n)}\nSection Title: {title}\n\n{body}"
+        for n, (title, body) in enumerate(group, 1)
+    ]
+    user_prompt = PACKED_SECTIONS_PROMPT.format(count=len(group)) + "\n\n" + "\n\n".join(blocks)
+    try:
+        out = call_openai_system_user_streaming(SYSTEM_PROMPT, user_prompt, max_tokens=8000, on_delta=on_delta, fail_on_truncation=True)
+    except CompletionTruncated:
+        # every marker may be there, but the last section would be cut short
+        out = ""
+    parts = split_packed_summary(out, len(group))
+    if parts is None:
+        parts = [summarize_chunk(title, body) for title, body in group]
+    return parts
+
+def plan_summary_requests(sections: list[tuple[str, str]], pack_small_sections: bool = True) -> list[tuple[list[tuple[int, int]], list[tuple[str, str]]]]:
+    """
+    Splits sections into requests: [(targets, [(title, text), ...]), ...].
+    Each target (section index, part index) receives one output part.
+    Runs of adjacent short sections share a request; everything else is chunked per section.
+    """
+    requests_plan = []
+    run = []
+
+    def flush_run():
+        for group in pack_sections([sections[si] for si in run], OPENAI_MODEL, max_tokens=PACK_TOKEN_BUDGET):
+            for start in range(0, len(group), PACK_MAX_SECTIONS):
+                batch = [run[gi] for gi in group[start:start + PACK_MAX_SECTIONS]]
+                requests_plan.append(([(si, 0) for si in batch], [sections[si] for si in batch]))
+        run.clear()
+
+    for si, (title, body) in enumerate(sections):
+        if pack_small_sections and body.strip() and count_tokens(body, OPENAI_MODEL) <= SMALL_SECTION_TOKENS:
+            run.append(si)
+            continue
+        flush_run()
+        for ci, chunk in enumerate(chunk_text(body, OPENAI_MODEL)):
+            requests_plan.append(([(si, ci)], [(title, chunk)]))
+    flush_run()
+    return requests_plan
+
+LATEX_REPAIR_ATTEMPTS = int(os.environ.get("LATEX_REPAIR_ATTEMPTS", "1"))
+
+LATEX_REPAIR_PROMPT = """
+The LaTeX below was written for the section "{title}" but will not compile:
+{problems}
+
+Return the corrected LaTeX for this section only, with the same content, following all the rules above.
+"""
+
+def ensure_valid_latex(title: str, latex: str) -> str:
+    """
+    Sanitizes a generated section and, if it still would not compile, asks the
+    model to fix just that section. As a last resort the section is typeset as
+    plain text, so one bad section cannot fail the whole PDF.
+    """
+    latex = sanitize_latex(latex)
+    for _ in range(LATEX_REPAIR_ATTEMPTS):
+        problems = validate_latex(latex)
+        if not problems:
+            return latex
+        prompt = LATEX_REPAIR_PROMPT.format(title=title, problems="\n".join(f"- {p}" for p in problems))
+        latex = sanitize_latex(call_openai_system_user(SYSTEM_PROMPT, f"{prompt}\n{latex}", max_tokens=4000))
+    if not validate_latex(latex):
+        return latex
+    return f"\\section*{{{escape_latex(title)}}}\n{escape_latex(latex)}"
+
+def run_summary_request(items: list[tuple[str, str]], on_delta=None) -> list[str]:
+    if len(items) == 1:
+        outputs = [summarize_chunk(*items[0], on_delta=on_delta)]
+    else:
+        outputs = summarize_packed_sections(items, on_delta=on_delta)
+    # Checked as soon as each request finishes, so only a bad section is ever re-requested
+    return [ensure_valid_latex(title, out) for (title, _), out in zip(items, outputs)]
+
+def summary_request_key(items: list[tuple[str, str]]) -> str:
+    return hashlib.sha256(json.dumps(items, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def summarize_sections(sections: list[tuple[str, str]], max_workers: int = OPENAI_MAX_CONCURRENT_REQUESTS, on_progress=None, pack_small_sections: bool = True, on_partial=None, completed: dict = None, on_request_done=None) -> list[tuple[str, str]]:
+    """
+    Summarizes every chunk of every section at once, with at most
+    `max_workers` OpenAI requests in flight. Adjacent short sections are
+    packed into shared requests unless `pack_small_sections` is False.
+    Returns [(title, summary), ...] in the original section order.
+    `on_progress(done, total)` is called from the calling thread after each request.
+    If `on_partial(section index, summary so far)` is given, responses are streamed
+    and it is called from the calling thread as text arrives.
+    `completed` maps summary_request_key() to outputs from an earlier attempt, which are
+    reused instead of re-requested; `on_request_done(key, outputs)` reports new ones.
+    """
+    plan = plan_summary_requests(sections, pack_small_sections)
+    parts = [{} for _ in sections]
+    if not plan:
+        return [(title, "") for title, _ in sections]
+    completed = completed or {}
+
+    # Workers push (request index, delta) here; callbacks only ever run on this thread
+    deltas = queue.Queue()
+    streamed = [""] * len(plan)
+
+    def section_text(si: int) -> str:
+        return "\n\n".join(parts[si][ci] for ci in sorted(parts[si]))
+
+    def publish_partial(ri: int):
+        targets = plan[ri][0]
+        if len(targets) == 1:
+            si, ci = targets[0]
+            parts[si][ci] = streamed[ri].strip()
+            on_partial(si, section_text(si))
+            return
+        for n, text in split_partial_packed_summary(streamed[ri]).items():
+            if 1 <= n <= len(targets):
+                si, ci = targets[n - 1]
+                parts[si][ci] = text
+                on_partial(si, section_text(si))
+
+    done = 0
+    reused = set()
+    error = None
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        futures = {}
+        for ri, (targets, items) in enumerate(plan):
+            outputs = completed.get(summary_request_key(items))
+            if outputs is not None and len(outputs) == len(targets):
+                for (si, ci), out in zip(targets, outputs):
+                    parts[si][ci] = out
+                    reused.add(si)
+                done += 1
+                continue
+            on_delta = (lambda delta, ri=ri: deltas.put((ri, delta))) if on_partial else None
+            futures[submit_with_context(pool, run_summary_request, items, on_delta)] = ri
+
+        if on_partial:
+            for si in sorted(reused):
+                on_partial(si, section_text(si))
+        if on_progress and done:
+            on_progress(done, len(plan))
+
+        pending = set(futures)
+        while pending:
+            finished, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+            dirty = set()
+            while True:
+                try:
+                    ri, delta = deltas.get_nowait()
+                except queue.Empty:
+                    break
+                streamed[ri] += delta
+                dirty.add(ri)
+            for ri in dirty - {futures[f] for f in finished}:
+                publish_partial(ri)
+            for fut in finished:
+                targets, items = plan[futures[fut]]
+                try:
+                    outputs = fut.result()
+                except Exception as e:
+                    # keep collecting the other requests so they can be reused on retry
+                    error = error or e
+                    continue
+                for (si, ci), out in zip(targets, outputs):
+                    parts[si][ci] = out
+                if on_request_done:
+                    on_request_done(summary_request_key(items), outputs)
+                if on_partial:
+                    for si in {si for si, _ in targets}:
+                        on_partial(si, section_text(si))
+                done += 1
+                if on_progress:
+                    on_progress(done, len(plan))
+
+    if error:
+        raise error
+    return [(title, section_text(si)) for si, (title, _) in enumerate(sections)]
+
+# ─── Past Paper Analysis ───────────────────────────────────────
+
+PAST_PAPER_PROMPT = """
+You are a meticulous academic examiner and curriculum analyst.
+
+Your task:
+Given the full raw text of a university-level past exam paper, extract and compile all useful meta information and question-level breakdowns.
+
+**Your output must be a valid, compact JSON with the following structure:**
+
+{
+  "meta": {
+    "institution": "string, if found",
+    "faculty_or_school": "string, if found",
+    "course_code": "string, if found",
+    "subject": "string, if found",
+    "year": "string, if found",
+    "term": "string, if found",
+    "duration": "string, if found",
+    "total_marks": "string, if found",
+    "instructions_summary": "short summary of any instructions",
+    "notes": "any other meta information found"
+  },
+  "structure": {
+    "sections": [
+      {
+        "section_title": "string",
+        "instructions": "string, if any",
+        "questions": [
+          {
+            "question_number": "1",
+            "question_text": "full text of question",
+            "topic_or_area": "your best guess",
+            "question_type": "essay, short answer, calculation, derivation, proof, MCQ, etc.",
+            "marks": "string, if specified"
+          }
+        ]
+      }
+    ]
+  }
+}
+
+**Guidelines:**
+- Be precise. Do not hallucinate details. Only extract what is clearly present.
+- For instructions, interpret any details about how many questions must be answered.
+- If there are no explicit sections, use a single default section called "Main Paper".
+- Always wrap your output in valid JSON, no Markdown.
+- Use sensible defaults: if a field is missing, output `null` or an empty string.
+
+Input starts below:
+"""
+
+
+PAST_PAPER_ADVICE_PROMPT = """
+You are an expert exam strategist.
+
+Below are statistics computed from a course's past exam papers: topic and question-type
+frequencies overall and by year, average questions per paper and marks per question,
+recurring sections and typical instructions.
+
+Based only on these statistics, give practical, concise advice on how a student should prepare.
+
+**Your output must be a single valid JSON with this structure:**
+
+{
+  "useful_tips": ["Practical tip 1", "Practical tip 2", "Practical tip 3"],
+  "possible_exam_strategy": ["How to approach time management", "How to choose questions", "Any other useful advice"]
+}
+
+Statistics below:
+"""
+
+# Stored analyses are only reused while the prompt and schema that made them are unchanged
+PAST_PAPER_ANALYSIS_VERSION = hashlib.sha256(
+    (PAST_PAPER_PROMPT + json.dumps(PAPER_ANALYSIS_SCHEMA, sort_keys=True)).encode("utf-8")
+).hexdigest()[:16]
+
+def analyze_past_paper(file) -> dict:
+    """Parses one past paper PDF and runs PAST_PAPER_PROMPT over it; "analysis" is the validated object."""
+    paper = extract_raw_text_from_pdf(file)
+    try:
+        paper["analysis"] = call_openai_structured(
+            "You are a meticulous academic examiner.",
+            PAST_PAPER_PROMPT + "\n\n" + paper["raw_text"],
+            PAPER_ANALYSIS_SCHEMA,
+            max_tokens=4000
+        )
+    except ValueError as e:
+        raise ValueError(f"Could not analyze {paper['filename']}: {e}") from e
+    return paper
+
+def analyze_past_papers(paper_files, max_workers: int = OPENAI_MAX_CONCURRENT_REQUESTS, on_result=None) -> list[dict]:
+    """
+    Parses and analyzes every paper in its own worker.
+    `on_result(index, paper)` is called from the calling thread as each paper finishes.
+    Returns the analyzed papers in upload order.
+    """
+    results = [None] * len(paper_files)
+    if not paper_files:
+        return []
+    error = None
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        futures = {submit_with_context(pool, analyze_past_paper, f): i for i, f in enumerate(paper_files)}
+        for fut in as_completed(futures):
+            try:
+                paper = fut.result()
+            except Exception as e:
+                # let the other papers finish so their results are not lost
+                error = error or e
+                continue
+            results[futures[fut]] = paper
+            if on_result:
+                on_result(futures[fut], paper)
+    if error:
+        raise error
+    return results
+
+# Group topics with the course's embedding index instead of by spelling alone
+TOPIC_CLUSTERING = os.environ.get("TOPIC_CLUSTERING", "1") != "0"
+
+def analyze_trends(analyses: list[dict], topic_index=None) -> dict:
+    """
+    Trend statistics are aggregated locally (trend_aggregation); only the tips and
+    strategy come from the model, whose input is the bounded summary below rather
+    than the papers themselves, so its cost does not grow with the paper count.
+    """
+    trends = aggregate_trends(analyses, topic_index)
+    summary = {
+        "overall_trends": trends["overall_trends"],
+        "topic_frequencies": trends["topic_frequencies"][:TOP_TOPICS],
+        "question_type_frequencies": trends["question_type_frequencies"],
+        "frequencies_by_year": [
+            {**year, "topics": year["topics"][:TOP_TOPICS]} for year in trends["frequencies_by_year"]
+        ],
+    }
+    advice = call_openai_structured(
+        "You are an expert exam strategist.",
+        PAST_PAPER_ADVICE_PROMPT + json.dumps(summary, ensure_ascii=False, separators=(",", ":")),
+        ADVICE_SCHEMA,
+        max_tokens=1000
+    )
+    return {**trends, **advice}
+
+def build_trend_figures(trends: dict) -> dict:
+    """Plotly figures for the trends report; yearly charts are None when there is no data."""
+    # Topics Bar Chart
+    topic_freqs = trends["topic_frequencies"]
+    topics = [item["topic"] for item in topic_freqs]
+    freqs = [item["frequency"] for item in topic_freqs]
+
+    fig_topics = px.bar(
+        x=topics, y=freqs,
+        labels={'x': 'Topic', 'y': 'Frequency'},
+        title="Frequency of Topics",
+        color_discrete_sequence=px.colors.qualitative.Plotly
+    )
+
+    # Question Types Pie
+    if "question_type_frequencies" in trends:
+        qtypes = [item["type"] for item in trends["question_type_frequencies"]]
+        qtype_freqs = [item["frequency"] for item in trends["question_type_frequencies"]]
+    else:
+        # trends from before local aggregation only list the types
+        qtypes = trends["overall_trends"]["common_question_types"]
+        qtype_freqs = [1] * len(qtypes)
+    fig_qtypes = px.pie(
+        names=qtypes,
+        values=qtype_freqs,
+        title="Common Question Types",
+        color_discrete_sequence=px.colors.qualitative.Plotly
+    )
+
+    # Prepare yearly topic frequencies
+    yearly_topics = []
+    for year_entry in trends.get("frequencies_by_year", []):
+        year = year_entry.get("year", "")
+        for topic_info in year_entry.get("topics", []):
+            yearly_topics.append({
+                "Year": year,
+                "Topic": topic_info.get("topic", ""),
+                "Frequency": topic_info.get("frequency", 0)
+            })
+
+    df_yearly_topics = pd.DataFrame(yearly_topics)
+
+    fig_yearly_topics = None
+    if not df_yearly_topics.empty:
+        fig_yearly_topics = px.bar(
+            df_yearly_topics,
+            x="Year",
+            y="Frequency",
+            color="Topic",
+            barmode="group",
+            title="Frequency of Topics by Year",
+            labels={"Frequency": "Frequency", "Year": "Year", "Topic": "Topic"},
+            width = 900,
+            height = 500,
+            color_discrete_sequence=px.colors.qualitative.Plotly
+        )
+
+        fig_yearly_topics.update_layout(
+            legend=dict(
+                y = -0.2,
+                yanchor = "top",
+                x = 0.5,
+                xanchor = "center"
+            )
+        )
+
+    # Prepare yearly question type frequencies
+    yearly_qtypes = []
+    for year_entry in trends.get("frequencies_by_year", []):
+        year = year_entry.get("year", "")
+        for qtype_info in year_entry.get("question_types", []):
+            yearly_qtypes.append({
+                "Year": year,
+                "Question Type": qtype_info.get("type", ""),
+                "Frequency": qtype_info.get("frequency", 0)
+            })
+
+    df_yearly_qtypes = pd.DataFrame(yearly_qtypes)
+
+    fig_yearly_qtypes = None
+    if not df_yearly_qtypes.empty:
+        fig_yearly_qtypes = px.bar(
+            df_yearly_qtypes,
+            x="Year",
+            y="Frequency",
+            color="Question Type",
+            barmode="group",
+            title="Frequency of Question Types by Year",
+            labels={"Frequency": "Frequency", "Year": "Year", "Question Type": "Question Type"},
+            width = 900,
+            height = 500,
+            color_discrete_sequence=px.colors.qualitative.Plotly
+        )
+
+    return {
+        "topics": fig_topics,
+        "qtypes": fig_qtypes,
+        "yearly_topics": fig_yearly_topics,
+        "yearly_qtypes": fig_yearly_qtypes,
+    }
+
+# File name for each exported figure
+FIGURE_FILENAMES = {
+    "topics": "fig_topics.pdf",
+    "qtypes": "fig_qtypes.pdf",
+    "yearly_topics": "df_yearly_topics.pdf",
+    "yearly_qtypes": "df_yearly_qtypes.pdf",
+}
+
+def export_trend_figures(figures: dict, out_dir: str = None) -> list[str]:
+    tmp_dir = out_dir or tempfile.mkdtemp(dir="/tmp")
+    paths = {}
+    for name, fig in figures.items():
+        if fig is None:
+            continue
+        filename = FIGURE_FILENAMES[name]
+        if FIGURE_EXPORT_FORMAT == "pgf":
+            filename = os.path.splitext(filename)[0] + ".tex"
+        paths[os.path.join(tmp_dir, filename)] = fig
+    return export_figures(paths, "pgf" if FIGURE_EXPORT_FORMAT == "pgf" else "pdf")
+
+# ─── PDF Creation ─────────────────────────────────────────────
+
+def study_document(packages: list[str]) -> Document:
+    doc = Document("study_materials", documentclass="article")
+    for package in packages:
+        doc.packages.append(Package(package))
+    return doc
+
+def create_pdf_with_pylatex(latex_body: str, subject_title: str = "") -> dict:
+    """Renders the study-material PDF in its own scratch directory; returns the PDF bytes and compile timing."""
+    packages = ["amsmath", "amsfonts", "graphicx"]
+    if FIGURE_EXPORT_FORMAT == "pgf":
+        packages.append("pgfplots")
+    doc = study_document(packages)
+    # The title goes in the body so the preamble, and its precompiled format, is shared by every subject
+    if subject_title.strip():
+        doc.append(NoEscape(f"\\title{{{subject_title.strip()}}}"))
+
+    doc.append(NoEscape("\\maketitle"))
+    doc.append(NoEscape(latex_body.strip()))
+
+    return render_pdf_bytes(doc.dumps(), "study_materials")
+
+def build_latex_body(summarized: list[tuple[str, str]], trends: dict | None, saved_figures: list[str]) -> str:
+    # Combine output
+    latex_body = ""
+
+    if summarized:
+        latex_body += "\n\n".join(content for _, content in summarized)
+
+    if trends:
+        latex_body += r"""\newpage
+    \begin{center}
+    \Huge \textbf{Past Paper Trends and Analysis}
+    \end{center}   
+        """
+        #Key Stats
+        latex_body += r"\section*{Key Stats}" + "\n"
+        latex_body += r"\begin{itemize}" + "\n"
+        latex_body += f"\\item  Average questions per paper: {trends['overall_trends']['average_questions_per_paper']}" + "\n"
+        latex_body += f"\\item  Average marks per question: {trends['overall_trends']['average_marks_per_question']}" + "\n"
+        latex_body += r"\end{itemize}" + "\n\n"
+        
+        #Instructions
+        latex_body += r"\section*{Typical Instructions}" + "\n"
+        latex_body += r"\begin{itemize}" + "\n"
+        for instr in trends["overall_trends"]["typical_instructions"]:
+            safe_instr = escape_latex(instr)
+            latex_body += f"\\item {safe_instr}" + "\n"
+        latex_body += r"\end{itemize}" + "\n\n"
+        
+        #Tips
+        latex_body += r"\section*{Useful Tips}" + "\n"
+        latex_body += r"\begin{itemize}" + "\n"
+        for tip in trends["useful_tips"]:
+            safe_tip = escape_latex(tip)
+            latex_body += f"\\item {safe_tip}" + "\n"
+        latex_body += r"\end{itemize}" + "\n\n"
+        
+        #Exam Strategy
+        latex_body += r"\section*{Suggested Exam Strategy}" + "\n"
+        latex_body += r"\begin{itemize}" + "\n"
+        for strat in trends["possible_exam_strategy"]:
+            safe_strat = escape_latex(strat)
+            latex_body += f"\\item {safe_strat}" + "\n"
+        latex_body += r"\end{itemize}" + "\n\n"
+        
+        #Images
+        for fig in saved_figures:
+            # Paths are generated by us; escaping would turn "_" into "\_" and break the lookup.
+            # Absolute, because the document is compiled in a scratch directory.
+            fig = os.path.abspath(fig)
+            if fig.endswith(".tex"):
+                latex_body += "\\begin{center}\n\\input{%s}\n\\end{center}\n" % fig
+            else:
+                latex_body += r"""\begin{center}
+        \includegraphics[width=1.2\textwidth]{%s}
+        \end{center}
+            """ % fig
+
+    return latex_body
+
+# ─── Background Job ───────────────────────────────────────────
+
+STUDY_JOB_KIND = "study_materials"
+
+def open_job_file(path: str, filename: str) -> io.BytesIO:
+    """Loads a saved upload as an in-memory file that still reports its original name."""
+    with open(path, "rb") as f:
+        file = io.BytesIO(f.read())
+    file.name = filename
+    return file
+
+def run_study_job(ctx) -> dict:
+    """
+    Job handler behind "Run Selected Tasks".
+    ctx.params: subject, run_summarization, run_pastpaper, lecture (name, or None),
+    papers [[original filename, saved name], ...] and files {saved name: path}.
+    Every stage checkpoints its output, so a retried job only re-runs what failed.
+    """
+    params = ctx.params
+    files = params.get("files", {})
+    # Share OpenAI capacity fairly between users; each job runs in its own thread
+    current_tenant.set(ctx.user_id)
+    summarized = []
+    papers = []
+    trends = None
+    saved_figures = []
+
+    if params["run_summarization"]:
+        ctx.set_stage("Extracting lecture notes")
+        sections = ctx.checkpointed(
+            "sections",
+            lambda: extract_sections_from_pdf(open_job_file(files[params["lecture"]], params["lecture"])),
+        )
+        sections = [(title, body) for title, body in sections]
+        live = [[title, ""] for title, _ in sections]
+        ctx.publish("sections", live, force=True)
+
+        def show_partial(si, text):
+            live[si][1] = text
+            ctx.publish("sections", live)
+
+        completed = ctx.load_checkpoint("summary_requests", {})
+
+        def save_request(key, outputs):
+            completed[key] = outputs
+            ctx.save_checkpoint("summary_requests", completed)
+
+        ctx.set_stage("Summarizing lecture notes")
+        summarized = summarize_sections(
+            sections,
+            on_progress=lambda done, total: ctx.set_progress(done / total),
+            on_partial=show_partial,
+            completed=dict(completed),
+            on_request_done=save_request,
+        )
+        ctx.publish("sections", [list(s) for s in summarized], force=True)
+
+    if params["run_pastpaper"]:
+        ctx.set_stage("Analyzing past papers")
+        # Analyses saved as raw text by older versions are redone
+        analyses = {k: v for k, v in ctx.load_checkpoint("paper_analyses", {}).items() if isinstance(v, dict)}
+        corpus = get_paper_corpus()
+        paper_files = {saved: open_job_file(files[saved], filename) for filename, saved in params["papers"]}
+        paper_hashes = {saved: file_sha256(f) for saved, f in paper_files.items()}
+        # Papers anyone has uploaded before are taken from the corpus, not analyzed again
+        for saved, paper_hash in paper_hashes.items():
+            if saved not in analyses:
+                stored = corpus.find(paper_hash, PAST_PAPER_ANALYSIS_VERSION)
+                if stored is not None:
+                    analyses[saved] = stored
+        todo = [(filename, saved) for filename, saved in params["papers"] if saved not in analyses]
+        done_papers = [
+            {"filename": filename, "analysis": analyses[saved]}
+            for filename, saved in params["papers"] if saved in analyses
+        ]
+        ctx.publish("papers", done_papers, force=True)
+
+        def show_paper(i, paper):
+            analyses[todo[i][1]] = paper["analysis"]
+            ctx.save_checkpoint("paper_analyses", analyses)
+            done_papers.append({"filename": paper["filename"], "analysis": paper["analysis"]})
+            ctx.publish("papers", done_papers, force=True)
+            ctx.set_progress(len(done_papers) / len(params["papers"]))
+
+        analyze_past_papers([paper_files[saved] for _, saved in todo], on_result=show_paper)
+        papers = [
+            {"filename": filename, "analysis": analyses[saved]}
+            for filename, saved in params["papers"]
+        ]
+
+        ctx.set_stage("Analyzing past paper trends")
+        course = course_for(
+            [p["analysis"] for p in papers],
+            f"user:{ctx.user_id}:{normalize_course(params['subject'])}",
+        )
+        for filename, saved in params["papers"]:
+            corpus.add(course, paper_hashes[saved], PAST_PAPER_ANALYSIS_VERSION, filename, analyses[saved])
+        # Trends cover every paper of the course, including ones other students uploaded
+        trends = ctx.checkpointed("trends", lambda: analyze_trends(
+            corpus.course_analyses(course, PAST_PAPER_ANALYSIS_VERSION),
+            get_topic_index(course) if TOPIC_CLUSTERING else None,
+        ))
+
+        ctx.set_stage("Exporting figures")
+        saved_figures = ctx.load_checkpoint("figures")
+        if saved_figures is None or not all(os.path.exists(p) for p in saved_figures):
+            saved_figures = export_trend_figures(build_trend_figures(trends), os.path.join(ctx.work_dir, "figures"))
+            ctx.save_checkpoint("figures", saved_figures)
+
+    latex_body = build_latex_body(summarized, trends, saved_figures)
+    pdf_path = None
+    pdf_compile_seconds = None
+    if summarized or latex_body:
+        ctx.set_stage("Rendering PDF")
+        try:
+            render = create_pdf_with_pylatex(latex_body, params["subject"])
+        except Exception as e:
+            raise RuntimeError(f"PDF generation failed: {e}") from e
+        pdf_compile_seconds = round(render["seconds"], 3)
+        pdf_path = os.path.join(ctx.work_dir, "study_materials.pdf")
+        with open(pdf_path, "wb") as f:
+            f.write(render["pdf_bytes"])
+
+    return {
+        "summaries": [list(s) for s in summarized],
+        "papers": papers,
+        "trends": trends,
+        "pdf_path": pdf_path,
+        "pdf_compile_seconds": pdf_compile_seconds,
+    }
@@ -0,0 +1,118 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from singletons import process_singleton
+
+# ─── Shared Profile Cache ─────────────────────────────────────
+#
+# Profiles from the get-profile Edge Function, cached in SQLite by user id so
+# every session and process (the Streamlit app and stripe_webhooks.py) sees
+# the same copy. Purchases and subscription changes complete on Stripe, so the
+# webhook marks the user's entry as changed; the next read re-fetches, and keeps
+# re-fetching (at most every PROFILE_PENDING_RETRY_SECONDS) until the profile
+# actually differs, since the webhook can arrive before the credits are written.
+# A checkout that is abandoned sends no event and costs nothing.
+
+PROFILE_CACHE_PATH = os.environ.get("PROFILE_CACHE_PATH", os.path.join(".cache", "profiles.sqlite3"))
+PROFILE_CACHE_TTL_SECONDS = float(os.environ.get("PROFILE_CACHE_TTL_SECONDS", "300"))
+# How long after a purchase event to keep re-fetching until the change shows up
+PROFILE_PENDING_CHANGE_SECONDS = float(os.environ.get("PROFILE_PENDING_CHANGE_SECONDS", "300"))
+PROFILE_PENDING_RETRY_SECONDS = 2.0
+
+
+class ProfileCache:
+    """SQLite map of user id -> profile, with a pending-change window set by webhooks."""
+
+    def __init__(self, path: str = PROFILE_CACHE_PATH, ttl_seconds: float = PROFILE_CACHE_TTL_SECONDS):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS profiles (
+                user_id TEXT PRIMARY KEY,
+                customer_id TEXT,
+                profile TEXT,
+                fetched_at REAL NOT NULL DEFAULT 0,
+                pending_until REAL NOT NULL DEFAULT 0
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS profiles_customer ON profiles (customer_id)")
+        self._conn.commit()
+
+    def get(self, user_id: str) -> dict | None:
+        """The cached profile, or None when it is missing, expired or due for a re-fetch."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT profile, fetched_at, pending_until FROM profiles WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        if row is None or row[0] is None or now - row[1] >= self.ttl_seconds:
+            return None
+        if now < row[2] and now - row[1] >= PROFILE_PENDING_RETRY_SECONDS:
+            return None
+        return json.loads(row[0])
+
+    def set(self, user_id: str, profile: dict):
+        """Stores a freshly fetched profile; a pending change ends once the profile differs."""
+        encoded = json.dumps(profile, sort_keys=True)
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO profiles (user_id, customer_id, profile, fetched_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    pending_until = CASE WHEN profiles.profile IS NULL OR profiles.profile IS excluded.profile
+                        THEN profiles.pending_until ELSE 0 END,
+                    customer_id = excluded.customer_id, profile = excluded.profile, fetched_at = excluded.fetched_at
+                """,
+                (user_id, profile.get("stripe_customer_id"), encoded, time.time()),
+            )
+            self._conn.commit()
+
+    def update(self, user_id: str, **fields):
+        """Applies a change this app has just made (e.g. the credits left after a deduction)."""
+        with self._lock:
+            row = self._conn.execute("SELECT profile FROM profiles WHERE user_id = ?", (user_id,)).fetchone()
+            if row is None or row[0] is None:
+                return
+            profile = {**json.loads(row[0]), **fields}
+            self._conn.execute(
+                "UPDATE profiles SET profile = ?, customer_id = ? WHERE user_id = ?",
+                (json.dumps(profile, sort_keys=True), profile.get("stripe_customer_id"), user_id),
+            )
+            self._conn.commit()
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM profiles WHERE user_id = ?", (user_id,))
+            self._conn.commit()
+
+    def expect_change(self, user_id: str = None, customer_id: str = None):
+        """Marks a user's profile as about to change; called for Stripe events."""
+        pending_until = time.time() + PROFILE_PENDING_CHANGE_SECONDS
+        with self._lock:
+            if user_id:
+                self._conn.execute(
+                    """
+                    INSERT INTO profiles (user_id, customer_id, pending_until) VALUES (?, ?, ?)
+                    ON CONFLICT (user_id) DO UPDATE SET pending_until = excluded.pending_until
+                    """,
+                    (user_id, customer_id, pending_until),
+                )
+            elif customer_id:
+                self._conn.execute(
+                    "UPDATE profiles SET pending_until = ? WHERE customer_id = ?", (pending_until, customer_id)
+                )
+            self._conn.commit()
+
+
+@process_singleton
+def get_profile_cache() -> ProfileCache:
+    return ProfileCache()
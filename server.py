@@ -3,13 +3,16 @@ import streamlit as st
 from supabase import create_client, Client
 import stripe
 from dotenv import load_dotenv
+from stripe_billing import get_subscription
 
 load_dotenv()
 
 # Initialize Supabase client
 SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Profile writes go through apply_profile_changes, which only the service role may
+# call; SUPABASE_KEY is the anon key the browser login uses and is not enough
+SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
 
 # Initialize Stripe client
 stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
@@ -20,62 +23,73 @@ STRIPE_PRICE_ID_10_CREDITS = os.getenv("STRIPE_PRICE_ID_10_CREDITS")
 STRIPE_SUBSCRIPTION_PRICE_ID_MONTHLY = os.getenv("STRIPE_SUBSCRIPTION_PRICE_ID_MONTHLY")
 # Add more if needed
 
+# Changes sent per apply_profile_changes call; bigger backfills are split into several
+PROFILE_BATCH_SIZE = int(os.getenv("PROFILE_BATCH_SIZE", "1000"))
+
+def apply_profile_changes(changes: list[dict]) -> list[dict]:
+    """
+    Applies [{"user_id", "credits"?, "is_subscribed"?}, ...] with the
+    apply_profile_changes RPC (supabase/migrations): credits are added, flags
+    replaced and missing profiles created, atomically and in one round-trip per
+    PROFILE_BATCH_SIZE changes. Needs the service role key. Returns the updated profiles.
+    """
+    profiles = []
+    for start in range(0, len(changes), PROFILE_BATCH_SIZE):
+        response = supabase.rpc("apply_profile_changes", {"changes": changes[start:start + PROFILE_BATCH_SIZE]}).execute()
+        profiles += response.data or []
+    return profiles
+
 def ensure_user_in_profiles(user_id: str):
     """Make sure the user exists in the profiles table, if not create with defaults."""
-    response = supabase.table("profiles").select("*").eq("id", user_id).execute()
-    if not response.data:
-        # User doesn't exist, insert new profile
-        insert_resp = supabase.table("profiles").insert({
+    try:
+        # Inserts only if missing; the response holds the row only when it was created
+        response = supabase.table("profiles").upsert({
             "id": user_id,
             "credits": 0,
             "is_subscribed": False
-        }).execute()
-        if insert_resp.error:
-            st.error(f"Error creating user profile: {insert_resp.error.message}")
-        else:
-            st.success("User profile created.")
-    return
+        }, on_conflict="id", ignore_duplicates=True).execute()
+    except Exception as e:
+        st.error(f"Error creating user profile: {e}")
+        return
+    if response.data:
+        st.success("User profile created.")
 
 def update_subscription_status(user_id: str, subscribed: bool):
     """Update is_subscribed flag for the user."""
-    response = supabase.table("profiles").update({
-        "is_subscribed": subscribed
-    }).eq("id", user_id).execute()
-    if response.error:
-        st.error(f"Error updating subscription status: {response.error.message}")
-    return
+    try:
+        profiles = apply_profile_changes([{"user_id": user_id, "is_subscribed": subscribed}])
+    except Exception as e:
+        st.error(f"Error updating subscription status: {e}")
+        return
+    if not profiles:
+        st.error("Error updating subscription status: no profile was updated.")
 
 def add_credits(user_id: str, credits_to_add: float):
     """Add credits to the user profile."""
-    profile_resp = supabase.table("profiles").select("credits").eq("id", user_id).single().execute()
-    if profile_resp.error:
-        st.error(f"Error fetching user credits: {profile_resp.error.message}")
+    try:
+        profiles = apply_profile_changes([{"user_id": user_id, "credits": credits_to_add}])
+    except Exception as e:
+        st.error(f"Error updating credits: {e}")
+        return
+    if not profiles:
+        st.error("Error updating credits: no profile was updated.")
         return
-    current_credits = profile_resp.data.get("credits", 0) or 0
-    new_credits = current_credits + credits_to_add
-    update_resp = supabase.table("profiles").update({"credits": new_credits}).eq("id", user_id).execute()
-    if update_resp.error:
-        st.error(f"Error updating credits: {update_resp.error.message}")
-    else:
-        st.success(f"Added {credits_to_add} credits. New total: {new_credits}")
+    st.success(f"Added {credits_to_add} credits. New total: {profiles[0]['credits']}")
 
 def is_user_subscribed(stripe_customer_id: str) -> bool:
     """Check via Stripe if user has an active subscription."""
     try:
-        subscriptions = stripe.Subscription.list(customer=stripe_customer_id, status='all', limit=100)
-        for sub in subscriptions.auto_paging_iter():
-            if sub.status == 'active':
-                return True
-        return False
+        return get_subscription(stripe_customer_id) is not None
     except Exception as e:
         st.error(f"Stripe API error: {e}")
         return False
 
 def get_user_profile(user_id: str):
     """Fetch user profile from Supabase."""
-    resp = supabase.table("profiles").select("*").eq("id", user_id).single().execute()
-    if resp.error:
-        st.error(f"Error fetching user profile: {resp.error.message}")
+    try:
+        resp = supabase.table("profiles").select("*").eq("id", user_id).single().execute()
+    except Exception as e:
+        st.error(f"Error fetching user profile: {e}")
         return None
     return resp.data
 
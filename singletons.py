@@ -0,0 +1,24 @@
+import functools
+import threading
+
+# ─── Process-Wide Singletons ───────────────────────────────────
+#
+# Caches, clients, the scheduler and the embedder are created on first use and
+# then shared by every Streamlit session, rerun and background job in the
+# process. Creation happens under a lock, so racing first callers still build
+# only one instance (which matters for model loads and SQLite setup).
+
+
+def process_singleton(factory):
+    """Decorator: the first call runs `factory`; every later call returns that result."""
+    lock = threading.Lock()
+    instance = []
+
+    @functools.wraps(factory)
+    def get():
+        with lock:
+            if not instance:
+                instance.append(factory())
+            return instance[0]
+
+    return get
@@ -0,0 +1,184 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import stripe
+from profile_cache import get_profile_cache
+from singletons import process_singleton
+
+# ─── Stripe Subscription Cache ────────────────────────────────
+#
+# A customer's active subscription, as the dashboard shows it, cached in
+# SQLite by stripe_customer_id so page loads do not wait on the Stripe API.
+# The cache is kept current by subscription webhooks (see stripe_webhooks.py,
+# which may run in another process); the TTL only bounds how long a missed
+# event can go unnoticed. A miss costs one Subscription.list call with the
+# product expanded, and product details are memoized for the process lifetime.
+# The same events, and completed checkouts, also mark the user's cached profile
+# as changed (profile_cache), since credits and plans are bought on Stripe.
+
+STRIPE_SUBSCRIPTION_CACHE_PATH = os.environ.get(
+    "STRIPE_SUBSCRIPTION_CACHE_PATH", os.path.join(".cache", "stripe_subscriptions.sqlite3")
+)
+STRIPE_SUBSCRIPTION_CACHE_TTL_SECONDS = float(os.environ.get("STRIPE_SUBSCRIPTION_CACHE_TTL_SECONDS", "3600"))
+
+SUBSCRIPTION_EVENTS = {
+    "customer.subscription.created",
+    "customer.subscription.updated",
+    "customer.subscription.deleted",
+    "customer.subscription.paused",
+    "customer.subscription.resumed",
+}
+
+
+class SubscriptionCache:
+    """
+    SQLite map of stripe_customer_id -> subscription state (None: no active
+    subscription). Each entry records the time it describes, so webhook events
+    delivered out of order never overwrite newer state.
+    """
+
+    def __init__(self, path: str = STRIPE_SUBSCRIPTION_CACHE_PATH, ttl_seconds: float = STRIPE_SUBSCRIPTION_CACHE_TTL_SECONDS):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS subscriptions (
+                customer_id TEXT PRIMARY KEY,
+                state TEXT,
+                as_of REAL NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def get(self, customer_id: str) -> tuple[bool, dict | None, float]:
+        """(found, state, as_of); found is False when there is no fresh entry, as_of is 0 without one."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state, as_of, expires_at FROM subscriptions WHERE customer_id = ?", (customer_id,)
+            ).fetchone()
+        if row is None:
+            return False, None, 0.0
+        if time.time() >= row[2]:
+            return False, None, row[1]
+        return True, json.loads(row[0]) if row[0] is not None else None, row[1]
+
+    def set(self, customer_id: str, state: dict | None, as_of: float):
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO subscriptions (customer_id, state, as_of, expires_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (customer_id) DO UPDATE SET
+                    state = excluded.state, as_of = excluded.as_of, expires_at = excluded.expires_at
+                WHERE excluded.as_of >= subscriptions.as_of
+                """,
+                (customer_id, json.dumps(state) if state is not None else None, as_of, time.time() + self.ttl_seconds),
+            )
+            self._conn.commit()
+
+    def invalidate(self, customer_id: str, as_of: float):
+        """Marks the entry stale so the next read asks Stripe, unless it is already newer than `as_of`."""
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO subscriptions (customer_id, state, as_of, expires_at) VALUES (?, NULL, ?, 0)
+                ON CONFLICT (customer_id) DO UPDATE SET as_of = excluded.as_of, expires_at = 0
+                WHERE excluded.as_of >= subscriptions.as_of
+                """,
+                (customer_id, as_of),
+            )
+            self._conn.commit()
+
+
+@process_singleton
+def get_subscription_cache() -> SubscriptionCache:
+    return SubscriptionCache()
+
+
+# ─── Products ─────────────────────────────────────────────────
+
+_products = {}  # product id -> {"id", "name"}
+_products_lock = threading.Lock()
+
+def remember_product(product) -> dict:
+    info = {"id": product["id"], "name": product["name"]}
+    with _products_lock:
+        _products[info["id"]] = info
+    return info
+
+
+def get_product(product) -> dict:
+    """Product details from an expanded product object or an ID; IDs are looked up once per process."""
+    if not isinstance(product, str):
+        return remember_product(product)
+    with _products_lock:
+        if product in _products:
+            return _products[product]
+    return remember_product(stripe.Product.retrieve(product))
+
+
+# ─── Subscriptions ────────────────────────────────────────────
+
+def subscription_state(sub) -> dict:
+    price = sub["items"]["data"][0]["price"]
+    return {
+        "subscription_id": sub["id"],
+        "tier_name": get_product(price["product"])["name"],
+        "price": price["unit_amount"] / 100,
+        "currency": price["currency"].upper(),
+        "current_period_end": sub["current_period_end"],
+    }
+
+
+def fetch_subscription(customer_id: str) -> dict | None:
+    """The customer's active subscription straight from Stripe, in one API call."""
+    subs = stripe.Subscription.list(
+        customer=customer_id, status="active", limit=1, expand=["data.items.data.price.product"]
+    )
+    return subscription_state(subs.data[0]) if subs.data else None
+
+
+def get_subscription(customer_id: str) -> dict | None:
+    """
+    The customer's active subscription ({"subscription_id", "tier_name", "price",
+    "currency", "current_period_end"} with a Unix timestamp), or None. Stripe
+    errors propagate; nothing is cached for them.
+    """
+    cache = get_subscription_cache()
+    found, state, as_of = cache.get(customer_id)
+    if not found:
+        # Newer than what was cached, but older than any event that arrives while
+        # Stripe is being asked (event times are whole seconds, hence the margin)
+        as_of = max(as_of, time.time() - 1)
+        state = fetch_subscription(customer_id)
+        cache.set(customer_id, state, as_of)
+    return state
+
+
+def handle_stripe_event(event) -> bool:
+    """Applies a verified webhook event to the caches; returns whether it was one this app uses."""
+    if event["type"] == "checkout.session.completed":
+        session = event["data"]["object"]
+        # client_reference_id is the user id the Dashboard puts on the session
+        get_profile_cache().expect_change(session.get("client_reference_id"), session.get("customer"))
+        return True
+    if event["type"] not in SUBSCRIPTION_EVENTS:
+        return False
+    sub = event["data"]["object"]
+    customer_id = sub["customer"]
+    get_profile_cache().expect_change(customer_id=customer_id)
+    cache = get_subscription_cache()
+    if sub["status"] == "active" and event["type"] != "customer.subscription.deleted":
+        cache.set(customer_id, subscription_state(sub), event["created"])
+    else:
+        # The customer may have another active subscription; look it up on the next read
+        cache.invalidate(customer_id, event["created"])
+    return True
@@ -0,0 +1,76 @@
+import logging
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import stripe
+from stripe_billing import handle_stripe_event
+
+# ─── Stripe Webhook Receiver ──────────────────────────────────
+#
+# A small HTTP endpoint for Stripe events, run next to the Streamlit app:
+#
+#     python stripe_webhooks.py
+#
+# and registered in Stripe (or forwarded locally with
+# `stripe listen --forward-to localhost:8081/stripe/webhook`). Signatures are
+# checked with STRIPE_ENDPOINT_SECRET; subscription events update the shared
+# subscription cache (stripe_billing), and those and checkout.session.completed
+# mark the buyer's cached profile as changed (profile_cache), so the dashboard
+# never has to poll.
+
+STRIPE_ENDPOINT_SECRET = os.environ.get("STRIPE_ENDPOINT_SECRET")
+STRIPE_WEBHOOK_HOST = os.environ.get("STRIPE_WEBHOOK_HOST", "0.0.0.0")
+STRIPE_WEBHOOK_PORT = int(os.environ.get("STRIPE_WEBHOOK_PORT", "8081"))
+STRIPE_WEBHOOK_PATH = "/stripe/webhook"
+# Stripe events are a few KB; anything far larger is not one
+MAX_EVENT_BYTES = 1024 * 1024
+
+stripe.api_key = os.environ.get("STRIPE_SECRET_KEY")
+
+logger = logging.getLogger(__name__)
+
+
+class StripeWebhookHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        if self.path != STRIPE_WEBHOOK_PATH:
+            self.send_response(404)
+            self.end_headers()
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_EVENT_BYTES:
+            self.send_response(413)
+            self.end_headers()
+            return
+        payload = self.rfile.read(length)
+        try:
+            event = stripe.Webhook.construct_event(payload, self.headers.get("Stripe-Signature", ""), STRIPE_ENDPOINT_SECRET)
+        except (ValueError, stripe.error.SignatureVerificationError) as e:
+            logger.warning("Rejected Stripe webhook: %s", e)
+            self.send_response(400)
+            self.end_headers()
+            return
+        try:
+            handle_stripe_event(event)
+        except Exception:
+            # A non-2xx answer makes Stripe deliver the event again later
+            logger.exception("Failed to handle Stripe event %s", event["id"])
+            self.send_response(500)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+def serve():
+    if not STRIPE_ENDPOINT_SECRET:
+        raise SystemExit("STRIPE_ENDPOINT_SECRET is not set")
+    server = ThreadingHTTPServer((STRIPE_WEBHOOK_HOST, STRIPE_WEBHOOK_PORT), StripeWebhookHandler)
+    logger.info("Listening for Stripe webhooks on %s:%d%s", STRIPE_WEBHOOK_HOST, STRIPE_WEBHOOK_PORT, STRIPE_WEBHOOK_PATH)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    serve()
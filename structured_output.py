@@ -0,0 +1,130 @@
+import json
+import re
+
+# ─── Structured Model Output ───────────────────────────────────
+#
+# JSON answers are parsed leniently (code fences and chatter around the object
+# are ignored) and then checked against a small schema that also normalizes
+# them: numbers where strings are expected become strings, null becomes an
+# empty value, and optional keys are filled in. The problems found are phrased
+# so they can be sent straight back to the model in a repair request.
+#
+# Schema notation: {"key": spec} is an object ("key?" marks an optional key),
+# [spec] a list, and "str", "int", "number" or "scalar" (str or number) a value.
+
+PAPER_ANALYSIS_SCHEMA = {
+    "meta": {
+        "institution?": "str",
+        "faculty_or_school?": "str",
+        "course_code?": "str",
+        "subject?": "str",
+        "year?": "str",
+        "term?": "str",
+        "duration?": "str",
+        "total_marks?": "str",
+        "instructions_summary?": "str",
+        "notes?": "str",
+    },
+    "structure": {
+        "sections": [{
+            "section_title?": "str",
+            "instructions?": "str",
+            "questions": [{
+                "question_number": "str",
+                "question_text?": "str",
+                "topic_or_area": "str",
+                "question_type": "str",
+                "marks?": "str",
+            }],
+        }],
+    },
+}
+
+ADVICE_SCHEMA = {
+    "useful_tips": ["str"],
+    "possible_exam_strategy": ["str"],
+}
+
+CODE_FENCE_RE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$")
+
+
+def parse_json_response(text: str):
+    """json.loads that tolerates a Markdown fence or text around the outermost object."""
+    text = CODE_FENCE_RE.sub("", text.strip())
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        start, end = text.find("{"), text.rfind("}")
+        if start < 0 or end <= start:
+            raise
+        return json.loads(text[start:end + 1])
+
+
+def empty_value(spec):
+    if isinstance(spec, dict):
+        return {key.rstrip("?"): empty_value(sub) for key, sub in spec.items()}
+    if isinstance(spec, list):
+        return []
+    return "" if spec in ("str", "scalar") else 0
+
+
+def conform(value, spec, path: str = "$") -> tuple[object, list[str]]:
+    """Returns (normalized value, problems) for `value` checked against `spec`."""
+    if isinstance(spec, dict):
+        if not isinstance(value, dict):
+            return empty_value(spec), [f"{path}: expected an object"]
+        out, problems = {}, []
+        for key, sub in spec.items():
+            name = key.rstrip("?")
+            if value.get(name) is None:
+                if not key.endswith("?") and name not in value:
+                    problems.append(f"{path}.{name}: missing")
+                out[name] = empty_value(sub)
+                continue
+            out[name], errors = conform(value[name], sub, f"{path}.{name}")
+            problems += errors
+        return out, problems
+
+    if isinstance(spec, list):
+        if value is None:
+            return [], []
+        if not isinstance(value, list):
+            return [], [f"{path}: expected a list"]
+        out, problems = [], []
+        for i, item in enumerate(value):
+            item, errors = conform(item, spec[0], f"{path}[{i}]")
+            out.append(item)
+            problems += errors
+        return out, problems
+
+    if value is None:
+        return empty_value(spec), []
+    is_number = isinstance(value, (int, float)) and not isinstance(value, bool)
+    if spec == "str":
+        if isinstance(value, str) or is_number:
+            return str(value), []
+    elif spec == "scalar":
+        if isinstance(value, str) or is_number:
+            return value, []
+    elif spec in ("int", "number"):
+        number = value if is_number else None
+        if isinstance(value, str):
+            try:
+                number = float(value.strip())
+            except ValueError:
+                pass
+        if number is not None:
+            return (round(number) if spec == "int" else number), []
+    return empty_value(spec), [f"{path}: expected {spec}, got {type(value).__name__}"]
+
+
+def parse_structured(text: str, schema) -> tuple[object, list[str]]:
+    """Parses and conforms a JSON answer; on unparseable text returns (None, [reason])."""
+    try:
+        value = parse_json_response(text)
+    except json.JSONDecodeError as e:
+        return None, [f"not valid JSON ({e.msg} at line {e.lineno}); the answer may have been cut off"]
+    value, problems = conform(value, schema)
+    # the first few are enough for a repair request
+    return value, problems[:20]
+
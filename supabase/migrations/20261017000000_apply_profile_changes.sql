@@ -0,0 +1,48 @@
+-- Atomic, batched profile writes for server.py.
+--
+-- apply_profile_changes takes a JSON array of changes:
+--   [{"user_id": "<uuid>", "credits": 5}, {"user_id": "<uuid>", "is_subscribed": true}, ...]
+-- "credits" is added to the current balance and "is_subscribed", when present,
+-- replaces the flag; several changes for one user are merged (credits summed,
+-- the last flag wins). Missing profiles are created with the defaults. The
+-- whole batch is one INSERT ... ON CONFLICT, so concurrent grants never lose
+-- an update and any number of changes costs a single round-trip.
+-- Returns the resulting rows.
+
+create or replace function public.apply_profile_changes(changes jsonb)
+returns setof public.profiles
+language sql
+security definer
+set search_path = public
+as $$
+  with raw as (
+    select
+      (c ->> 'user_id')::uuid as user_id,
+      coalesce((c ->> 'credits')::numeric, 0) as credits,
+      (c ->> 'is_subscribed')::boolean as is_subscribed,
+      ord
+    from jsonb_array_elements(changes) with ordinality as t(c, ord)
+  ),
+  merged as (
+    select
+      user_id,
+      sum(credits) as credits,
+      (array_agg(is_subscribed order by ord desc) filter (where is_subscribed is not null))[1] as is_subscribed
+    from raw
+    group by user_id
+  )
+  insert into public.profiles as p (id, credits, is_subscribed)
+  select user_id, credits, coalesce(is_subscribed, false)
+  from merged
+  on conflict (id) do update set
+    credits = coalesce(p.credits, 0) + excluded.credits,
+    is_subscribed = coalesce(
+      (select m.is_subscribed from merged m where m.user_id = excluded.id),
+      p.is_subscribed
+    )
+  returning p.*;
+$$;
+
+-- Grants credits, so only the service role may call it
+revoke execute on function public.apply_profile_changes(jsonb) from public, anon, authenticated;
+grant execute on function public.apply_profile_changes(jsonb) to service_role;
@@ -0,0 +1,42 @@
+from chunking import chunk_text, count_tokens, split_units
+
+MODEL = "gpt-4.1-mini"
+
+
+def paragraph(word, sentences=6):
+    return " ".join(f"The {word} sentence number {i} says something." for i in range(sentences))
+
+
+def test_display_math_is_one_unit():
+    text = "Energy is conserved. $$E = mc^2. \\\\ F = ma.$$ Then \\begin{align*} a &= b. \\\\ c &= d. \\end{align*} Done."
+    units = [u for u, _ in split_units(text)]
+    assert "$$E = mc^2. \\\\ F = ma.$$" in units
+    assert "\\begin{align*} a &= b. \\\\ c &= d. \\end{align*}" in units
+
+
+def test_chunks_never_end_inside_display_math():
+    maths = ["$$\\sum_{n=1}^{N} n = \\frac{N(N+1)}{2}. \\quad Next line.$$",
+             "\\begin{equation} \\nabla \\cdot E = \\rho. \\qquad Then. \\end{equation}",
+             "\\[ x = 1. \\quad y = 2. \\]"]
+    text = " ".join(paragraph(f"w{i}", 3) + " " + maths[i % 3] for i in range(12))
+    for chunk in chunk_text(text, MODEL, max_tokens=120, overlap=20):
+        assert chunk.count("$$") % 2 == 0
+        assert chunk.count("\\begin{equation}") == chunk.count("\\end{equation}")
+        assert chunk.count("\\[") == chunk.count("\\]")
+        assert count_tokens(chunk, MODEL) <= 120 + 10
+
+
+def test_chunks_prefer_paragraph_boundaries():
+    paragraphs = [paragraph(f"p{i}") for i in range(8)]
+    per_paragraph = count_tokens(paragraphs[0], MODEL)
+    chunks = chunk_text("\n\n".join(paragraphs), MODEL, max_tokens=int(per_paragraph * 2.5), overlap=0)
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk.split("\n\n")[-1] in paragraphs
+
+
+def test_oversized_paragraph_still_splits():
+    text = paragraph("long", 40)
+    chunks = chunk_text(text, MODEL, max_tokens=50, overlap=0)
+    assert len(chunks) > 1
+    assert " ".join(chunks).split() == text.split()
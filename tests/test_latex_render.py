@@ -0,0 +1,81 @@
+import os
+import subprocess
+
+import pytest
+
+import latex_render
+from latex_render import LatexCompileError, render_pdf
+
+SOURCE = "\\documentclass{article}\n\\usepackage{amsmath}\n\\begin{document}\nHello\n\\end{document}\n"
+
+
+class FakeLatex:
+    """Stands in for run_latex: records calls and writes the files pdflatex would."""
+
+    def __init__(self, can_build_format=True, stale_format=False):
+        self.can_build_format = can_build_format
+        self.stale_format = stale_format
+        self.calls = []
+
+    def __call__(self, args, cwd, env=None):
+        self.calls.append(args)
+        jobname = args[-1][:-len(".tex")]
+        if "-ini" in args:
+            if self.can_build_format:
+                open(os.path.join(cwd, jobname + ".fmt"), "w").close()
+            return subprocess.CompletedProcess(args, 0 if self.can_build_format else 1)
+        with open(os.path.join(cwd, jobname + ".log"), "w") as f:
+            if any(a.startswith("-fmt=") for a in args) and self.stale_format:
+                f.write("Fatal format file error; I'm stymied\n")
+                return subprocess.CompletedProcess(args, 1)
+            f.write(f"({jobname}.tex)\nOutput written\n")
+        open(os.path.join(cwd, jobname + ".pdf"), "w").close()
+        return subprocess.CompletedProcess(args, 0)
+
+
+@pytest.fixture
+def fake_latex(tmp_path, monkeypatch):
+    monkeypatch.setattr(latex_render, "LATEX_FORMAT_DIR", str(tmp_path / "formats"))
+    monkeypatch.setattr(latex_render, "_formats", {})
+
+    def install(**kwargs):
+        fake = FakeLatex(**kwargs)
+        monkeypatch.setattr(latex_render, "run_latex", fake)
+        return fake
+    return install
+
+
+def test_precompiled_preamble_is_used(tmp_path, fake_latex):
+    fake = fake_latex()
+    render = render_pdf(SOURCE, "doc", str(tmp_path / "out"))
+    assert render["precompiled"] and render["passes"] == 1
+    assert fake.calls[-1][0].startswith("-fmt=preamble-")
+
+
+def test_falls_back_when_format_cannot_be_built(tmp_path, fake_latex):
+    # e.g. TeX Live without mylatexformat
+    fake = fake_latex(can_build_format=False)
+    render = render_pdf(SOURCE, "doc", str(tmp_path / "out"))
+    assert not render["precompiled"]
+    assert fake.calls[-1] == ["doc.tex"]
+    assert os.path.exists(render["pdf_path"])
+    # the failed build is remembered, not retried on every compile
+    render_pdf(SOURCE, "doc2", str(tmp_path / "out"))
+    assert sum("-ini" in args for args in fake.calls) == 1
+
+
+def test_stale_format_is_dropped_and_compile_retried(tmp_path, fake_latex):
+    fake = fake_latex(stale_format=True)
+    render = render_pdf(SOURCE, "doc", str(tmp_path / "out"))
+    assert not render["precompiled"]
+    assert fake.calls[-1] == ["doc.tex"]
+    assert not any(name.endswith(".fmt") for name in os.listdir(latex_render.LATEX_FORMAT_DIR))
+
+
+def test_missing_compiler_is_a_compile_error(tmp_path, monkeypatch):
+    monkeypatch.setattr(latex_render, "LATEX_FORMAT_DIR", str(tmp_path / "formats"))
+    monkeypatch.setattr(latex_render, "_formats", {})
+    monkeypatch.setattr(latex_render, "LATEX_COMPILER", "no-such-pdflatex")
+    with pytest.raises(LatexCompileError, match="Could not run no-such-pdflatex"):
+        render_pdf(SOURCE, "doc", str(tmp_path / "out"))
+    assert list(latex_render._formats.values()) == [None]
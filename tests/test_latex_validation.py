@@ -0,0 +1,48 @@
+import pytest
+
+from latex_validation import check_replacements, sanitize_latex, validate_latex
+
+
+def test_replacements_survive_sanitizing_and_validate():
+    assert check_replacements() == []
+
+
+@pytest.mark.parametrize("fragment", [
+    r"\section{Intro} $x \leq y$ and \textbf{bold}",
+    r"\begin{align} a &= b \\ c &= d \end{align}",
+    r"$\text{if $x_1$ holds}$",
+    r"\ensuremath{x_1} and $\mathbb{R}$",
+    r"\begin{itemize} \item one \end{itemize}",
+])
+def test_valid_fragments_pass(fragment):
+    assert validate_latex(fragment) == []
+
+
+@pytest.mark.parametrize("fragment, problem", [
+    (r"\foo{x}", "unknown command \\foo"),
+    (r"\url{a}", "unknown command \\url"),
+    (r"\href{a}{b}", "unknown command \\href"),
+    (r"\alpha", "\\alpha outside math"),
+    (r"$\section{x}$", "\\section inside math"),
+    (r"\newcommand{\x}{y}", "\\newcommand is not allowed in a section"),
+    (r"$x", "unclosed math ($)"),
+    (r"\begin{foo} x \end{foo}", "unknown environment foo"),
+])
+def test_invalid_fragments_are_reported(fragment, problem):
+    assert problem in validate_latex(fragment)
+
+
+def test_underscore_in_text_inside_math_is_escaped():
+    assert validate_latex(r"$\text{a_b}$")
+    assert sanitize_latex(r"$\text{a_b}$") == r"$\text{a\_b}$"
+    assert validate_latex(sanitize_latex(r"$\text{a_b}$")) == []
+
+
+def test_verbatim_is_left_alone():
+    text = "\\verb|a_b| and \\begin{verbatim}\n**x** #1\n\\end{verbatim}"
+    assert sanitize_latex(text) == text
+    assert validate_latex(text) == []
+
+
+def test_degree_sign_in_math():
+    assert sanitize_latex("$30°$") == r"$30\ensuremath{^\circ}$"
@@ -0,0 +1,193 @@
+import threading
+import time
+
+import pytest
+
+from llm_scheduler import WINDOW_SECONDS, DeadlineExceeded, RequestScheduler, current_tenant
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.advance(seconds)
+
+
+class RateLimited(Exception):
+    pass
+
+
+def make_scheduler(clock, **kwargs):
+    """A scheduler whose waits pass fake time instead of blocking (single-threaded tests)."""
+    scheduler = RequestScheduler(clock=clock, sleep=clock.sleep, **kwargs)
+    scheduler._wait = clock.advance
+    return scheduler
+
+
+def run_as(tenant, fn):
+    token = current_tenant.set(tenant)
+    try:
+        return fn()
+    finally:
+        current_tenant.reset(token)
+
+
+# ─── Fairness ─────────────────────────────────────────────────
+#
+# Waiters are real threads; the test moves the fake clock on one window at a
+# time and the scheduler's short real waits pick the change up.
+
+def start_waiter(scheduler, tenant, name, granted, deadline=1e9):
+    def wait():
+        try:
+            scheduler.acquire(1, tenant, deadline)
+            granted.append(name)
+        except DeadlineExceeded:
+            granted.append(f"{name} timed out")
+
+    thread = threading.Thread(target=wait, daemon=True)
+    queued = sum(len(q) for q in scheduler._waiting.values())
+    thread.start()
+    while sum(len(q) for q in scheduler._waiting.values()) == queued:
+        time.sleep(0.001)
+    return thread
+
+
+def next_window(clock, granted, expected_len):
+    clock.advance(WINDOW_SECONDS)
+    until = time.monotonic() + 5
+    while len(granted) < expected_len and time.monotonic() < until:
+        time.sleep(0.001)
+
+
+@pytest.fixture
+def threaded_scheduler():
+    clock = FakeClock()
+    scheduler = RequestScheduler(rpm=1, tpm=10**9, clock=clock)
+    scheduler._wait = lambda timeout: scheduler._cond.wait(0.005)
+    scheduler.acquire(1, "warmup", 1e9)  # the window is full until WINDOW_SECONDS
+    return clock, scheduler
+
+
+def test_tenants_take_turns(threaded_scheduler):
+    clock, scheduler = threaded_scheduler
+    granted = []
+    threads = [start_waiter(scheduler, "a", "a1", granted),
+               start_waiter(scheduler, "a", "a2", granted),
+               start_waiter(scheduler, "a", "a3", granted),
+               start_waiter(scheduler, "b", "b1", granted)]
+    for n in range(1, 5):
+        next_window(clock, granted, n)
+    for t in threads:
+        t.join(1)
+    assert granted == ["a1", "b1", "a2", "a3"]
+
+
+def test_turn_rotates_only_after_a_grant(threaded_scheduler):
+    clock, scheduler = threaded_scheduler
+    granted = []
+    threads = [start_waiter(scheduler, "a", "a1", granted, deadline=WINDOW_SECONDS / 2),
+               start_waiter(scheduler, "a", "a2", granted),
+               start_waiter(scheduler, "b", "b1", granted)]
+    clock.advance(WINDOW_SECONDS / 2)
+    until = time.monotonic() + 5
+    while not granted and time.monotonic() < until:
+        time.sleep(0.001)
+    assert granted == ["a1 timed out"]
+    # a's turn did not end with a grant, so a2 still goes before b1
+    next_window(clock, granted, 2)
+    next_window(clock, granted, 3)
+    for t in threads:
+        t.join(1)
+    assert granted == ["a1 timed out", "a2", "b1"]
+
+
+# ─── Rate Limits and Deadlines ────────────────────────────────
+
+def test_rate_limit_pauses_every_tenant():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+    calls = []
+    other_tenant = []
+
+    def fn(timeout):
+        calls.append(clock.now)
+        if len(calls) == 1:
+            raise RateLimited()
+        return "ok"
+
+    def sleep(seconds):
+        # while the first caller backs off, another tenant cannot get in either
+        with pytest.raises(DeadlineExceeded):
+            scheduler.acquire(1, "b", clock.now + seconds - 1)
+        other_tenant.append(clock.now)
+        clock.sleep(seconds - (clock.now - calls[0]))
+
+    scheduler.sleep = sleep
+    result = run_as("a", lambda: scheduler.call(
+        fn, 1, is_retryable=lambda e: True, retry_after=lambda e: 5.0,
+        is_rate_limit=lambda e: isinstance(e, RateLimited)))
+    assert result == "ok"
+    assert other_tenant == [4.0]
+    assert calls == [0.0, 5.0]
+
+
+def test_non_rate_limit_errors_back_off_alone():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+    attempts = []
+
+    def fn(timeout):
+        attempts.append(clock.now)
+        if len(attempts) < 3:
+            raise ConnectionError()
+        return "ok"
+
+    assert scheduler.call(fn, 1, is_retryable=lambda e: True, retry_after=lambda e: 2.0,
+                          is_rate_limit=lambda e: False) == "ok"
+    assert clock.sleeps == [2.0, 2.0]
+    assert scheduler._paused_until == 0.0
+
+
+def test_deadline_while_waiting_for_capacity():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, rpm=1)
+    assert scheduler.call(lambda timeout: "first", 1, is_retryable=lambda e: False) == "first"
+    with pytest.raises(DeadlineExceeded):
+        scheduler.call(lambda timeout: "second", 1, is_retryable=lambda e: False, deadline_seconds=30)
+    assert clock.now == 30.0
+    # the timed-out waiter left no trace behind
+    assert scheduler._waiting == {} and not scheduler._turns
+
+
+def test_retries_stop_at_the_deadline():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+    timeouts = []
+
+    def fn(timeout):
+        timeouts.append(timeout)
+        raise ConnectionError()
+
+    with pytest.raises(ConnectionError):
+        scheduler.call(fn, 1, is_retryable=lambda e: True, retry_after=lambda e: 4.0, deadline_seconds=10)
+    # attempts at 0, 4 and 8; the next would start past the deadline
+    assert timeouts == [10.0, 6.0, 2.0]
+
+
+def test_requests_over_the_token_budget_wait_for_the_window():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, tpm=100)
+    scheduler.acquire(80, "a", 1e9)
+    clock.advance(10)
+    scheduler.acquire(30, "b", 1e9)
+    assert clock.now == WINDOW_SECONDS
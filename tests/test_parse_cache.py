@@ -0,0 +1,27 @@
+import os
+import time
+
+import disk_cache
+import parse_cache
+from parse_cache import ParseCache
+
+
+def test_disk_tier_is_pruned_to_budget(tmp_path, monkeypatch):
+    monkeypatch.setattr(parse_cache, "PARSE_CACHE_DISK_MAX_BYTES", 100)
+    monkeypatch.setattr(disk_cache, "IN_USE_SECONDS", 0)
+    cache = ParseCache(disk_dir=str(tmp_path))
+    old = time.time() - 3600
+    for i in range(3):
+        cache.set(f"text:{i}", "x" * 40)
+        os.utime(cache._disk_path(f"text:{i}"), (old + i, old + i))
+    cache.set("text:new", "x" * 40)
+    assert sorted(os.listdir(tmp_path)) == ["text_2.json", "text_new.json"]
+
+
+def test_disk_hit_marks_entry_used(tmp_path, monkeypatch):
+    cache = ParseCache(disk_dir=str(tmp_path))
+    cache.set("text:a", ["page"])
+    path = cache._disk_path("text:a")
+    os.utime(path, (0, 0))
+    assert ParseCache(disk_dir=str(tmp_path)).get("text:a") == ["page"]
+    assert os.path.getmtime(path) > 0
@@ -0,0 +1,14 @@
+from pdf_extraction import stitch_sections
+
+
+def test_sections_keep_paragraph_breaks():
+    lines = [
+        (10, "Introduction", 14, False),
+        (30, "First paragraph starts", 10, False),
+        (42, "and continues here.", 10, False),
+        (70, "Second paragraph.", 10, False),
+        (82, "Still second.", 10, False),
+    ]
+    assert stitch_sections([lines]) == [
+        ("Introduction", "First paragraph starts and continues here.\n\nSecond paragraph. Still second."),
+    ]
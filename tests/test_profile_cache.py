@@ -0,0 +1,66 @@
+import profile_cache
+from profile_cache import ProfileCache
+
+
+def make_cache(tmp_path, monkeypatch, clock):
+    monkeypatch.setattr(profile_cache.time, "time", lambda: clock[0])
+    return ProfileCache(str(tmp_path / "profiles.sqlite3"), ttl_seconds=300)
+
+
+def test_cached_until_ttl(tmp_path, monkeypatch):
+    clock = [1000.0]
+    cache = make_cache(tmp_path, monkeypatch, clock)
+    cache.set("u1", {"credits": 5, "stripe_customer_id": "cus_1"})
+    clock[0] += 299
+    assert cache.get("u1") == {"credits": 5, "stripe_customer_id": "cus_1"}
+    clock[0] += 1
+    assert cache.get("u1") is None
+
+
+def test_update_applies_local_change(tmp_path, monkeypatch):
+    clock = [1000.0]
+    cache = make_cache(tmp_path, monkeypatch, clock)
+    cache.set("u1", {"credits": 5, "stripe_customer_id": None})
+    cache.update("u1", credits=4.5, stripe_customer_id="cus_1")
+    assert cache.get("u1") == {"credits": 4.5, "stripe_customer_id": "cus_1"}
+    cache.update("unknown", credits=1)
+    assert cache.get("unknown") is None
+
+
+def test_checkout_refetches_until_profile_changes(tmp_path, monkeypatch):
+    clock = [1000.0]
+    cache = make_cache(tmp_path, monkeypatch, clock)
+    cache.set("u1", {"credits": 5, "stripe_customer_id": "cus_1"})
+    cache.expect_change(user_id="u1", customer_id="cus_1")
+    clock[0] += 3
+    assert cache.get("u1") is None
+    # the webhook beat the credit write: the same profile keeps the entry pending
+    cache.set("u1", {"credits": 5, "stripe_customer_id": "cus_1"})
+    clock[0] += 1
+    assert cache.get("u1") is not None
+    clock[0] += 2
+    assert cache.get("u1") is None
+    cache.set("u1", {"credits": 15, "stripe_customer_id": "cus_1"})
+    clock[0] += 10
+    assert cache.get("u1") == {"credits": 15, "stripe_customer_id": "cus_1"}
+
+
+def test_subscription_event_marks_user_by_customer(tmp_path, monkeypatch):
+    clock = [1000.0]
+    cache = make_cache(tmp_path, monkeypatch, clock)
+    cache.set("u1", {"credits": 5, "stripe_customer_id": "cus_1"})
+    cache.set("u2", {"credits": 5, "stripe_customer_id": "cus_2"})
+    cache.expect_change(customer_id="cus_1")
+    clock[0] += 3
+    assert cache.get("u1") is None
+    assert cache.get("u2") is not None
+
+
+def test_pending_change_is_shared_across_instances(tmp_path, monkeypatch):
+    clock = [1000.0]
+    app = make_cache(tmp_path, monkeypatch, clock)
+    webhook = ProfileCache(app.path)
+    app.set("u1", {"credits": 5, "stripe_customer_id": "cus_1"})
+    webhook.expect_change(user_id="u1")
+    clock[0] += 3
+    assert app.get("u1") is None
@@ -0,0 +1,25 @@
+import threading
+import time
+
+from singletons import process_singleton
+
+
+def test_factory_runs_once_under_concurrent_first_calls():
+    calls = []
+
+    @process_singleton
+    def get_thing():
+        """Docstring is kept."""
+        calls.append(1)
+        time.sleep(0.01)
+        return object()
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(get_thing())) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert all(r is results[0] for r in results)
+    assert get_thing.__doc__ == "Docstring is kept."
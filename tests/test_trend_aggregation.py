@@ -0,0 +1,48 @@
+import pandas as pd
+
+from trend_aggregation import aggregate_trends, group_labels
+
+
+def paper(year, questions, section_instructions="", summary=""):
+    return {
+        "meta": {"year": year, "instructions_summary": summary},
+        "structure": {"sections": [{
+            "section_title": "Section A",
+            "instructions": section_instructions,
+            "questions": [
+                {"question_text": "", "topic_or_area": topic, "question_type": qtype, "marks": marks}
+                for topic, qtype, marks in questions
+            ],
+        }]},
+    }
+
+
+def test_group_labels_merges_spelling_variants():
+    labels = pd.Series(["Fourier Series", "fourier series", "Fourier series.", "Fourier Seires",
+                        "Series of Fourier", "Laplace Transforms", "laplace transform", "Green's functions"])
+    grouped = group_labels(labels)
+    assert set(grouped[:5]) == {"Fourier Series"}
+    assert set(grouped[5:7]) == {"Laplace Transforms"}
+    assert grouped[7] == "Green's functions"
+
+
+def test_group_labels_anchors_on_most_common_spelling():
+    grouped = group_labels(pd.Series(["integration", "Integration", "Integration", "intergration"]))
+    assert set(grouped) == {"Integration"}
+
+
+def test_group_labels_keeps_distinct_labels_apart():
+    labels = pd.Series(["Thermodynamics", "Electrostatics", "Quantum Tunnelling", "Quantum Entanglement",
+                        "Special Relativity", "General Relativity", ""])
+    assert group_labels(labels).tolist() == labels.tolist()
+
+
+def test_typical_instructions_come_from_section_instructions():
+    analyses = [
+        paper("2021", [("Optics", "calculation", "10")], "Answer ALL questions.", "Two hours."),
+        paper("2022", [("Optics", "calculation", "10")], "Answer all questions", "Two hours."),
+        paper("2023", [("Optics", "essay", "20")], "", "Answer any three questions."),
+    ]
+    trends = aggregate_trends(analyses)["overall_trends"]
+    assert trends["typical_instructions"] == ["Answer ALL questions.", "Answer any three questions."]
+    assert trends["average_marks_per_question"] == 13.3
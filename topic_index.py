@@ -0,0 +1,215 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import zlib
+from collections import Counter
+import numpy as np
+from disk_cache import prune_cache_dir, touch
+from singletons import process_singleton
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:  # fall back to hashed n-gram embeddings
+    SentenceTransformer = None
+
+# ─── Topic Index ───────────────────────────────────────────────
+#
+# Normalizes past paper topics by meaning rather than spelling. Each question's
+# topic_or_area and question_text are embedded and assigned to the nearest
+# topic cluster by cosine similarity, or start a new one. Clusters (unit-length
+# centroids plus label votes) are stored per course, keyed by the course code
+# or subject in the papers' extracted meta, so questions from new
+# papers are assigned incrementally and questions seen before keep their
+# cluster without being embedded again.
+#
+# Embeddings are computed locally: with sentence-transformers installed and
+# TOPIC_EMBEDDING_MODEL pointing at a downloaded model, that model is used;
+# otherwise a hashed word and character n-gram vector, which needs no model.
+# Indexes on disk are bounded by TOPIC_INDEX_MAX_BYTES and TOPIC_INDEX_MAX_AGE_SECONDS.
+
+TOPIC_INDEX_DIR = os.environ.get("TOPIC_INDEX_DIR", os.path.join(".cache", "topics"))
+TOPIC_INDEX_MAX_BYTES = int(os.environ.get("TOPIC_INDEX_MAX_BYTES", str(256 * 1024 * 1024)))
+TOPIC_INDEX_MAX_AGE_SECONDS = int(os.environ.get("TOPIC_INDEX_MAX_AGE_SECONDS", str(90 * 24 * 3600)))
+TOPIC_EMBEDDING_MODEL = os.environ.get("TOPIC_EMBEDDING_MODEL", "")
+# Minimum cosine similarity to join an existing cluster; each embedder has its own default
+TOPIC_CLUSTER_SIMILARITY = os.environ.get("TOPIC_CLUSTER_SIMILARITY", "")
+HASHED_EMBEDDING_DIM = 1024
+# How much more the topic label counts than the question text
+TOPIC_WEIGHT = 2.0
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+class HashedEmbedder:
+    """Bag of words and character trigrams hashed into a fixed-size unit vector."""
+
+    name = f"hashed-ngrams-{HASHED_EMBEDDING_DIM}"
+    similarity = 0.5
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        out = np.zeros((len(texts), HASHED_EMBEDDING_DIM), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = WORD_RE.findall(text.lower())
+            features = list(words)
+            for word in words:
+                padded = f" {word} "
+                features += [padded[i:i + 3] for i in range(len(padded) - 2)]
+            for feature in features:
+                out[row, zlib.crc32(feature.encode("utf-8")) % HASHED_EMBEDDING_DIM] += 1.0
+        return normalize_rows(out)
+
+
+class ModelEmbedder:
+    similarity = 0.7
+
+    def __init__(self, model: str):
+        self.name = f"model:{model}"
+        self._model = SentenceTransformer(model)
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        return normalize_rows(np.asarray(self._model.encode(texts), dtype=np.float32))
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+@process_singleton
+def get_embedder():
+    """The model is loaded once per process."""
+    if SentenceTransformer is not None and TOPIC_EMBEDDING_MODEL:
+        return ModelEmbedder(TOPIC_EMBEDDING_MODEL)
+    return HashedEmbedder()
+
+
+def question_key(topic: str, text: str) -> str:
+    return hashlib.sha256(f"{topic}\n{text}".encode("utf-8")).hexdigest()[:32]
+
+
+class TopicIndex:
+    """Topic clusters of one course, persisted as an .npy of centroids plus a JSON sidecar."""
+
+    def __init__(self, path: str, embedder):
+        self.path = path
+        self.embedder = embedder
+        self.centroids = np.zeros((0, 0), dtype=np.float32)
+        self.counts = []  # questions per cluster
+        self.votes = []  # Counter of topic spellings per cluster
+        self.seen = {}  # question_key -> cluster
+        self.similarity = float(TOPIC_CLUSTER_SIMILARITY or embedder.similarity)
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path + ".json", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta["embedder"] != self.embedder.name:
+                return  # vectors from another embedder are not comparable; start over
+            self.centroids = np.load(self.path + ".npy")
+            self.counts = meta["counts"]
+            self.votes = [Counter(v) for v in meta["votes"]]
+            self.seen = meta["seen"]
+            touch(self.path + ".json")
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + ".npy.tmp", "wb") as f:
+            np.save(f, self.centroids)
+        with open(self.path + ".json.tmp", "w", encoding="utf-8") as f:
+            json.dump({
+                "embedder": self.embedder.name,
+                "counts": self.counts,
+                "votes": [dict(v) for v in self.votes],
+                "seen": self.seen,
+            }, f, ensure_ascii=False)
+        os.replace(self.path + ".npy.tmp", self.path + ".npy")
+        os.replace(self.path + ".json.tmp", self.path + ".json")
+        prune_cache_dir(os.path.dirname(self.path), TOPIC_INDEX_MAX_BYTES, TOPIC_INDEX_MAX_AGE_SECONDS)
+
+    def label(self, cluster: int) -> str:
+        """The cluster's most common topic spelling ("" if it only has untitled questions)."""
+        votes = self.votes[cluster]
+        return votes.most_common(1)[0][0] if votes else ""
+
+    def assign(self, questions: list[tuple[str, str]]) -> list[str]:
+        """
+        Maps (topic_or_area, question_text) pairs to canonical topic labels,
+        adding unseen questions to the index and saving it.
+        """
+        with self._lock:
+            keys = [question_key(topic, text) for topic, text in questions]
+            new = [i for i, key in enumerate(keys) if key not in self.seen]
+            if new:
+                # Blank topics still get a cluster from their text, labelled by their neighbours
+                topics = self.embedder.encode([questions[i][0] for i in new])
+                texts = self.embedder.encode([questions[i][1] for i in new])
+                vectors = normalize_rows(TOPIC_WEIGHT * topics + texts)
+                if self.centroids.size == 0:
+                    self.centroids = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+                for i, vector in zip(new, vectors):
+                    self.seen[keys[i]] = self._add(vector, questions[i][0])
+                self.save()
+            return [self.label(self.seen[key]) or topic for key, (topic, _) in zip(keys, questions)]
+
+    def _add(self, vector: np.ndarray, topic: str) -> int:
+        if len(self.counts):
+            sims = self.centroids @ vector
+            best = int(np.argmax(sims))
+            if sims[best] >= self.similarity:
+                n = self.counts[best]
+                centroid = (self.centroids[best] * n + vector) / (n + 1)
+                self.centroids[best] = centroid / (np.linalg.norm(centroid) or 1.0)
+                self.counts[best] = n + 1
+                if topic:
+                    self.votes[best][topic] += 1
+                return best
+        self.centroids = np.vstack([self.centroids, vector[None, :]])
+        self.counts.append(1)
+        self.votes.append(Counter({topic: 1}) if topic else Counter())
+        return len(self.counts) - 1
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def paper_course(meta: dict) -> str:
+    """Course key for one analysis: "code:<course code>", else "subject:<subject>", else ""."""
+    code = normalize_course(meta.get("course_code", "")).replace(" ", "")
+    if code:
+        return f"code:{code}"
+    subject = normalize_course(meta.get("subject", ""))
+    return f"subject:{subject}" if subject else ""
+
+
+def normalize_course(text: str) -> str:
+    return " ".join(WORD_RE.findall((text or "").lower()))
+
+
+def course_for(analyses: list[dict], fallback: str) -> str:
+    """
+    The most common course key among the papers' extracted meta, or `fallback`
+    if none has one, so everyone uploading papers of a course shares its index.
+    """
+    courses = Counter(paper_course(a["meta"]) for a in analyses)
+    courses.pop("", None)
+    return courses.most_common(1)[0][0] if courses else fallback
+
+
+def course_key(course: str) -> str:
+    """Index file name for a course key such as course_for returns."""
+    return hashlib.sha256(course.encode("utf-8")).hexdigest()[:32]
+
+
+def get_topic_index(course: str) -> TopicIndex:
+    """Loaded indexes are kept for the life of the process."""
+    key = course_key(course)
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = TopicIndex(os.path.join(TOPIC_INDEX_DIR, key), get_embedder())
+        return _indexes[key]
@@ -0,0 +1,168 @@
+import re
+from collections import defaultdict
+from difflib import SequenceMatcher
+import pandas as pd
+
+# ─── Past Paper Trend Aggregation ──────────────────────────────
+#
+# Trend statistics are computed locally from the validated per-paper analyses
+# (see structured_output.PAPER_ANALYSIS_SCHEMA): one row per question, then
+# pandas group-bys for the frequencies and averages. Topic and question-type
+# labels are grouped so that spelling variants count as one ("Fourier Series",
+# "fourier series", "Fourier series." ...): labels with the same normal form
+# are merged directly, and the fuzzy match only compares labels that share a
+# word prefix, so grouping stays close to linear in the number of labels. Only
+# the prose advice is left to the model, and it is given these statistics
+# rather than the papers.
+
+# Labels whose normalized forms are at least this similar are treated as one
+TOPIC_SIMILARITY = 0.88
+TOP_TOPICS = 10
+TOP_INSTRUCTIONS = 5
+# Fuzzy matches are only looked for among labels sharing a word prefix this long
+LABEL_BUCKET_PREFIX = 3
+
+STOPWORDS = {"a", "an", "and", "the", "of", "in", "on", "for", "to", "with", "&"}
+LABEL_TOKEN_RE = re.compile(r"[a-z0-9]+")
+MARKS_RE = re.compile(r"\d+(?:\.\d+)?")
+
+
+def label_key(label: str) -> str:
+    """Order-insensitive normal form: lowercase words, no stopwords, crude singulars."""
+    words = []
+    for word in LABEL_TOKEN_RE.findall(label.lower()):
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.append(word)
+    return " ".join(sorted(words))
+
+
+def similar_keys(a: str, b: str) -> bool:
+    # the ratio cannot exceed 2 * shorter / total, so cheap bounds go first
+    if 2 * min(len(a), len(b)) < TOPIC_SIMILARITY * (len(a) + len(b)):
+        return False
+    matcher = SequenceMatcher(None, a, b)
+    return matcher.quick_ratio() >= TOPIC_SIMILARITY and matcher.ratio() >= TOPIC_SIMILARITY
+
+
+def group_labels(labels: pd.Series) -> pd.Series:
+    """
+    Maps each label to a canonical label for its group of near-duplicates.
+    The canonical label is the group's most common original spelling.
+    """
+    counts = labels[labels != ""].value_counts()
+    # most frequent labels first, so each group is anchored on its most common form
+    group_of_key = {}  # normal form -> canonical label
+    anchors = []  # (key, canonical label), in anchoring order
+    buckets = defaultdict(list)  # word prefix -> indexes into anchors
+    canonical = {}
+    for label in counts.index:
+        key = label_key(label)
+        if key not in group_of_key:
+            prefixes = {word[:LABEL_BUCKET_PREFIX] for word in key.split()}
+            candidates = sorted({i for prefix in prefixes for i in buckets[prefix]})
+            match = next((i for i in candidates if similar_keys(key, anchors[i][0])), None)
+            if match is not None:
+                group_of_key[key] = anchors[match][1]
+            else:
+                group_of_key[key] = label
+                for prefix in prefixes:
+                    buckets[prefix].append(len(anchors))
+                anchors.append((key, label))
+        canonical[label] = group_of_key[key]
+    return labels.map(lambda label: canonical.get(label, label))
+
+
+def parse_marks(marks: str) -> float | None:
+    m = MARKS_RE.search(marks or "")
+    return float(m.group()) if m else None
+
+
+def question_records(analyses: list[dict], topic_index=None) -> pd.DataFrame:
+    """
+    One row per question: paper, year, section, topic, question type and numeric marks.
+    Topics are grouped by `topic_index` (a topic_index.TopicIndex) when given, else by spelling.
+    """
+    rows = []
+    for paper, analysis in enumerate(analyses):
+        year = analysis["meta"]["year"].strip() or "unknown"
+        for section in analysis["structure"]["sections"]:
+            for q in section["questions"]:
+                rows.append({
+                    "paper": paper,
+                    "year": year,
+                    "section": section["section_title"].strip(),
+                    "topic": q["topic_or_area"].strip(),
+                    "text": q["question_text"].strip(),
+                    "question_type": q["question_type"].strip().lower(),
+                    "marks": parse_marks(q["marks"]),
+                })
+    df = pd.DataFrame(rows, columns=["paper", "year", "section", "topic", "text", "question_type", "marks"])
+    if topic_index is not None and len(df):
+        df["topic"] = topic_index.assign(list(zip(df["topic"], df["text"])))
+    else:
+        df["topic"] = group_labels(df["topic"])
+    df["question_type"] = group_labels(df["question_type"])
+    return df
+
+
+def instruction_records(analyses: list[dict]) -> pd.DataFrame:
+    """
+    One row per instruction a paper gives, from its sections' instructions; a
+    paper whose sections have none falls back to its meta instructions_summary.
+    Wording variants are grouped like labels, and each counts once per paper.
+    """
+    rows = []
+    for paper, analysis in enumerate(analyses):
+        texts = [s["instructions"].strip() for s in analysis["structure"]["sections"] if s["instructions"].strip()]
+        if not texts and analysis["meta"]["instructions_summary"].strip():
+            texts = [analysis["meta"]["instructions_summary"].strip()]
+        rows.extend({"paper": paper, "instruction": text} for text in texts)
+    df = pd.DataFrame(rows, columns=["paper", "instruction"])
+    df["instruction"] = group_labels(df["instruction"])
+    return df.drop_duplicates()
+
+
+def frequency_list(counts: pd.Series, name: str) -> list[dict]:
+    return [{name: label, "frequency": int(n)} for label, n in counts.items() if label != ""]
+
+
+def aggregate_trends(analyses: list[dict], topic_index=None) -> dict:
+    """
+    The statistical part of the trends report, in the same shape the trends
+    superprompt produced, plus real "question_type_frequencies".
+    """
+    df = question_records(analyses, topic_index)
+    papers = len(analyses)
+
+    topic_counts = df["topic"].value_counts()
+    qtype_counts = df["question_type"].value_counts()
+    marks = df["marks"].dropna()
+
+    frequencies_by_year = []
+    for year, year_df in df.groupby("year", sort=True):
+        frequencies_by_year.append({
+            "year": str(year),
+            "topics": frequency_list(year_df["topic"].value_counts(), "topic"),
+            "question_types": frequency_list(year_df["question_type"].value_counts(), "type"),
+        })
+
+    # Section titles that recur across papers, e.g. "Section A"
+    section_papers = df[df["section"] != ""].drop_duplicates(["paper", "section"])["section"].value_counts()
+    instruction_counts = instruction_records(analyses)["instruction"].value_counts()
+
+    return {
+        "overall_trends": {
+            "common_topics": [t for t in topic_counts.index[:TOP_TOPICS] if t],
+            "common_question_types": [t for t in qtype_counts.index if t],
+            "recurring_sections_or_parts": list(section_papers[section_papers > 1].index),
+            "typical_instructions": list(instruction_counts.index[:TOP_INSTRUCTIONS]),
+            "average_questions_per_paper": round(len(df) / papers, 1) if papers else 0,
+            "average_marks_per_question": round(float(marks.mean()), 1) if len(marks) else "unknown",
+        },
+        "topic_frequencies": frequency_list(topic_counts, "topic"),
+        "question_type_frequencies": frequency_list(qtype_counts, "type"),
+        "frequencies_by_year": frequencies_by_year,
+    }
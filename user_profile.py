@@ -0,0 +1,49 @@
+import os
+import streamlit as st
+from backend_clients import get_http_session
+from profile_cache import get_profile_cache
+
+# ─── Profile Cache ────────────────────────────────────────────
+#
+# Streamlit reruns every page script on each interaction, so the profile comes
+# from the shared profile cache (profile_cache) instead of the get-profile Edge
+# Function on every rerun. Changes made by this app (credit deductions, a new
+# Stripe customer ID) update the cached copy; Stripe purchases and subscription
+# changes are picked up through the webhook (stripe_billing.handle_stripe_event),
+# which marks the user's entry as changed. The TTL only bounds how long other
+# changes go unseen.
+
+SUPABASE_EDGE_FUNCTION_GET_PROFILE_URL = os.environ.get("SUPABASE_EDGE_FUNCTION_GET_PROFILE_URL")
+
+
+# Fetch the profile via Edge Function (uses JWT, respects RLS)
+def get_user_profile_via_edge_function(access_token: str):
+    headers = {
+        "Authorization": f"Bearer {access_token}"
+    }
+    try:
+        response = get_http_session().get(SUPABASE_EDGE_FUNCTION_GET_PROFILE_URL, headers=headers)
+        if response.status_code != 200:
+            st.error(f"Failed to fetch profile: {response.status_code} — {response.text}")
+            return None
+        return response.json()
+    except Exception as e:
+        st.error(f"Error calling get-profile Edge Function: {e}")
+        return None
+
+
+def get_profile(access_token: str, user_id: str) -> dict | None:
+    """The user's profile from the shared cache, fetched when missing, expired or changed on Stripe."""
+    cache = get_profile_cache()
+    profile = cache.get(user_id)
+    if profile is not None:
+        return profile
+    profile = get_user_profile_via_edge_function(access_token)
+    if profile:
+        cache.set(user_id, profile)
+    return profile
+
+
+def update_cached_profile(user_id: str, **fields):
+    """Applies a change this app has just made (e.g. the credits left after a deduction)."""
+    get_profile_cache().update(user_id, **fields)